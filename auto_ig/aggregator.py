@@ -0,0 +1,107 @@
+import numpy as np
+
+# length of each IG resolution in seconds
+RESOLUTION_SECONDS = {
+    "MINUTE": 60, "MINUTE_2": 120, "MINUTE_3": 180, "MINUTE_5": 300,
+    "MINUTE_10": 600, "MINUTE_15": 900, "MINUTE_30": 1800,
+    "HOUR": 3600, "HOUR_2": 7200, "HOUR_3": 10800, "HOUR_4": 14400,
+    "DAY": 86400
+}
+
+# order of the values in an OHLCV tuple
+OPEN_BID, OPEN_ASK, HIGH_BID, HIGH_ASK, LOW_BID, LOW_ASK, CLOSE_BID, CLOSE_ASK, VOLUME = range(9)
+
+
+def bucket_start(epoch, resolution):
+    """start of the resolution's period that epoch falls in"""
+    seconds = RESOLUTION_SECONDS[resolution]
+    return epoch - (epoch % seconds)
+
+
+def merge(first, second):
+    """combine two OHLCV tuples, first being the earlier one"""
+    if first is None:
+        return second
+    return (first[OPEN_BID], first[OPEN_ASK],
+            max(first[HIGH_BID], second[HIGH_BID]), max(first[HIGH_ASK], second[HIGH_ASK]),
+            min(first[LOW_BID], second[LOW_BID]), min(first[LOW_ASK], second[LOW_ASK]),
+            second[CLOSE_BID], second[CLOSE_ASK],
+            first[VOLUME] + second[VOLUME])
+
+
+class BarAggregator:
+    """Rolls a stream of source bars (eg. the MINUTE_5 chart feed) into a longer resolution
+
+    The source bar still forming gets revised on every tick, so the bars that are
+    already complete in the bucket are folded into one OHLCV and only the live
+    one is kept separately - each update is O(1) whatever the bucket length.
+    Everything runs off the source bar times so replaying a feed gives the same bars.
+    """
+
+    def __init__(self, resolution, source="MINUTE_5"):
+        if RESOLUTION_SECONDS[resolution] <= RESOLUTION_SECONDS[source]:
+            raise ValueError("can't build {} from {}".format(resolution, source))
+        self.resolution = resolution
+        self.source = source
+        self.bucket = None
+        self.closed = None
+        self.live = None
+        self.live_epoch = None
+
+    def seed(self, series, epoch):
+        """fold in source bars already held for the bucket epoch falls in (eg. after a restart)"""
+        bucket = bucket_start(epoch, self.resolution)
+        self.bucket = bucket
+        self.closed = None
+        self.live = None
+        self.live_epoch = None
+        if series is None or len(series) == 0:
+            return
+        times = series.times()
+        mask = (times >= bucket) & (times < epoch)
+        if not mask.any():
+            return
+        opens = np.flatnonzero(mask)
+        first, last = opens[0], opens[-1]
+        self.closed = (series.column('openPrice', 'bid')[first], series.column('openPrice', 'ask')[first],
+                       np.nanmax(series.column('highPrice', 'bid')[mask]), np.nanmax(series.column('highPrice', 'ask')[mask]),
+                       np.nanmin(series.column('lowPrice', 'bid')[mask]), np.nanmin(series.column('lowPrice', 'ask')[mask]),
+                       series.column('closePrice', 'bid')[last], series.column('closePrice', 'ask')[last],
+                       np.nansum(series.column('lastTradedVolume')[mask]))
+        self.closed = tuple(float(x) for x in self.closed)
+
+    def current(self):
+        """OHLCV of the bucket so far"""
+        if self.live is None:
+            return self.closed
+        return merge(self.closed, self.live)
+
+    def update(self, epoch, values):
+        """take the latest values of the source bar starting at epoch
+        returns (finished, current) - finished is the (bucket, OHLCV) of the period
+        that just ended or None, current is the (bucket, OHLCV) still forming, or
+        None when the update was stale and nothing changed"""
+        finished = None
+        bucket = bucket_start(epoch, self.resolution)
+        if self.bucket is None:
+            self.bucket = bucket
+
+        if bucket < self.bucket or (bucket == self.bucket and self.live_epoch is not None and epoch < self.live_epoch):
+            # stale update from before what we've already built, nothing to do
+            return None, None
+
+        if bucket != self.bucket:
+            if self.current() is not None:
+                finished = (self.bucket, self.current())
+            self.bucket = bucket
+            self.closed = None
+            self.live = None
+            self.live_epoch = None
+        elif self.live_epoch is not None and epoch != self.live_epoch:
+            # the previous source bar is complete
+            self.closed = merge(self.closed, self.live)
+
+        self.live = tuple(values)
+        self.live_epoch = epoch
+
+        return finished, (self.bucket, self.current())
@@ -1,12 +1,11 @@
 import logging
-import time
 import datetime
 import math
 import json
 import operator
 import sys
-import requests
-from functools import reduce
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pytz import timezone
 
 import os
@@ -14,8 +13,15 @@ import os
 from Cryptodome.Cipher import AES
 
 from .lightstreamer import LSClient, Subscription
-from .market import Market
-from .trade import Trade
+from .engine import Engine
+from .market import Market, CHART_FIELDS, CHART_PARSERS
+from .ticks import TickDispatcher, TICK_FIELDS, TICK_PARSERS
+from .cache import IndicatorCache
+from .rest import IGClient
+from .trade import Trade, TradeRegistry, TradeState
+from .orders import OrderDesk
+from .journal import TradeJournal
+from .snapshot import StateSnapshot, SNAPSHOT_INTERVAL
 from .strategy import *
 
 
@@ -32,6 +38,9 @@ ch.setFormatter(formatter)
 logger.addHandler(fh)
 logger.addHandler(ch)
 
+# resolutions backfilled over REST and how many bars of each, in the order they're applied
+BACKFILL = [("DAY",30), ("MINUTE_5",110), ("MINUTE_30",110), ("HOUR",110), ("HOUR_4",110)]
+
 
 class AutoIG:
     """Handles authentication and coordination of IG"""
@@ -39,36 +48,66 @@ class AutoIG:
     def __init__(self):
         self.authenticated_headers = {}
         self.markets = {}
-        self.trades = []
+        self.trades = TradeRegistry()
         self.max_concurrent_trades = 100
         self.lightstream = {}
         self.key = ""
         self.is_open = True
-        self.api_calls = 0
-        self.strategy = {}
-        self.strategy['macd'] = macd()
-        self.strategy['stoch_alt'] = stoch_alt()
-        # self.strategy['fast_trending'] = fast_trending()
+        # price history fetches in flight at once
+        self.backfill_workers = 8
+        # pooled keep-alive connection for all the REST calls, rate limited to
+        # the IG allowances - see rest.py and ratelimit.py
+        self.http = IGClient(self.authenticate, self.expire_session)
+        # indicator results shared between strategies, see cache.py
+        self.indicator_cache = IndicatorCache()
+        # runs process on a schedule once started, see engine.py
+        self.engine = None
+        # also stream every tick and check open trades' stops on them, see ticks.py
+        self.tick_feed = True
+        self.tick_dispatcher = TickDispatcher()
+        # opens and closes trades off the streaming thread, see orders.py
+        self.orders = OrderDesk(self)
+        # trade status lines and snapshots, written behind on their own thread - see journal.py
+        self.journal = TradeJournal()
+        # markets, signals and live trades saved every snapshot_interval seconds
+        # by the engine and picked up again on the first process - see snapshot.py
+        self.snapshot = StateSnapshot()
+        self.snapshot_interval = SNAPSHOT_INTERVAL
+        self.restored = False
+        # deal ids IG has open - from the last GET /positions, kept current by the TRADE stream
+        self.positions = None
+        self.last_trade_events = [None, None, None]
+        self.strategy = self.default_strategies()
+
+    @staticmethod
+    def default_strategies(params=None):
+        """a new instance of each strategy that's traded, by name
+        params is {name: constructor kwargs} for any that aren't to have their defaults"""
+        params = params or {}
+        strategy = {}
+        strategy['macd'] = macd(**params.get('macd', {}))
+        strategy['stoch_alt'] = stoch_alt(**params.get('stoch_alt', {}))
+        # strategy['fast_trending'] = fast_trending()
         
-        # self.strategy['stoch'] = stoch()
-        # self.strategy['linreg'] = linreg()
+        # strategy['stoch'] = stoch()
+        # strategy['linreg'] = linreg()
         
-        # self.strategy['simple'] = simple()
-        # self.strategy['volume_dir'] = volume_dir()
-        # self.strategy['wma_cross'] = wma_cross(10,25,50,14)
-        # self.strategy['mfi_super'] = mfi_super(14,9,5)
+        # strategy['simple'] = simple()
+        # strategy['volume_dir'] = volume_dir()
+        # strategy['wma_cross'] = wma_cross(10,25,50,14)
+        # strategy['mfi_super'] = mfi_super(14,9,5)
         
-        # self.strategy['obv_psar'] = obv_psar(14,7)
-        # self.strategy['mfi_alt'] = mfi_alt(14,12,12,9)
+        # strategy['obv_psar'] = obv_psar(14,7)
+        # strategy['mfi_alt'] = mfi_alt(14,12,12,9)
         
-        # self.strategy['obv'] = obv()
+        # strategy['obv'] = obv()
+        return strategy
 
     def make_trade(self, size, market, prediction, json_data = None):
         """Make a new trade"""
         logger.info("making a trade")
         t = Trade(size, market,prediction, json_data)
-        self.trades.append(t)
-        return t
+        return self.trades.add(t)
 
 
     def fill_signals(self):
@@ -82,15 +121,57 @@ class AutoIG:
         
         signals = {}
         for k,s in self.strategy.items():
-            signals[k] = sorted(s.signals, key=operator.attrgetter('timestamp'),reverse=True)
+            signals[k] = s.signals.newest()
         
         return signals
 
 
-    def process(self,epic_ids):
-        """Do the process"""
+    def now(self):
+        """the time on the GB clock IG's bars are on, naive - a backtest keeps its own"""
+        return datetime.datetime.now(timezone('GB')).replace(tzinfo=None)
+
+    def start_engine(self, epic_ids, refresh=60, reconcile=900):
+        """start processing on the engine thread, if it isn't already"""
+        if self.engine is None:
+            self.engine = Engine(self, epic_ids, refresh, reconcile)
+        if not self.engine.running:
+            self.engine.start()
+            self.engine.schedule("snapshot", self.save_snapshot, delay=self.snapshot_interval, interval=self.snapshot_interval)
+        return self.engine
+
+    def save_snapshot(self):
+        return "{} markets saved".format(self.snapshot.save(self))
+
+    def restore_snapshot(self):
+        """load the last snapshot, and the signals in it - the markets come out of it in update_markets"""
+        self.restored = True
+        if not self.snapshot.load():
+            return False
+        for name, signals in self.snapshot.take_signals().items():
+            if name in self.strategy:
+                self.strategy[name].signals = signals
+        return True
+
+    def restore_trades(self):
+        """make the live trades from the snapshot, with anything journaled since - once their markets are in"""
+        for json_trade in self.snapshot.take_trades():
+            name = json_trade['created_time'].replace(":", "-") + "---" + json_trade['market'] + ".json"
+            # it's since been closed or failed if it's not in trades/open
+            if json_trade['market'] not in self.markets or not os.path.isfile(os.path.join("trades/open", name)):
+                continue
+            if self.trades.by_file(name) is None:
+                self.make_trade(json_trade['size_value'],self.markets[json_trade['market']],json_trade['prediction'],self.journal.recover(name, json_trade))
+
+    def on_bar_close(self, market, resolution):
+        """called from the streaming thread once a market's bar has closed and its signals are in"""
+        if self.engine is not None and self.engine.running:
+            self.engine.post("evaluate " + market.epic, self.insta_trade, market)
+
+    def process(self,epic_ids,reconcile=None):
+        """Do the process
+        reconcile checks every open trade against IG, by default on the quarter hour"""
         try:
-            timenow = datetime.datetime.now(timezone('GB')).replace(tzinfo=None)
+            timenow = self.now()
 
             if timenow.weekday() == 5:
                 return False, "We don't play on weekends"
@@ -120,7 +201,11 @@ class AutoIG:
 
             
 
+            if not self.restored:
+                self.restore_snapshot()
+
             self.update_markets(epic_ids)
+            self.restore_trades()
 
 
             # first - are there any saved trades?
@@ -128,79 +213,51 @@ class AutoIG:
                 path = "trades/open"
                 trades_on_file = [name for name in os.listdir(path) if name.endswith(".json")]
                 logger.info("number of trades found: {}, trades in memory: {}".format(len(trades_on_file),len(self.trades)))
-                if len(self.trades)<len(trades_on_file):
-                    logger.info("trades on file disparity")
-                    for name in trades_on_file:
-                        fh = open(os.path.join(path,name),"r")
-                        json_trade = json.load(fh)
-                        logger.info("loaded file: " + name)
-                        if json_trade['market'] in self.markets:
-                            self.make_trade(json_trade['size_value'],self.markets[json_trade['market']],json_trade['prediction'],json_trade)
-                elif len(self.trades)>len(trades_on_file):
-                    # try to clean up trades list
-                    logger.info("trying to clean up trades list")
-                    set_trades = {}
-                    for t in self.trades:
-                        set_trades[t.deal_id] = t
-
-                    self.trades  = list(set_trades.values())
-                                
+                # load the files we don't already have a trade for - by file name or deal id
+                for name in [x for x in trades_on_file if self.trades.by_file(x) is None]:
+                    with open(os.path.join(path,name),"r") as fh:
+                        json_trade = self.journal.recover(name, json.load(fh))
+                    if self.trades.by_deal(json_trade['deal_id']) is not None:
+                        continue
+                    logger.info("loaded file: " + name)
+                    if json_trade['market'] in self.markets:
+                        self.make_trade(json_trade['size_value'],self.markets[json_trade['market']],json_trade['prediction'],json_trade)
 
             except Exception as e:
                 logger.error(e)
             
+            if self.positions is None:
+                self.refresh_positions()
+
             open_lightstreamer = False
 
             mins_now = timenow.strftime("%M")
       
             if timenow.weekday() < 4 or (timenow.weekday() == 4 and timenow.time() < datetime.time(22,29)):
-                if mins_now in ["00","15","30","45"]:
-                    clean = True
-                    
-                    for t in [x for x in self.trades if x.deal_id is not "PENDING"]:
-                        
-                            
-                        base_url = self.api_url + '/positions/'+ t.deal_id
-                        auth_r = requests.get(base_url, headers=self.authenticate())
-                        if int(auth_r.status_code) == 400 or int(auth_r.status_code) == 404:
-                            logger.warning("WARNING - AN UNCLEARED TRADE WAS FOUND {} {} {}".format(t.market.epic,t.deal_id,t.prediction['direction_to_trade']))
-                            t.log_status("15 min trade clean error found - Can't find trade - closed in IG?")
-                            t.state = 3
-                            clean = False
-
-                    if not clean:
+                if reconcile is None:
+                    reconcile = mins_now in ["00","15","30","45"]
+                if reconcile:
+                    if not self.check_open_trades():
                         logger.warning("TRADE CLEARING ERRORS FOUND - RE-OPENING LIGHTSTREAMER")
                         open_lightstreamer = True
             
             epic_list = []
+            jobs = []
             for m in self.markets.values():
                 # if state has changed force an update to the lightstream obj
                 if m.market_status!=m.last_status:
                     open_lightstreamer = True
 
-                if m.market_status == "TRADEABLE" and self.api_calls<50:
-                    if m.get_update_cost("DAY",30)>0:
-                        open_lightstreamer = True 
-                        m.update_prices("DAY",30)
-
-                    if m.get_update_cost("MINUTE_5",110)>0:
-                        open_lightstreamer = True
-                        m.update_prices("MINUTE_5",110)
-                    
-                    if m.get_update_cost("MINUTE_30",110)>0:
-                        open_lightstreamer = True
-                        m.update_prices("MINUTE_30",110)
-
-                    if m.get_update_cost("HOUR",110)>0:
-                        open_lightstreamer = True
-                        m.update_prices("HOUR",110)
-                    
-                    if m.get_update_cost("HOUR_4",110)>0:
-                        open_lightstreamer = True
-                        m.update_prices("HOUR_4",110)
+                if m.market_status == "TRADEABLE":
+                    for res, count in BACKFILL:
+                        cost = m.get_update_cost(res,count)
+                        if cost>0:
+                            open_lightstreamer = True
+                            jobs.append((m,res,cost))
                     
                     epic_list.append(m.epic)
-                
+
+            self.backfill(jobs)
             
 
             # let's process our markets and look for signals then
@@ -209,7 +266,7 @@ class AutoIG:
                 self.insta_trade(market)
                 
                 
-            if not isinstance(self.lightstream, LSClient):
+            if not isinstance(self.lightstream, LSClient) or not self.lightstream.connected:
                 open_lightstreamer = True
 
             # either no lightstreamer object was found, or the epics have changed
@@ -218,9 +275,12 @@ class AutoIG:
                 # epic_list = self.markets.keys()
                 if len(epic_list)==0:
                     return False, "No epics to open lightstream with, weird huh"
-                if isinstance(self.lightstream, LSClient):
+                if isinstance(self.lightstream, LSClient) and self.lightstream.connected:
                     self.lightstream.unsubscribe_all()
                 else:
+                    if isinstance(self.lightstream, LSClient):
+                        # its session ended with an error, most likely stale tokens
+                        self.lightstream.disconnect()
                     try:
                         headers = self.authenticate()
                         password = "CST-" + str(headers['CST']) + "|XST-" + str(headers['X-SECURITY-TOKEN'])
@@ -245,12 +305,23 @@ class AutoIG:
                 
                 epic_ids_time = ["CHART:" + s + ":5MINUTE" for s in epic_list]
                 logger.info(epic_ids_time)
-                live_charts = Subscription(mode="MERGE", items=epic_ids_time, fields="LTV,UTM,DAY_HIGH,DAY_LOW,OFR_OPEN,OFR_HIGH,OFR_LOW,OFR_CLOSE,BID_OPEN,BID_HIGH,BID_LOW,BID_CLOSE,CONS_END,CONS_TICK_COUNT".split(","),adapter="DEFAULT")
-                live_charts.addlistener(self.live_update)
-                self.live_charts_key = self.lightstream.subscribe(live_charts)
-
+                live_charts = Subscription(mode="MERGE", items=epic_ids_time, fields=CHART_FIELDS, adapter="DEFAULT",
+                                           targets=[self.markets[s] for s in epic_list], parsers=CHART_PARSERS)
+                live_charts.add_record_listener(self.live_update)
+                subscriptions = [live_charts]
+                if self.tick_feed:
+                    live_ticks = Subscription(mode="DISTINCT", items=["CHART:" + s + ":TICK" for s in epic_list], fields=TICK_FIELDS, adapter="DEFAULT",
+                                              targets=[self.markets[s] for s in epic_list], parsers=TICK_PARSERS)
+                    live_ticks.add_record_listener(self.tick_dispatcher.on_tick)
+                    subscriptions.append(live_ticks)
+                # the stream only has what happens from now on - start from a fresh snapshot
+                self.refresh_positions()
+                trade_events = Subscription(mode="DISTINCT", items=["TRADE:" + self.account_id()], fields=["CONFIRMS","OPU","WOU"],
+                                            parsers={"CONFIRMS":json.loads, "OPU":json.loads, "WOU":json.loads})
+                trade_events.add_record_listener(self.trade_update)
+                subscriptions.append(trade_events)
+                self.live_charts_key = self.lightstream.subscribe_all(subscriptions)[0]
 
-            self.api_calls=0
         
         except Exception as e:
             exc_type, exc_obj, exc_tb = sys.exc_info()
@@ -264,57 +335,152 @@ class AutoIG:
 
         return True, "hello"
 
+    def check_open_trades(self):
+        """compare the open trades with IG's positions, closing the ones it doesn't have - False if there were any"""
+        positions = self.refresh_positions()
+        if positions is None:
+            return True
+        clean = True
+        for t in self.trades.in_state(TradeState.OPEN):
+            if t.deal_id not in positions:
+                logger.warning("WARNING - AN UNCLEARED TRADE WAS FOUND {} {} {}".format(t.market.epic,t.deal_id,t.prediction['direction_to_trade']))
+                t.log_status("15 min trade clean error found - Can't find trade - closed in IG?")
+                t.state = TradeState.CLOSED
+                clean = False
+        return clean
+
+    def refresh_positions(self):
+        """every open position in one GET, returns the set of their deal ids (None if it failed)"""
+        auth_r = self.http.get(self.api_url + '/positions', headers={'Version':'2'})
+        if not auth_r.ok:
+            logger.info("couldn't get positions: {} {}".format(auth_r.status_code, auth_r.text))
+            return None
+        self.positions = set(p['position']['dealId'] for p in json.loads(auth_r.text)['positions'])
+        return self.positions
+
+    def position_open(self, deal_id):
+        """whether IG still has deal_id open, as far as we know"""
+        if self.positions is None:
+            return True
+        return deal_id in self.positions
+
+    def account_id(self):
+        return self.account.get('accountId') or self.account.get('currentAccountId')
+
+    def trade_update(self, target, record):
+        """a TRADE:<account> update - deal confirmations and open position updates"""
+        confirm, opu, wou = record
+        # a slot only holds a new object when the update carried that field
+        if confirm and confirm is not self.last_trade_events[0]:
+            self.orders.on_confirm(confirm)
+        if opu and opu is not self.last_trade_events[1]:
+            self.position_update(opu)
+        self.last_trade_events = [confirm, opu, wou]
+
+    def position_update(self, opu):
+        deal_id = opu.get('dealId')
+        if opu.get('status') == "DELETED":
+            if self.positions is not None:
+                self.positions.discard(deal_id)
+            t = self.trades.by_deal(deal_id)
+            if t is not None and t.state == TradeState.OPEN:
+                t.log_status("Position closed in IG at {}".format(opu.get('level')))
+                t.closed_time = self.now()
+                t.state = TradeState.CLOSED
+                t.save_trade()
+        elif self.positions is not None:
+            self.positions.add(deal_id)
+
+    def backfill(self, jobs):
+        """fetch price history for a list of (market, resolution, count) in parallel
+        once all of a market's fetches are back they're applied (and its strategies
+        run) in the order of jobs, market by market, so the signals come out the
+        same as doing it serially
+        only as many fetches go as the rate limiter has room for, the rest are
+        still due next time round"""
+        capacity = self.http.limiter.backfill_capacity()
+        allowed = []
+        for m, res, count in jobs:
+            if len(allowed) == capacity or not self.http.limiter.reserve_history(count):
+                break
+            allowed.append((m, res, count))
+        if len(allowed) < len(jobs):
+            logger.info("backfill: deferring {} of {} fetches - {}".format(len(jobs) - len(allowed), len(jobs), self.http.limiter.stats()))
+        jobs = allowed
+        if len(jobs) == 0:
+            return
+
+        with ThreadPoolExecutor(max_workers=self.backfill_workers) as pool:
+            by_market = OrderedDict()
+            for m, res, count in jobs:
+                by_market.setdefault(m, []).append((res, count, pool.submit(m.fetch_prices, res, count)))
+
+            for m, fetches in by_market.items():
+                responses = []
+                for res, count, fetch in fetches:
+                    try:
+                        responses.append(fetch.result())
+                    except Exception as e:
+                        logger.info("{} {} price fetch failed: {}".format(m.epic, res, e))
+                        responses.append(None)
+                for (res, count, fetch), response in zip(fetches, responses):
+                    m.apply_prices(res, count, response)
+
     def insta_trade(self,market):
-        for strategy in market.strategies.values():
+        with market.lock:
+            for strategy in market.strategies.values():
             
-            signals = [x for x in strategy.signals if x.score>1 and x.unused and x.market==market.epic]
-            for signal in signals:
-                current_trades = [x for x in self.trades if x.market==market]
-                if len(current_trades)==0:
-                    if signal.score > 2:
-                        if market.spread < 4:
-                            if len(self.trades)<self.max_concurrent_trades:
-                                round_val = 500.0
-                                base = 1000.0
-                                trade_size = max(0.5,(round_val*math.floor((float(self.account['balance']['balance'])/round_val))-500)/base)
-                                logger.info("proposed bet size: {}".format(trade_size))
-
-                                signal.unused = False
-                                prediction = strategy.prediction(signal,market,signal.resolution)
-                                self.make_trade(1,market,prediction)
-                                signal.score = 1
+                signals = [x for x in strategy.signals.for_epic(market.epic) if x.score>1 and x.unused]
+                for signal in signals:
+                    current_trades = self.trades.for_epic(market.epic)
+                    if len(current_trades)==0:
+                        if signal.score > 2:
+                            if market.spread < 4:
+                                if len(self.trades)<self.max_concurrent_trades:
+                                    round_val = 500.0
+                                    base = 1000.0
+                                    trade_size = max(0.5,(round_val*math.floor((float(self.account['balance']['balance'])/round_val))-500)/base)
+                                    logger.info("proposed bet size: {}".format(trade_size))
+
+                                    signal.unused = False
+                                    prediction = strategy.prediction(signal,market,signal.resolution)
+                                    self.make_trade(1,market,prediction)
+                                    signal.score = 1
+                                else:
+                                    logger.info("Can't open any more trades already maxed out")
                             else:
-                                logger.info("Can't open any more trades already maxed out")
-                        else:
-                            logger.info("{} : market spread too wide!".format(market.epic))
-                else:
-                    logger.info("{} trade already open on this market".format(market.epic))
-                    for t in current_trades:
-                        if signal.position == t.prediction['direction_to_trade']:
+                                logger.info("{} : market spread too wide!".format(market.epic))
+                    else:
+                        logger.info("{} trade already open on this market".format(market.epic))
+                        for t in current_trades:
+                            if signal.position == t.prediction['direction_to_trade']:
     
-                            t.log_status("{} signal reenforced {} - {} - {}".format(market.epic,signal.position, signal.name, signal.timestamp))
-                            signal.unused = False
-                            signal.score-=1
+                                t.log_status("{} signal reenforced {} - {} - {}".format(market.epic,signal.position, signal.name, signal.timestamp))
+                                signal.unused = False
+                                signal.score-=1
                             
-                        else:
+                            else:
                             
-                            # t.assess_close(signal)
-                            strategy.assess_close(signal,t)
+                                # t.assess_close(signal)
+                                strategy.assess_close(signal,t)
                             
-                            signal.score-=1
-                            if signal.score > 2:
-                                signal.unused = True
-
-    def live_update(self,data):
-        # get the epic
-        epic = data['name'].split(":")[1]
-        if epic in self.markets:
-            self.markets[epic].set_latest_price(data['values'])
-            market_trades = [x for x in self.trades if x.market.epic==epic]
-            
-            for t in market_trades:
-                if not t.update():
-                    self.trades.remove(t)
+                                signal.score-=1
+                                if signal.score > 2:
+                                    signal.unused = True
+
+    def live_update(self,market,record):
+        """a CHART update for market, see Market.set_latest_price"""
+        if market is not None:
+            with market.lock:
+                market.set_latest_price(record)
+                market_trades = self.trades.for_epic(market.epic)
+
+                for t in market_trades:
+                    if not t.update():
+                        self.trades.remove(t)
+                        self.tick_dispatcher.unwatch(t)
+                    else:
+                        self.tick_dispatcher.watch(t)
 
 
     def update_markets(self, epic_ids):
@@ -323,14 +489,14 @@ class AutoIG:
             for chunk in list(self.chunks(epic_ids,50)):
 
                 base_url = self.api_url + '/markets?epics=' + ','.join(chunk)
-                auth_r = requests.get(base_url, headers=self.authenticate())
+                auth_r = self.http.get(base_url)
                 if auth_r.ok:
                     res = json.loads(auth_r.text)
                     epics_data = res["marketDetails"]
                     for epic in epics_data:
                         epic_id = epic['instrument']['epic']
                         if not epic_id in self.markets:
-                            m = Market(epic_id,self,epic)
+                            m = Market(epic_id,self,epic,self.snapshot.take_market(epic_id))
                             for s in self.strategy.values():
                                 m.add_strategy(s)
                             self.markets[epic_id] = m 
@@ -352,14 +518,18 @@ class AutoIG:
             pass
 
     def backtest(self, epic, start_date, end_date):
-        """do a backtest - probs should have done this a while ago..."""
-        pass
+        """replay epic's stored bars between the dates through new instances of the strategies, see backtest.py
+        - not quiet, hushing it would silence the live threads too"""
+        from .backtest import Backtest
+        market = self.markets.get(epic)
+        market_data = {epic: market.market_data} if market is not None and market.market_data else None
+        return Backtest([epic], start_date, end_date, market_data=market_data).run()
 
 
     def get_history(self):
         base_url = self.api_url + "/history/transactions/ALL/100000000000000"
         
-        auth_r = requests.get(base_url, headers=self.authenticate())
+        auth_r = self.http.get(base_url)
 
         history = json.loads(auth_r.text)
 
@@ -385,6 +555,15 @@ class AutoIG:
             self.api_user = settings['demo_api_user']
             self.api_pass = settings['demo_api_pass']
 
+        self.http.configure(settings.get('http_pool_size'), settings.get('http_timeout'))
+        self.backfill_workers = int(settings.get('backfill_workers', self.backfill_workers))
+        self.tick_feed = bool(settings.get('tick_feed', self.tick_feed))
+        self.snapshot_interval = int(settings.get('snapshot_interval', self.snapshot_interval))
+        if 'strategy_params' in settings and not self.markets:
+            # eg. the best of a parameter sweep, see sweep.py
+            self.strategy = self.default_strategies(settings['strategy_params'])
+        self.http.limiter.configure(**settings.get('rate_limits', {}))
+
         logger.info(self.api_url)
         logger.info(self.api_key)
         logger.info(self.api_user)
@@ -395,7 +574,7 @@ class AutoIG:
         base_url = self.api_url + "/accounts"
         try:
             logger.info("logging in...")
-            auth_r = requests.get(base_url, headers=self.authenticate())
+            auth_r = self.http.get(base_url)
             d = json.loads(auth_r.text)
 
             for i in d['accounts']:
@@ -407,7 +586,7 @@ class AutoIG:
             base_url = self.api_url + "/session"
             data = {"accountId":spreadbet_acc_id,"defaultAccount": "True"}
             logger.info("making sure right account selected...")
-            auth_r = requests.put(base_url, data=json.dumps(data), headers=self.authenticate())
+            auth_r = self.http.put(base_url, data=json.dumps(data))
 
 
             return True
@@ -416,10 +595,14 @@ class AutoIG:
             logger.info(err)
             return False
 
+    def expire_session(self):
+        """forget the session tokens, the next call to authenticate logs in again"""
+        logger.info("session tokens rejected, clearing headers")
+        self.authenticated_headers = {}
+
     def authenticate(self):
         """Authenticate with IG"""
         if 'CST' in self.authenticated_headers:
-            self.api_calls +=1
             return self.authenticated_headers
         else:
             logger.info("generating new headers")
@@ -433,7 +616,7 @@ class AutoIG:
             # logger.info(base_url)
             # rep = requests.get(REAL_OR_NO_REAL + "/session",data=json.dumps(data),headers=headers)
 
-            rep = requests.post(base_url,data=json.dumps(data), headers=headers)
+            rep = self.http.post(base_url,data=json.dumps(data), headers=headers, authenticated=False)
 
             if rep.status_code == 200:
 
@@ -450,7 +633,6 @@ class AutoIG:
                 
                 self.authenticated_headers = headers
 
-                self.api_calls +=1
                 return self.authenticated_headers
             else:
                 logger.info("auth failed: " + str(rep.status_code) + " " + rep.reason)
@@ -0,0 +1,384 @@
+import calendar
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import logging
+import time
+
+import numpy as np
+
+from .aggregator import RESOLUTION_SECONDS
+from .auto_ig import AutoIG
+from .bars import FIELD_INDEX, TIME_FORMAT
+from .cache import IndicatorCache
+from .market import Market
+from .store import PriceStore
+from .trade import TradeRegistry
+
+logger = logging.getLogger(__name__)
+
+# where the backtest looks for bars first - the live store only keeps the bars in memory
+HISTORY_ROOT = "markets/history/"
+LIVE_ROOT = "markets/prices/"
+# bars before the start each series is loaded with, so the indicators are warm
+WARMUP = 120
+
+# the quotes of a stored bar, rows of BarSeries.fields()
+(OPEN_BID, OPEN_ASK, HIGH_BID, HIGH_ASK, LOW_BID, LOW_ASK, CLOSE_BID, CLOSE_ASK) = [
+    FIELD_INDEX[(g, q)] for g in ('openPrice', 'highPrice', 'lowPrice', 'closePrice') for q in ('bid', 'ask')]
+
+
+def to_epoch(value):
+    """a datetime, 'YYYY-MM-DD' or snapshotTime string -> epoch seconds on the bars' clock"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        for fmt in ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", TIME_FORMAT):
+            try:
+                value = datetime.datetime.strptime(value, fmt)
+                break
+            except ValueError:
+                pass
+        else:
+            raise ValueError("can't read a date from {}".format(value))
+    return calendar.timegm(value.timetuple())
+
+
+def market_details(epic, minimum_stop=1, premium=0.0):
+    """enough of a GET /markets/<epic> response for a Market that's only ever backtested"""
+    return {"snapshot": {"marketStatus": "TRADEABLE", "bid": 0, "offer": 0, "high": 0, "low": 0,
+                         "percentageChange": 0, "netChange": 0},
+            "dealingRules": {"minControlledRiskStopDistance": {"unit": "POINTS", "value": minimum_stop}},
+            "instrument": {"epic": epic, "marginDepositBands": [], "limitedRiskPremium": {"value": premium}}}
+
+
+class SimResponse:
+    """the bits of a requests response Trade looks at"""
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.reason = "OK" if self.ok else "Not Found"
+        self.text = json.dumps(body)
+        self.content = self.text.encode()
+
+
+class SimBroker:
+    """Stands in for IGClient in a backtest, dealing at the latest bar's prices
+
+    Trade opens and closes positions with the same REST calls as it does live
+    (POST /positions/otc, GET /confirms/<ref>) and they're filled here at the
+    market's bid/offer, less slippage. A fixed spread replaces the bars' own
+    when given. Each position's stop and limit are checked against the high
+    and low of every bar after it's opened: a guaranteed stop fills at its
+    level and costs the premium, any other stop or limit that the bar opened
+    through fills at the open. A position closed that way is reported to the
+    AutoIG like the TRADE stream would (position_update).
+    """
+
+    def __init__(self, ig, spread=None, slippage=0.0, guaranteed_premium=0.0):
+        self.ig = ig
+        self.spread = spread
+        self.slippage = slippage
+        self.guaranteed_premium = guaranteed_premium
+        self.positions = {}
+        self.open_deals = set()
+        self.confirms = {}
+        self.deals = []
+        self.counter = itertools.count(1)
+
+    def quotes(self, row):
+        """(open, high, low, close) as (bid, ask) pairs of a stored bar, with the fixed spread if there is one"""
+        pairs = [(row[OPEN_BID], row[OPEN_ASK]), (row[HIGH_BID], row[HIGH_ASK]),
+                 (row[LOW_BID], row[LOW_ASK]), (row[CLOSE_BID], row[CLOSE_ASK])]
+        if self.spread is None:
+            return pairs
+        half = self.spread / 2.0
+        return [((b + a) / 2.0 - half, (b + a) / 2.0 + half) for b, a in pairs]
+
+    def get(self, url, **kwargs):
+        if '/confirms/' in url:
+            confirm = self.confirms.get(url.rsplit('/', 1)[1])
+            if confirm is not None:
+                return SimResponse(200, confirm)
+        elif '/positions/' in url:
+            position = self.positions.get(url.rsplit('/', 1)[1])
+            if position is not None:
+                return SimResponse(200, {"position": {"dealId": position['dealId'], "openLevel": position['level']}})
+        return SimResponse(404, {"errorCode": "error.not-found"})
+
+    def post(self, url, data=None, headers=None, **kwargs):
+        order = json.loads(data)
+        if headers is not None and headers.get('_method') == "DELETE":
+            return self.close_order(order)
+        return self.open_order(order)
+
+    def open_order(self, order):
+        market = self.ig.markets[order['epic']]
+        ref = "SIM{}".format(next(self.counter))
+        deal_id = "DEAL" + ref
+        size = float(order['size'])
+        if order['direction'] == "BUY":
+            level = float(market.offer) + self.slippage
+            stop = level - order['stopDistance']
+            limit = level + order['limitDistance']
+        else:
+            level = float(market.bid) - self.slippage
+            stop = level + order['stopDistance']
+            limit = level - order['limitDistance']
+        self.positions[deal_id] = {"dealId": deal_id, "epic": market.epic, "direction": order['direction'],
+                                   "size": size, "level": level, "stop": stop, "limit": limit,
+                                   "guaranteed": bool(order.get('guaranteedStop')), "opened": self.ig.now()}
+        self.open_deals.add(deal_id)
+        self.confirms[ref] = {"dealReference": ref, "dealId": deal_id, "dealStatus": "ACCEPTED",
+                              "reason": "SUCCESS", "level": level}
+        return SimResponse(200, {"dealReference": ref})
+
+    def close_order(self, order):
+        position = self.positions.get(order['dealId'])
+        if position is None:
+            return SimResponse(404, {"errorCode": "No position found for AccountId"})
+        market = self.ig.markets[position['epic']]
+        if position['direction'] == "BUY":
+            level = market.bid - self.slippage
+        else:
+            level = market.offer + self.slippage
+        self.settle(position, level, "closed")
+        return SimResponse(200, {"dealReference": "SIM{}".format(next(self.counter))})
+
+    def on_bar(self, market, quotes):
+        """fill the stops and limits of market's positions the bar went through"""
+        (open_bid, open_ask), (high_bid, high_ask), (low_bid, low_ask), _ = quotes
+        for position in [p for p in self.positions.values() if p['epic'] == market.epic]:
+            stop, limit = position['stop'], position['limit']
+            if position['direction'] == "BUY":
+                # a bar that reaches both is taken to have hit the stop first
+                if low_bid <= stop:
+                    level = stop if position['guaranteed'] else min(stop, open_bid) - self.slippage
+                    self.settle(position, level, "stop")
+                elif high_bid >= limit:
+                    self.settle(position, max(limit, open_bid), "limit")
+            else:
+                if high_ask >= stop:
+                    level = stop if position['guaranteed'] else max(stop, open_ask) + self.slippage
+                    self.settle(position, level, "stop")
+                elif low_ask <= limit:
+                    self.settle(position, min(limit, open_ask), "limit")
+
+    def settle(self, position, level, reason):
+        level = float(level)
+        del self.positions[position['dealId']]
+        self.open_deals.discard(position['dealId'])
+        sign = 1 if position['direction'] == "BUY" else -1
+        pnl = (level - position['level']) * sign * position['size']
+        premium = 0.0
+        if reason == "stop" and position['guaranteed']:
+            premium = self.guaranteed_premium * position['size']
+        self.deals.append({"deal_id": position['dealId'], "epic": position['epic'], "direction": position['direction'],
+                           "size": position['size'], "opened": position['opened'], "open_level": position['level'],
+                           "closed": self.ig.now(), "close_level": level, "reason": reason,
+                           "premium": premium, "pnl": pnl - premium})
+        if reason != "closed":
+            self.ig.position_update({"dealId": position['dealId'], "status": "DELETED", "level": level})
+
+
+class NullJournal:
+    """a backtest's trades aren't written anywhere"""
+
+    def record(self, trade, kind, value, timestamp=None):
+        pass
+
+    def mark(self, save_object):
+        return save_object
+
+    def snapshot(self, file_name, state, save_object):
+        pass
+
+
+class BacktestMarket(Market):
+    """a Market that only holds the bars it's fed, and never reads or writes the price files"""
+
+    def load_prices(self):
+        self.prices = {}
+
+    def save_prices(self):
+        pass
+
+    def save_json(self):
+        pass
+
+
+class BacktestIG(AutoIG):
+    """The AutoIG a backtest runs: insta_trade, make_trade and position_update as they are live,
+    with the clock set to the bar being replayed and a SimBroker for the REST client"""
+
+    def __init__(self, strategies, balance=10000, **broker):
+        self.markets = {}
+        self.trades = TradeRegistry()
+        self.strategy = strategies
+        self.account = {'balance': {'balance': balance}}
+        self.max_concurrent_trades = 100
+        self.indicator_cache = IndicatorCache()
+        self.journal = NullJournal()
+        self.engine = None
+        self.orders = None
+        self.tick_dispatcher = None
+        self.api_url = ""
+        self.clock = None
+        self.http = SimBroker(self, **broker)
+        self.positions = self.http.open_deals
+
+    def now(self):
+        return self.clock
+
+
+class Backtest:
+    """Replays stored bars through the strategies, insta_trade and the Trade lifecycle
+
+    Every stored resolution of every epic is one stream of bars, and they're
+    merged in the order the bars close. Each bar is appended to its market's
+    series, which the strategies and streaming indicators follow as they do
+    live, so nothing is re-sliced or worked out again from the start. Once
+    every bar closing at a time is in, the markets they belong to get
+    insta_trade and their trades updated. The finest resolution of each epic
+    sets its bid/offer and is checked for stop and limit fills (see SimBroker).
+    Bars come from HISTORY_ROOT, or the live price files when an epic has no
+    history there.
+    """
+
+    def __init__(self, epics, start=None, end=None, strategies=None, resolutions=None, market_data=None,
+                 spread=None, slippage=0.0, guaranteed_premium=0.0, balance=10000, warmup=WARMUP,
+                 history=HISTORY_ROOT):
+        self.epics = list(epics)
+        self.start = to_epoch(start)
+        self.end = to_epoch(end)
+        self.resolutions = resolutions
+        self.warmup = warmup
+        self.stores = [PriceStore(history), PriceStore(LIVE_ROOT)]
+        if strategies is None:
+            strategies = AutoIG.default_strategies()
+        self.ig = BacktestIG(strategies, balance, spread=spread, slippage=slippage,
+                             guaranteed_premium=guaranteed_premium)
+        for epic in self.epics:
+            details = (market_data or {}).get(epic) or market_details(epic, premium=guaranteed_premium)
+            market = BacktestMarket(epic, self.ig, details)
+            for s in strategies.values():
+                market.add_strategy(s)
+            self.ig.markets[epic] = market
+        self.series = []
+        self.base = {}
+
+    def load(self):
+        """read each epic's bars, warm up its series with the ones before start, returns the bars to replay"""
+        for epic in self.epics:
+            store = next((s for s in self.stores if s.resolutions(epic)), self.stores[-1])
+            resolutions = [r for r in store.resolutions(epic) if r in RESOLUTION_SECONDS
+                           and (self.resolutions is None or r in self.resolutions)]
+            if not resolutions:
+                logger.info("{} has no stored bars to backtest".format(epic))
+                continue
+            self.base[epic] = min(resolutions, key=RESOLUTION_SECONDS.get)
+            market = self.ig.markets[epic]
+            for res in resolutions:
+                times, values = store.read(epic, res, mapped=True)
+                first = 0 if self.start is None else int(np.searchsorted(times, self.start))
+                last = times.size if self.end is None else int(np.searchsorted(times, self.end, side='right'))
+                series = market.new_series(res)
+                market.prices[res] = series
+                series.load_fields(times[max(0, first - self.warmup):first], values[max(0, first - self.warmup):first])
+                if last > first:
+                    self.series.append((epic, res, times[first:last], values[first:last]))
+        return sum(times.size for _, _, times, _ in self.series)
+
+    def events(self):
+        """(close time, series, row) of every bar to replay, in the order they close - finest first"""
+        closes, seconds, ids, rows = [], [], [], []
+        for n, (epic, res, times, _) in enumerate(self.series):
+            closes.append(times + RESOLUTION_SECONDS[res])
+            seconds.append(np.full(times.size, RESOLUTION_SECONDS[res]))
+            ids.append(np.full(times.size, n))
+            rows.append(np.arange(times.size))
+        if not closes:
+            return []
+        closes, seconds, ids, rows = (np.concatenate(a) for a in (closes, seconds, ids, rows))
+        order = np.lexsort((ids, seconds, closes))
+        return zip(closes[order].tolist(), ids[order].tolist(), rows[order].tolist())
+
+    def run(self, quiet=False):
+        """replay the bars, returns the results - quiet keeps the strategies' logging and printing
+        out of it, but for the whole process, so only where nothing else is running (eg. a sweep's workers)"""
+        started = time.monotonic()
+        count = self.load()
+        with self.hushed(quiet):
+            touched = {}
+            current = None
+            for close, n, i in self.events():
+                if close != current:
+                    self.trade(touched)
+                    touched = {}
+                    current = close
+                    self.ig.clock = datetime.datetime.utcfromtimestamp(close)
+                self.bar(n, i, touched)
+            self.trade(touched)
+            self.finish()
+        results = self.results()
+        results.update({"bars": count, "seconds": round(time.monotonic() - started, 2)})
+        return results
+
+    def bar(self, n, i, touched):
+        epic, res, times, values = self.series[n]
+        market = self.ig.markets[epic]
+        if res == self.base[epic]:
+            quotes = self.ig.http.quotes(values[i])
+            self.ig.http.on_bar(market, quotes)
+            market.bid, market.offer = quotes[-1]
+            market.spread = market.offer - market.bid
+        series = market.prices[res]
+        series.load_fields(times[i:i + 1], values[i:i + 1])
+        for s in market.strategies.values():
+            s.process_signals(market, series, res)
+        touched[market] = None
+
+    def trade(self, markets):
+        """what process and live_update do for the markets that just had a bar"""
+        for market in markets:
+            self.ig.insta_trade(market)
+            for t in self.ig.trades.for_epic(market.epic):
+                if not t.update():
+                    self.ig.trades.remove(t)
+
+    def finish(self):
+        """close whatever's still open at the last prices"""
+        for deal_id in list(self.ig.http.positions):
+            position = self.ig.http.positions[deal_id]
+            market = self.ig.markets[position['epic']]
+            level = market.bid if position['direction'] == "BUY" else market.offer
+            self.ig.http.settle(position, level, "end")
+
+    def results(self):
+        deals = self.ig.http.deals
+        pnl = np.array([d['pnl'] for d in deals])
+        equity = np.cumsum(pnl) if pnl.size else np.zeros(1)
+        drawdown = np.maximum.accumulate(np.maximum(equity, 0)) - equity
+        wins = int((pnl > 0).sum())
+        return {"epics": self.epics, "trades": len(deals), "wins": wins, "losses": len(deals) - wins,
+                "win_rate": round(wins / len(deals), 3) if deals else None,
+                "pnl": round(float(pnl.sum()), 2), "premiums": round(sum(d['premium'] for d in deals), 2),
+                "max_drawdown": round(float(drawdown.max()), 2), "deals": deals}
+
+    @staticmethod
+    @contextlib.contextmanager
+    def hushed(quiet):
+        """logging below WARNING and stdout off while quiet - process-wide, the strategies
+        log and print through the same loggers and stdout as the live threads"""
+        if not quiet:
+            yield
+            return
+        logging.disable(logging.WARNING)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                yield
+        finally:
+            logging.disable(logging.NOTSET)
@@ -0,0 +1,583 @@
+import time
+import calendar
+import numpy as np
+
+TIME_FORMAT = "%Y:%m:%d-%H:%M:%S"
+
+PRICE_GROUPS = ('openPrice', 'closePrice', 'highPrice', 'lowPrice')
+PRICE_QUOTES = ('bid', 'ask', 'mid', 'spread', 'lastTraded')
+TYPICAL_QUOTES = ('bid', 'ask', 'mid')
+
+# every numeric field of a bar gets a fixed row in the column store
+FIELDS = [(g, q) for g in PRICE_GROUPS for q in PRICE_QUOTES]
+FIELDS += [('typicalPrice', q) for q in TYPICAL_QUOTES]
+FIELDS += [('lastTradedVolume', None)]
+FIELD_INDEX = dict((f, i) for i, f in enumerate(FIELDS))
+GROUP_QUOTES = {g: PRICE_QUOTES for g in PRICE_GROUPS}
+GROUP_QUOTES['typicalPrice'] = TYPICAL_QUOTES
+VOLUME = FIELD_INDEX[('lastTradedVolume', None)]
+
+
+def parse_time(snapshot_time):
+    """snapshotTime string -> integer epoch seconds (naive, as IG sends it)"""
+    return calendar.timegm(time.strptime(snapshot_time, TIME_FORMAT))
+
+
+def format_time(epoch):
+    """integer epoch seconds -> snapshotTime string"""
+    return time.strftime(TIME_FORMAT, time.gmtime(epoch))
+
+
+def _to_float(value):
+    if value is None or value == '':
+        return np.nan
+    return float(value)
+
+
+def _from_float(value):
+    value = float(value)
+    if value != value:
+        return None
+    return value
+
+
+class GroupView:
+    """Dict-like view of one price group of a bar eg. bar['closePrice']"""
+
+    __slots__ = ('_bar', '_group')
+
+    def __init__(self, bar, group):
+        self._bar = bar
+        self._group = group
+
+    def __getitem__(self, quote):
+        if quote not in GROUP_QUOTES[self._group]:
+            raise KeyError(quote)
+        series = self._bar.series
+        return _from_float(series._data[FIELD_INDEX[(self._group, quote)], self._bar.pos])
+
+    def __setitem__(self, quote, value):
+        if quote not in GROUP_QUOTES[self._group]:
+            raise KeyError(quote)
+        series = self._bar.series
+        pos = self._bar.pos
+        series._touch(pos)
+        series._data[FIELD_INDEX[(self._group, quote)], pos] = _to_float(value)
+
+    def __contains__(self, quote):
+        return quote in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        return [q for q in GROUP_QUOTES[self._group] if q == 'lastTraded' or self[q] is not None]
+
+    def get(self, quote, default=None):
+        try:
+            return self[quote]
+        except KeyError:
+            return default
+
+    def items(self):
+        return [(q, self[q]) for q in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class BarView:
+    """Dict-like view of a single bar, for code that still expects the IG price dicts"""
+
+    __slots__ = ('series', 'seq')
+
+    def __init__(self, series, seq):
+        self.series = series
+        self.seq = seq
+
+    @property
+    def pos(self):
+        return self.series._slot(self.seq)
+
+    def __getitem__(self, key):
+        series = self.series
+        if key == 'snapshotTime':
+            return format_time(int(series._time[self.pos]))
+        if key == 'lastTradedVolume':
+            value = _from_float(series._data[VOLUME, self.pos])
+            return None if value is None else int(value)
+        if key in GROUP_QUOTES:
+            return GroupView(self, key)
+        if key in series._extras:
+            value = _from_float(series._extras[key][self.pos])
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        series = self.series
+        if key == 'snapshotTime':
+            series._touch(self.pos)
+            series._set_time(self.pos, parse_time(value))
+        elif key == 'lastTradedVolume':
+            series._touch(self.pos)
+            series._data[VOLUME, self.pos] = _to_float(value)
+        elif key in GROUP_QUOTES:
+            group = GroupView(self, key)
+            for q, v in value.items():
+                if q in GROUP_QUOTES[key]:
+                    group[q] = v
+        else:
+            series._extra(key)[self.pos] = _to_float(value)
+
+    def __contains__(self, key):
+        if key in ('snapshotTime', 'lastTradedVolume') or key in GROUP_QUOTES:
+            return True
+        column = self.series._extras.get(key)
+        return column is not None and column[self.pos] == column[self.pos]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self, indicators=True):
+        keys = ['snapshotTime'] + list(PRICE_GROUPS) + ['lastTradedVolume', 'typicalPrice']
+        if indicators:
+            pos = self.pos
+            keys += [k for k, v in self.series._extras.items() if v[pos] == v[pos]]
+        return keys
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def to_dict(self, indicators=True):
+        """plain dict of the bar, with the indicator values joined in unless told not to"""
+        d = {}
+        for k in self.keys(indicators):
+            v = self[k]
+            d[k] = v.to_dict() if isinstance(v, GroupView) else v
+        return d
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class BarSeries:
+    """Column store for a list of bars of one resolution
+
+    Every numeric field lives in a preallocated numpy row so indicators can take
+    zero-copy columns with column(group, quote), while indexing and iterating
+    still hands back dict-like BarViews for the older code paths.
+
+    With a capacity set the series is a ring buffer holding the newest capacity
+    bars: appends evict the oldest bar in O(1). The rows are twice the capacity
+    so the live bars are always one contiguous slice, they only get shifted back
+    to the front once every capacity appends.
+
+    Indicator results go in a separate frame of columns (set_extra/extra) rather
+    than into the bars. BarViews join them in lazily so the older code and the
+    /prices views still see bar['ema_100'], but to_list() leaves them out.
+    """
+
+    def __init__(self, bars=None, capacity=None):
+        self.capacity = None if capacity is None else max(int(capacity), 1)
+        size = 128 if self.capacity is None else self.capacity * 2
+        self._data = np.full((len(FIELDS), size), np.nan)
+        self._time = np.zeros(size, dtype=np.int64)
+        # the indicator frame, name -> column aligned with _data
+        self._extras = {}
+        # bar time (epoch seconds) -> sequence number, for O(1) lookups by time
+        self._index = {}
+        self._start = 0
+        self._end = 0
+        # sequence number of the bar at _start, bars keep their number for life
+        self._first_seq = 0
+        # bumped whenever a bar before the newest one is rewritten, so anything
+        # that follows the series bar by bar knows its history changed
+        self.revision = 0
+        # bumped on every change to the bars, caches key on it
+        self.version = 0
+        # sequence number of the oldest bar written since pop_changes()
+        self._changed = None
+        self._is_view = False
+        if bars is not None:
+            self.extend(bars)
+
+    # ------------------------------------------------------------------
+    # internals
+    # ------------------------------------------------------------------
+    def _slot(self, seq):
+        if seq < self._first_seq or seq >= self._first_seq + len(self):
+            raise IndexError("bar no longer in series")
+        return self._start + (seq - self._first_seq)
+
+    def _seq(self, index):
+        length = len(self)
+        if index < 0:
+            index += length
+        if index < 0 or index >= length:
+            raise IndexError("bar index out of range")
+        return self._first_seq + index
+
+    def _touch(self, pos):
+        """note a write to slot pos, only rewrites before the newest bar count as revisions"""
+        self.version += 1
+        if pos != self._end - 1:
+            self.revision += 1
+        seq = self._first_seq + (pos - self._start)
+        if self._changed is None or seq < self._changed:
+            self._changed = seq
+
+    def _set_time(self, pos, epoch):
+        seq = self._first_seq + (pos - self._start)
+        old = int(self._time[pos])
+        if self._index.get(old) == seq:
+            del self._index[old]
+        self._time[pos] = epoch
+        self._index[epoch] = seq
+
+    def _drop_front(self, count):
+        """forget the oldest count bars"""
+        for k in range(count):
+            t = int(self._time[self._start + k])
+            if self._index.get(t) == self._first_seq + k:
+                del self._index[t]
+        self._start += count
+        self._first_seq += count
+        self.version += 1
+
+    def _extra(self, name):
+        column = self._extras.get(name)
+        if column is None:
+            column = np.full(self._data.shape[1], np.nan)
+            self._extras[name] = column
+        return column
+
+    def _reallocate(self, size):
+        """move the live bars to the front of new rows of the given size"""
+        length = len(self)
+        data = np.full((len(FIELDS), size), np.nan)
+        data[:, :length] = self._data[:, self._start:self._end]
+        times = np.zeros(size, dtype=np.int64)
+        times[:length] = self._time[self._start:self._end]
+        for name, column in self._extras.items():
+            grown = np.full(size, np.nan)
+            grown[:length] = column[self._start:self._end]
+            self._extras[name] = grown
+        self._data = data
+        self._time = times
+        self._start = 0
+        self._end = length
+
+    def _compact(self):
+        """shift the live bars back to the front of the existing rows"""
+        length = len(self)
+        start, end = self._start, self._end
+        self._data[:, :length] = self._data[:, start:end]
+        self._time[:length] = self._time[start:end]
+        for column in self._extras.values():
+            column[:length] = column[start:end]
+        self._start = 0
+        self._end = length
+
+    def _reserve(self, count=1):
+        """make sure there is room for count more bars at the end"""
+        if self._is_view:
+            raise ValueError("can't grow a slice of a BarSeries")
+        size = self._data.shape[1]
+        if self._end + count <= size:
+            return
+        if self.capacity is None:
+            self._reallocate(max(size * 2, len(self) + count))
+        else:
+            self._compact()
+
+    def _next_slot(self):
+        """slot for a new bar at the end, evicting the oldest when full"""
+        if self.capacity is not None and len(self) >= self.capacity:
+            self._drop_front(1)
+        self._reserve(1)
+        pos = self._end
+        self._end += 1
+        return pos
+
+    def _write(self, pos, bar):
+        """write a price dict into slot pos"""
+        # take copies first, bar may be a view onto the slot we're overwriting
+        bar = dict((k, v.to_dict() if isinstance(v, (BarView, GroupView)) else v) for k, v in bar.items())
+        self._touch(pos)
+        self._data[:, pos] = np.nan
+        for column in self._extras.values():
+            column[pos] = np.nan
+        for key, value in bar.items():
+            if key == 'snapshotTime':
+                self._set_time(pos, parse_time(value))
+            elif key == 'lastTradedVolume':
+                self._data[VOLUME, pos] = _to_float(value)
+            elif key in GROUP_QUOTES:
+                if value is None:
+                    continue
+                for q, v in value.items():
+                    if q in GROUP_QUOTES[key]:
+                        self._data[FIELD_INDEX[(key, q)], pos] = _to_float(v)
+            else:
+                # anything else is an indicator value from older code or an old
+                # price file, it goes in the frame
+                try:
+                    self._extra(key)[pos] = _to_float(value)
+                except (TypeError, ValueError):
+                    # non numeric extras (eg. blank psar side) aren't kept
+                    pass
+
+    # ------------------------------------------------------------------
+    # list behaviour
+    # ------------------------------------------------------------------
+    def __len__(self):
+        return self._end - self._start
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        for seq in range(self._first_seq, self._first_seq + len(self)):
+            yield BarView(self, seq)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            stop = max(start, stop)
+            view = BarSeries.__new__(BarSeries)
+            view._data = self._data
+            view._time = self._time
+            view._extras = self._extras
+            view._index = self._index
+            view._start = self._start + start
+            view._end = self._start + stop
+            view._first_seq = self._first_seq + start
+            view.revision = self.revision
+            view.version = self.version
+            view._is_view = True
+            view.capacity = None
+            return view
+        return BarView(self, self._seq(index))
+
+    def __setitem__(self, index, bar):
+        self._write(self._slot(self._seq(index)), bar)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1 or stop <= start:
+                if stop > start:
+                    keep = [b.to_dict() for i, b in enumerate(self) if i not in range(start, stop, step)]
+                    self.clear()
+                    self.extend(keep)
+                return
+        else:
+            start = index + len(self) if index < 0 else index
+            stop = start + 1
+            if start < 0 or start >= len(self):
+                raise IndexError("bar index out of range")
+
+        if start == 0:
+            # dropping from the front is just moving the start marker
+            self._drop_front(stop)
+        else:
+            keep = [b.to_dict() for i, b in enumerate(self) if not start <= i < stop]
+            self.clear()
+            self.extend(keep)
+
+    def append(self, bar):
+        self._write(self._next_slot(), bar)
+
+    def extend(self, bars):
+        bars = list(bars)
+        if self.capacity is None:
+            self._reserve(len(bars))
+        elif len(bars) > self.capacity:
+            # the head would be evicted straight away, just count it as seen
+            self._first_seq += len(self) + len(bars) - self.capacity
+            self._start = self._end = 0
+            self._index.clear()
+            bars = bars[-self.capacity:]
+        for bar in bars:
+            self._write(self._next_slot(), bar)
+
+    def clear(self):
+        self.revision += 1
+        self.version += 1
+        self._first_seq += len(self)
+        self._start = self._end = 0
+        self._index.clear()
+
+    def set_capacity(self, capacity):
+        """change how many bars are kept, dropping the oldest if there are too many"""
+        self.capacity = None if capacity is None else max(int(capacity), 1)
+        if self.capacity is not None and len(self) > self.capacity:
+            self._drop_front(len(self) - self.capacity)
+        size = max(len(self), 128) if self.capacity is None else self.capacity * 2
+        self._reallocate(size)
+
+    def index_of(self, epoch):
+        """list index of the bar starting at epoch (seconds), or None"""
+        seq = self._index.get(epoch)
+        if seq is None or seq < self._first_seq or seq >= self._first_seq + len(self):
+            return None
+        return seq - self._first_seq
+
+    def find(self, snapshot_time):
+        """list index of the bar with the given snapshotTime string, or None"""
+        return self.index_of(parse_time(snapshot_time))
+
+    def _same(self, pos, bar):
+        """whether the prices and volume bar gives match those already in slot pos"""
+        held = self._data[:, pos]
+        for key, value in bar.items():
+            if key == 'lastTradedVolume':
+                fields = [(VOLUME, value)]
+            elif key in GROUP_QUOTES and value is not None:
+                fields = [(FIELD_INDEX[(key, q)], v) for q, v in value.items() if q in GROUP_QUOTES[key]]
+            else:
+                continue
+            for row, v in fields:
+                old, new = held[row], _to_float(v)
+                if old != new and not (old != old and new != new):
+                    return False
+        return True
+
+    def upsert(self, bar, epoch=None):
+        """replace the bar with the same time or append it if it's newer than the
+        last bar, older bars that aren't in the series are ignored
+        returns the list index of the bar or None
+        A bar we already hold with the same prices isn't rewritten, so refetching
+        an overlap doesn't count as a revision."""
+        if epoch is None:
+            epoch = parse_time(bar['snapshotTime'])
+        i = self.index_of(epoch)
+        if i is not None:
+            if not self._same(self._slot(self._seq(i)), bar):
+                self[i] = bar
+            return i
+        if len(self) == 0 or epoch > self._time[self._end - 1]:
+            self.append(bar)
+            return len(self) - 1
+        return None
+
+    def last_time(self):
+        """epoch of the newest bar, None when empty"""
+        if len(self) == 0:
+            return None
+        return int(self._time[self._end - 1])
+
+    def window(self, count):
+        """contiguous view of the newest count bars"""
+        return self[-count:] if count > 0 else self[len(self):]
+
+    # ------------------------------------------------------------------
+    # column access
+    # ------------------------------------------------------------------
+    def column(self, group, quote='mid'):
+        """zero-copy numpy view of a price field eg. column('closePrice','mid')"""
+        if group == 'lastTradedVolume':
+            return self._data[VOLUME, self._start:self._end]
+        return self._data[FIELD_INDEX[(group, quote)], self._start:self._end]
+
+    def volume(self):
+        return self.column('lastTradedVolume')
+
+    def times(self):
+        return self._time[self._start:self._end]
+
+    def extra(self, name):
+        """view of a stored extra column (indicator values etc), NaN where unset"""
+        return self._extra(name)[self._start:self._end]
+
+    def indicator_names(self):
+        """names of the columns in the indicator frame"""
+        return list(self._extras)
+
+    def drop_indicators(self, names=None):
+        """empty the indicator frame, or just the named columns"""
+        for name in list(self._extras) if names is None else names:
+            self._extras.pop(name, None)
+
+    def set_extra(self, name, values):
+        """store values against the newest bars, aligned to the end of the series"""
+        values = np.asarray(values, dtype=float)
+        count = min(values.size, len(self))
+        if count > 0:
+            self._extra(name)[self._end - count:self._end] = values[values.size - count:]
+
+    def fill_missing(self):
+        """forward fill gaps in bid/ask (first bar borrows from the next),
+        then recompute mid, spread and the typical price"""
+        if len(self) == 0:
+            return
+        self.version += 1
+        for g in PRICE_GROUPS:
+            for q in ('bid', 'ask'):
+                col = self.column(g, q)
+                missing = np.isnan(col)
+                if missing.any():
+                    if missing[:-1].any():
+                        self.revision += 1
+                    self._touch(self._start + int(np.argmax(missing)))
+                    if missing[0] and len(col) > 1:
+                        col[0] = col[1]
+                    idx = np.where(np.isnan(col), 0, np.arange(col.size))
+                    np.maximum.accumulate(idx, out=idx)
+                    col[:] = col[idx]
+            self.column(g, 'mid')[:] = (self.column(g, 'bid') + self.column(g, 'ask')) / 2
+            self.column(g, 'spread')[:] = np.round(self.column(g, 'ask') - self.column(g, 'bid'), 2)
+        self.column('typicalPrice', 'mid')[:] = np.round(
+            (self.column('lowPrice') + self.column('highPrice') + self.column('closePrice')) / 3, 2)
+
+    def pop_changes(self):
+        """list index of the oldest bar added or rewritten since the last call, None
+        if nothing has changed - lets a writer save just the new bars"""
+        changed, self._changed = self._changed, None
+        if changed is None:
+            return None
+        return max(changed - self._first_seq, 0) if changed < self._first_seq + len(self) else None
+
+    def fields(self, start=0):
+        """(times, values) of the bars from list index start on, values has a row
+        per bar in FIELDS order - views, not copies"""
+        start = self._start + start
+        return self._time[start:self._end], self._data[:, start:self._end].T
+
+    def load_fields(self, times, values):
+        """append bars straight from arrays laid out as fields() gives them"""
+        times = np.asarray(times, dtype=np.int64)
+        values = np.asarray(values, dtype=float)
+        if self.capacity is not None and times.size > self.capacity:
+            times = times[-self.capacity:]
+            values = values[-self.capacity:]
+        for i in range(times.size):
+            pos = self._next_slot()
+            self._touch(pos)
+            for column in self._extras.values():
+                column[pos] = np.nan
+            self._data[:, pos] = values[i]
+            self._set_time(pos, int(times[i]))
+
+    def to_list(self, indicators=False):
+        """plain list of price dicts, in the layout IG sends them
+        indicators - join in the indicator frame as extra keys"""
+        return [b.to_dict(indicators) for b in self]
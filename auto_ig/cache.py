@@ -0,0 +1,61 @@
+from collections import OrderedDict
+import numpy as np
+
+
+def _frozen(value):
+    """read-only copy of an indicator result (an array or a tuple of them)"""
+    if isinstance(value, tuple):
+        return tuple(_frozen(v) for v in value)
+    if isinstance(value, np.ndarray):
+        value = value.copy()
+        value.flags.writeable = False
+    return value
+
+
+class IndicatorCache:
+    """LRU memo of indicator results shared by every market and strategy
+
+    Keys are (epic, resolution, indicator, params) plus the bars they were worked
+    out on: the sequence numbers of the first and last bar, the last bar's time and
+    the series version, which changes on any write to the bars. So the second
+    strategy asking for ema(100) on the same bar gets the first one's result, and
+    a revised live bar or a new bar is a miss. Results are read-only copies.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(epic, resolution, series, name, params=()):
+        first = series._first_seq
+        return (epic, resolution, name, tuple(params),
+                first, first + len(series), series.last_time(), series.version)
+
+    def get(self, key, compute):
+        """the cached result for key, calling compute() and keeping what it returns on a miss"""
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            value = _frozen(compute())
+            self.entries[key] = value
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+            return value
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def clear(self, epic=None):
+        """drop everything, or just the entries of one epic"""
+        if epic is None:
+            self.entries.clear()
+        else:
+            for key in [k for k in self.entries if k[0] == epic]:
+                del self.entries[key]
+
+    def stats(self):
+        return {"size": len(self.entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
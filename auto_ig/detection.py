@@ -1,4 +1,5 @@
 import numpy as np
+from . import indicators as ta
 
 def crossover_hold(series_1, series_2, lookback=3):
     now = series_1[-1] - series_2[-1]
@@ -35,53 +36,79 @@ def trough(series):
 
 def find_crossover(series,value=0):
     # try to find a crossover in the supplied series
-    
-    place = -1
+    # - the length of the shortest prefix of it that ends on one, -1 if there isn't one
     if len(series)<2:
         raise ValueError("series is too short - must be 2 or greater")
+    if isinstance(value,(list,np.ndarray)) and len(value) < len(series):
+        raise ValueError("if using list as value, it must be equal or greater length than series")
 
-    if isinstance(value,(list,np.ndarray)):
-        if len(value) < len(series):
-            raise ValueError("if using list as value, it must be equal or greater length than series")
-        
-       
-        for i in range(2,len(series)):
-            if crossover(series[:i],value[:i]):
-                place = i
-                break
-        
-
-    else:
-        for i in range(2,len(series)):
-            if crossover(series[:i],value):
-                place = i
-                break
-    return place
+    return _first(crossovers(series,value)[:-1])
 
 def find_crossunder(series,value=0):
-    # try to find a crossover in the supplied series
-    
-    place = -1
+    # try to find a crossunder in the supplied series
     if len(series)<2:
         raise ValueError("series is too short - must be 2 or greater")
+    if isinstance(value,(list,np.ndarray)) and len(value) < len(series):
+        raise ValueError("if using list as value, it must be equal or greater length than series")
 
-    if isinstance(value,(list,np.ndarray)):
-        if len(value) < len(series):
-            raise ValueError("if using list as value, it must be equal or greater length than series")
-        
-       
-        for i in range(2,len(series)):
-            if crossunder(series[:i],value[:i]):
-                place = i
-                break
-        
+    return _first(crossunders(series,value)[:-1])
 
-    else:
-        for i in range(2,len(series)):
-            if crossunder(series[:i],value):
-                place = i
-                break
-    return place
+def _first(mask):
+    hits = np.flatnonzero(mask)
+    return int(hits[0]) + 1 if len(hits) else -1
+
+def _pair(series, value):
+    series = np.asarray(series, dtype=float)
+    if isinstance(value,(list,np.ndarray)):
+        value = np.asarray(value, dtype=float)[:len(series)]
+    return series, value
+
+def crossovers(series, value=0):
+    """whole series version of crossover - mask[i] is crossover(series[:i+1], value[:i+1])"""
+    series, value = _pair(series, value)
+    diff = series - value
+    mask = np.zeros(len(series), dtype=bool)
+    # nan compares False both ways, as it does in crossover
+    with np.errstate(invalid='ignore'):
+        mask[1:] = (diff[1:] > 0) & (diff[:-1] < 0)
+    return mask
+
+def crossunders(series, value=0):
+    """whole series version of crossunder"""
+    series, value = _pair(series, value)
+    diff = series - value
+    mask = np.zeros(len(series), dtype=bool)
+    with np.errstate(invalid='ignore'):
+        mask[1:] = (diff[1:] < 0) & (diff[:-1] > 0)
+    return mask
+
+def peaks(series):
+    """whole series version of peak - mask[i] is peak(series[:i+1]), so the peak's at i-1"""
+    series = np.asarray(series, dtype=float)
+    mask = np.zeros(len(series), dtype=bool)
+    with np.errstate(invalid='ignore'):
+        mask[2:] = (series[1:-1] > series[2:]) & (series[1:-1] > series[:-2])
+    return mask
+
+def troughs(series):
+    """whole series version of trough"""
+    series = np.asarray(series, dtype=float)
+    mask = np.zeros(len(series), dtype=bool)
+    with np.errstate(invalid='ignore'):
+        mask[2:] = (series[1:-1] < series[2:]) & (series[1:-1] < series[:-2])
+    return mask
+
+def rolling_min(series, window):
+    """out[i] is min(series[i-window+1:i+1]) - what min(series[-window:]) is on each prefix"""
+    series = np.asarray(series, dtype=float)
+    padded = np.concatenate([np.full(window - 1, np.inf), series])
+    return ta.rolling_window(padded, window).min(axis=1)
+
+def rolling_max(series, window):
+    """out[i] is max(series[i-window+1:i+1])"""
+    series = np.asarray(series, dtype=float)
+    padded = np.concatenate([np.full(window - 1, -np.inf), series])
+    return ta.rolling_window(padded, window).max(axis=1)
 
 def crossover(series, value=0):
     """series = the series we want to compare
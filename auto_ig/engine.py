@@ -0,0 +1,119 @@
+import logging
+import datetime
+import heapq
+import itertools
+import threading
+import time
+from pytz import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class Engine:
+    """Runs an AutoIG on its own thread instead of waiting for /process to be hit
+
+    Jobs sit in a heap by due time and run one at a time on the engine thread:
+    a market refresh every refresh seconds, the full check of open trades
+    against IG on the quarter hour (every reconcile seconds), and anything
+    posted from another thread - the Lightstreamer thread posts a strategy
+    evaluation for a market as soon as one of its bars closes, so a signal
+    gets to insta_trade straight away rather than on the next refresh.
+    """
+
+    def __init__(self, ig, epic_ids, refresh=60, reconcile=900):
+        self.ig = ig
+        self.epic_ids = epic_ids
+        self.refresh_interval = refresh
+        self.reconcile_interval = reconcile
+        self.jobs = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.started = None
+        # name: {"runs", "last", "took", "result"}
+        self.history = {}
+
+    def schedule(self, name, fn, *args, delay=0, interval=None):
+        """run fn(*args) delay seconds from now, and every interval seconds after that if given"""
+        with self.condition:
+            heapq.heappush(self.jobs, (time.monotonic() + delay, next(self.counter), name, fn, args, interval))
+            self.condition.notify()
+
+    def post(self, name, fn, *args):
+        """run fn(*args) on the engine thread as soon as it's free"""
+        self.schedule(name, fn, *args)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.started = datetime.datetime.now(timezone('GB')).replace(tzinfo=None)
+        self.schedule("refresh", self.refresh, interval=self.refresh_interval)
+        self.schedule("reconcile", self.reconcile, delay=self.till_next(self.reconcile_interval), interval=self.reconcile_interval)
+        self.thread = threading.Thread(target=self._run, name="auto_ig-engine", daemon=True)
+        self.thread.start()
+        logger.info("engine started: refresh every {}s, reconcile every {}s".format(self.refresh_interval, self.reconcile_interval))
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.jobs = []
+            self.condition.notify()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    @staticmethod
+    def till_next(interval):
+        """seconds until the clock next reaches a multiple of interval (eg. the quarter hour)"""
+        now = time.time()
+        return interval - now % interval
+
+    def refresh(self):
+        return self.ig.process(self.epic_ids, reconcile=False)
+
+    def reconcile(self):
+        return self.ig.process(self.epic_ids, reconcile=True)
+
+    def _next(self):
+        with self.condition:
+            while self.running:
+                if self.jobs:
+                    wait = self.jobs[0][0] - time.monotonic()
+                    if wait <= 0:
+                        return heapq.heappop(self.jobs)
+                    self.condition.wait(wait)
+                else:
+                    self.condition.wait()
+            return None
+
+    def _run(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            due, _, name, fn, args, interval = job
+            start = time.monotonic()
+            try:
+                result = fn(*args)
+            except Exception as e:
+                logger.info("engine job {} failed".format(name), exc_info=True)
+                result = "failed: {}".format(e)
+            took = time.monotonic() - start
+            stats = self.history.setdefault(name, {"runs": 0})
+            stats.update({"runs": stats["runs"] + 1, "took": round(took, 3), "result": str(result),
+                          "last": datetime.datetime.now(timezone('GB')).replace(tzinfo=None).isoformat()})
+            if interval is not None:
+                with self.condition:
+                    if self.running:
+                        # keep to the grid, but skip runs missed while a job overran
+                        due += interval * max(1, int((time.monotonic() - due) // interval) + 1)
+                        heapq.heappush(self.jobs, (due, next(self.counter), name, fn, args, interval))
+
+    def status(self):
+        with self.condition:
+            now = time.monotonic()
+            upcoming = sorted((job[0], job[2]) for job in self.jobs)
+            return {"running": self.running, "started": self.started.isoformat() if self.started else None,
+                    "queued": [{"job": name, "in": round(due - now, 1)} for due, name in upcoming[:10]],
+                    "jobs": dict(self.history)}
@@ -1,8 +1,9 @@
 import logging
 import os,sys
-import operator
 import numpy as np
 
+from .bars import BarSeries
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 fh = logging.FileHandler('faig_debug.log')
@@ -16,29 +17,59 @@ ch.setFormatter(formatter)
 logger.addHandler(fh)
 logger.addHandler(ch)
 
+# whether indicators given a plain list of price dicts write their results into
+# each dict, set False to only get the arrays back. A BarSeries never gets its bars
+# written to, results go in its indicator frame.
+WRITE_BACK = True
+
+def _column(prices, group='closePrice', price='mid'):
+    """numpy array of one price field - zero copy when prices is a BarSeries"""
+    if isinstance(prices, BarSeries):
+        return prices.column(group, price)
+    if group == 'lastTradedVolume':
+        return np.asarray([x['lastTradedVolume'] for x in prices])
+    return np.asarray([x[group][price] for x in prices])
+
+def _store(prices, name, values):
+    """write indicator values back against the newest bars"""
+    if isinstance(prices, BarSeries):
+        prices.set_extra(name, values)
+        return
+    if not WRITE_BACK:
+        return
+    price_len = len(prices)
+    diff = price_len - len(values)
+    for i in range(max(diff,0),price_len):
+        prices[i][name] = values[i-diff]
+
+def _stored(prices, name, values):
+    """read back the values previously stored under name, values are the ones
+    just worked out for when nothing gets stored"""
+    if isinstance(prices, BarSeries):
+        stored = prices.extra(name)
+        return list(stored[~np.isnan(stored)])
+    if not WRITE_BACK:
+        return list(values)
+    return [x[name] for x in prices if name in x]
+
 def adx(window,prices,name=None):
     if name is None:
         name = "adx_{}".format(window)
 
-    up = np.diff(np.asarray([x['highPrice']['mid'] for x in prices]))
-    down = np.diff(np.flip(np.asarray([x['lowPrice']['mid'] for x in prices]),axis=0))
+    up = np.diff(_column(prices,'highPrice'))
+    down = -np.diff(_column(prices,'lowPrice'))
 
     at, tr = atr(window,prices)
-    upper = []
-    lower = []
-    for i in range(len(up)):
-        u = up[i] if (up[i] > down[i] and up[i]>0) else 0
-        d = down[i] if (down[i] > up[i] and down[i] > 0) else 0
-        upper.append(u)
-        lower.append(d)
+    upper = np.where((up > down) & (up > 0), up, 0)[len(up) - len(at):]
+    lower = np.where((down > up) & (down > 0), down, 0)[len(down) - len(at):]
     
     plus = rma(window,values=(100*(upper/at)))
     minus = rma(window,values=(100*(lower/at)))
 
 
     summed = plus + minus
-    summed = [1 if i==0 else i for i in summed]
-    adx = 100 * rma(window,np.abs(plus - minus) / summed)
+    summed[summed==0] = 1
+    adx = 100 * rma(window,values=np.abs(plus - minus) / summed)
 
     return adx,plus,minus
 
@@ -47,28 +78,14 @@ def atr(window, prices, name = None):
     if name is None:
         name = "atr_{}".format(window)
 
-    previous_day = prices[0]
-    prev_close = float(previous_day['closePrice']['mid'])
-
-    tr_prices = []
-
-    for p in prices[1:]:
-        high_price = float(p['highPrice']['mid'])
-        low_price = float(p['lowPrice']['mid'])
-        price_range = high_price - low_price
+    highs = _column(prices,'highPrice')[1:]
+    lows = _column(prices,'lowPrice')[1:]
+    prev_close = _column(prices,'closePrice')[:-1]
 
-        tr = max(price_range, abs(high_price-prev_close), abs(low_price-prev_close))
-        tr_prices.append(tr)
+    tr_prices = np.maximum(highs - lows, np.maximum(np.abs(highs - prev_close), np.abs(lows - prev_close)))
 
-        prev_close = p['closePrice']['mid']
-
-
-
-    atr = np.mean(rolling_window(np.asarray(tr_prices),window),axis=1)
-    diff = len(prices) - atr.size
-    
-    for i in range(diff,len(prices)):
-        prices[i][name] = atr[i-diff]
+    atr = np.mean(rolling_window(tr_prices,window),axis=1)
+    _store(prices, name, atr)
 
     return atr,tr_prices
 
@@ -76,7 +93,7 @@ def bollinger_bands(window=20,multiplier=2,prices=None,name=None,values=None):
     if values is None:
         if prices is None:
             raise Exception("values or prices or both must be supplied")
-        values = np.asarray([x['closePrice']['mid'] for x in prices])
+        values = _column(prices)
     else:
         values = np.asarray(values)
 
@@ -84,105 +101,65 @@ def bollinger_bands(window=20,multiplier=2,prices=None,name=None,values=None):
         name = "bb_{}".format(window)
 
 
-    basis = ma(window,values)
-    dev = np.std(rolling_window(values,window)) * multiplier
+    basis = ma(window,values=values)
+    dev = np.std(rolling_window(values,window),axis=1) * multiplier
 
     upper = basis + dev
     lower = basis - dev
-    diff = len(prices) - upper.size
-    
-    for i in range(diff,len(prices)):
-        prices[i][name+"_lower"] = lower[i-diff]
-        prices[i][name+"_upper"] = upper[i-diff]
+    if prices is not None:
+        _store(prices, name+"_lower", lower)
+        _store(prices, name+"_upper", upper)
 
     return upper, lower, basis
 
 
 def net_change(prices):
-    for p in prices:
-        p['net_change'] = p['closePrice']['mid'] - p['openPrice']['mid']
-
-def ema(window, prices = None, name = None, values= None):
-    def numpy_ewma_vectorized_v2(data, window):
-
-        alpha = 2 /(window + 1.0)
-        alpha_rev = 1-alpha
-        n = data.shape[0]
-
-        pows = alpha_rev**(np.arange(n+1))
-
-        scale_arr = 1/pows[:-1]
-        offset = data[0]*pows[1:]
-        pw0 = alpha*alpha_rev**(n-1)
-
-        mult = data*pw0*scale_arr
-        cumsums = mult.cumsum()
-        out = offset + cumsums*scale_arr[::-1]
-        return out
+    _store(prices, 'net_change', _column(prices,'closePrice') - _column(prices,'openPrice'))
 
+def _ewma(data, alpha):
+    """exponentially weighted average started from the first value"""
+    data = np.asarray(data, dtype=float)
+    if data.size == 0:
+        return data
+    return linear_recurrence(1-alpha, alpha*data, data[0])
 
+def ema(window, prices = None, name = None, values= None):
     if values is None:
         if prices is None:
             raise Exception("values or prices or both must be supplied")
-        values = np.asarray([x['closePrice']['mid'] for x in prices])
+        values = _column(prices)
     else:
         values = np.asarray(values)
 
-    a = numpy_ewma_vectorized_v2(values,window)
+    a = _ewma(values, 2 /(window + 1.0))
 
     if prices is not None:
         if name is None:
             name = "ema_{}".format(window)
         
-        price_len = len(prices)
-        diff = price_len - len(a)
-        
-        for i in range(diff,price_len):
-            prices[i][name] = a[i-diff]
+        _store(prices, name, a)
     return a
 
 def rma(window, prices = None, name = None, values= None):
-    def numpy_rewma_vectorized_v2(data, window):
-
-        alpha = window
-        alpha_rev = 1-alpha
-        n = data.shape[0]
-
-        pows = alpha_rev**(np.arange(n+1))
-
-        scale_arr = 1/pows[:-1]
-        offset = data[0]*pows[1:]
-        pw0 = alpha*alpha_rev**(n-1)
-
-        mult = data*pw0*scale_arr
-        cumsums = mult.cumsum()
-        out = offset + cumsums*scale_arr[::-1]
-        return out
-
-
     if values is None:
         if prices is None:
             raise Exception("values or prices or both must be supplied")
-        values = np.asarray([x['closePrice']['mid'] for x in prices])
+        values = _column(prices)
     else:
         values = np.asarray(values)
 
-    a = numpy_rewma_vectorized_v2(values,window)
+    a = _ewma(values, 1.0/window)
 
     if prices is not None:
         if name is None:
             name = "rma_{}".format(window)
         
-        price_len = len(prices)
-        diff = price_len - len(a)
-        
-        for i in range(diff,price_len):
-            prices[i][name] = a[i-diff]
+        _store(prices, name, a)
     return a
 
 def linreg(prices):
-    highs = np.asarray([x['highPrice']['mid'] for x in prices])
-    lows = np.asarray([x['lowPrice']['mid'] for x in prices])
+    highs = _column(prices,'highPrice')
+    lows = _column(prices,'lowPrice')
     mid = (highs + lows) / 2
 
     x = np.arange(0, len(mid))
@@ -197,7 +174,7 @@ def ma(window, prices = None, values = None, name = None):
     if values is None:
         if prices is None:
             raise Exception("values or prices or both must be supplied")
-        values = np.asarray([x['closePrice']['mid'] for x in prices])
+        values = _column(prices)
     else:
         values = np.asarray(values)
 
@@ -206,11 +183,7 @@ def ma(window, prices = None, values = None, name = None):
         if name is None:
             name = "ma_{}".format(window)
 
-        price_len = len(prices)
-        diff = price_len - len(a)
-        
-        for i in range(diff,price_len):
-            prices[i][name] = a[i-diff]
+        _store(prices, name, a)
     
     return a
 
@@ -220,9 +193,8 @@ def macd(prices,fast=12,slow=26,signal=9):
     macd = np.subtract(fast_ema,slow_ema)
     sig = ema(signal,prices,name="macd_signal",values=macd)
     histo = np.subtract(macd,sig)
-    for i in range(0,len(prices)):
-        prices[i]['macd'] = macd[i]
-        prices[i]['macd_histogram'] = histo[i]
+    _store(prices, 'macd', macd)
+    _store(prices, 'macd_histogram', histo)
 
     return macd, histo
 
@@ -230,15 +202,18 @@ def mfi(prices,length=14):
     try:
         name = 'mfi_{}'.format(length)
 
-        unassigned = [x for x in prices if name not in x]
+        if isinstance(prices, BarSeries):
+            unassigned = np.count_nonzero(np.isnan(prices.extra(name)))
+        else:
+            unassigned = len([x for x in prices if name not in x])
 
-        required = len(unassigned) - length
+        required = unassigned - length
         need_len = required * length
 
-        volumes = np.asarray([x['lastTradedVolume'] for x in prices])
-        tp = np.asarray([x['typicalPrice']['mid'] for x in prices])
+        volumes = _column(prices,'lastTradedVolume')
+        tp = _column(prices,'typicalPrice')
 
-        if(len(unassigned)<len(prices)):
+        if(unassigned<len(prices)):
 
             volumes = volumes[-need_len:]
             tp = tp[-need_len:] 
@@ -262,15 +237,9 @@ def mfi(prices,length=14):
 
         mfi = 100. - (100. / (1. + ratio))
 
-        len_diff = len(prices) - len(mfi)
-
-        for i in range(len_diff,len(prices)):
+        _store(prices, name, mfi)
 
-            prices[i][name] = mfi[i-len_diff]
-        
-        outmfi = [x[name] for x in prices if name in x]
-
-        return outmfi
+        return _stored(prices, name, mfi)
     except Exception as e:
         exc_type, exc_obj, exc_tb = sys.exc_info()
         fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
@@ -302,41 +271,24 @@ def mfi_super(prices,length=14,smooth=9):
 
     super_mfi = 100. - (100. / (1. + ratio))
 
-    len_diff = len(prices) - len(super_mfi)
+    _store(prices, name, super_mfi)
 
-    for i in range(len_diff,len(prices)):
-
-        prices[i][name] = super_mfi[i-len_diff]
-    
-    outmfi = [x[name] for x in prices if name in x]
-
-    return outmfi
+    return _stored(prices, name, super_mfi)
     
 
 
 def obv(prices, smooth=10):
-    vals = []
-    for i in range(1,len(prices)):
-        diff = prices[i]['closePrice']['mid'] - prices[i-1]['closePrice']['mid']
-        val = 0
-        if diff > 0:
-            val = prices[i]['lastTradedVolume']
-        elif diff < 0:
-            val = -prices[i]['lastTradedVolume']
-        else:
-            val = 0
-        vals.append(val)
+    closes = _column(prices)
+    volumes = _column(prices,'lastTradedVolume')[1:]
+    diff = np.diff(closes)
+    vals = np.where(diff > 0, volumes, np.where(diff < 0, -volumes, 0))
     
-    obv = np.cumsum(np.array(vals))
+    obv = np.cumsum(vals)
     signal = wma(10,values=obv)
     obv = obv[len(obv) - len(signal):]
     histo = np.subtract(obv,signal)
 
-    len_diff = len(prices) - len(histo)
-
-    for i in range(len_diff,len(prices)):
-        prices[i]['obv_{}'.format(smooth)] = histo[i-len_diff]
-    
+    _store(prices, 'obv_{}'.format(smooth), histo)
 
     return histo
 
@@ -345,12 +297,14 @@ def psar(prices, iaf = 0.02, maxaf = 0.2):
     barsdata = prices
     length = len(barsdata)
     dates = [x['snapshotTime'] for x in barsdata]
-    high = [x['highPrice']['mid'] for x in barsdata]
-    low = [x['lowPrice']['mid'] for x in barsdata]
-    close = [x['closePrice']['mid'] for x in barsdata]
+    high = _column(barsdata,'highPrice').tolist()
+    low = _column(barsdata,'lowPrice').tolist()
+    close = _column(barsdata,'closePrice').tolist()
     psar = close[0:len(close)]
     psarbull = [None] * length
     psarbear = [None] * length
+    # the stop depends on the direction, af and extremes from the bar before so
+    # this stays a loop, but over plain floats with the results stored in one go
     bull = True
     af = iaf
     hp = high[0]
@@ -399,12 +353,18 @@ def psar(prices, iaf = 0.02, maxaf = 0.2):
                     
         if bull:
             psarbull[i] = psar[i]
-            prices[i]['psar_bull'] = psar[i]
-            prices[i]['psar_bear'] = ''
         else:
             psarbear[i] = psar[i]
-            prices[i]['psar_bear'] = psar[i]
-            prices[i]['psar_bull'] = ''
+
+    if isinstance(prices, BarSeries):
+        bulls = np.array(psarbull[2:], dtype=float)
+        bears = np.array(psarbear[2:], dtype=float)
+        _store(prices, 'psar_bull', bulls)
+        _store(prices, 'psar_bear', bears)
+    elif WRITE_BACK:
+        for i in range(2,length):
+            prices[i]['psar_bull'] = '' if psarbull[i] is None else psarbull[i]
+            prices[i]['psar_bear'] = '' if psarbear[i] is None else psarbear[i]
 
     return {"dates":dates, "high":high, "low":low, "close":close, "psar":psar, "psarbear":psarbear, "psarbull":psarbull}
 
@@ -412,18 +372,15 @@ def roc(window=12,prices = None, values = None, name = None):
     if values is None:
         if prices is None:
             raise Exception("values or prices or both must be supplied")
-        values = np.asarray([x['closePrice']['mid'] for x in prices])
+        values = _column(prices)
     else:
         values = np.asarray(values)
     
     if name is None:
         name = "roc"
-    rs = []
-    for i in range(window,len(values)):
-        r = (values[i] - values[i-window])/values[i-window]
-        rs.append(r)
-        if prices is not None:
-            prices[i][name] = r
+    rs = (values[window:] - values[:len(values)-window]) / values[:len(values)-window]
+    if prices is not None:
+        _store(prices, name, rs)
 
     return rs
 
@@ -432,7 +389,7 @@ def rsi(window = 14, prices = None, values = None, name = None):
     if values is None:
         if prices is None:
             raise Exception("values or prices or both must be supplied")
-        values = np.asarray([x['closePrice']['mid'] for x in prices])
+        values = _column(prices)
     else:
         values = np.asarray(values)
     n = window
@@ -440,7 +397,6 @@ def rsi(window = 14, prices = None, values = None, name = None):
     seed = deltas[:n+1]
     up = seed[seed>=0].sum()/n
     down = -seed[seed<0].sum()/n
-    rs = up/down
     rsi = np.zeros_like(values)
     # rsi[:n] = 100. - 100./(1.+rs)
     # rsi[:n] = -1
@@ -448,34 +404,20 @@ def rsi(window = 14, prices = None, values = None, name = None):
     if name is None:
         name = "rsi_{}".format(window)
 
-    for i in range(n, len(values)):
-        delta = deltas[i-1] # cause the diff is 1 shorter
-
-        if delta>0:
-            upval = delta
-            downval = 0.
-        else:
-            upval = 0.
-            downval = -delta
-
-        up = (up*(n-1) + upval)/n
-        down = (down*(n-1) + downval)/n
-
-        rs = up/down
-        rsi[i] = 100. - 100./(1.+rs)
-        if prices is not None:
-            prices[i][name] = rsi[i]
+    # wilder smoothing of the gains and losses, rsi[i] takes deltas[i-1]
+    changes = deltas[n-1:]
+    ups = linear_recurrence((n-1.)/n, np.maximum(changes, 0.)/n, up)
+    downs = linear_recurrence((n-1.)/n, np.maximum(-changes, 0.)/n, down)
+    rsi[n:] = 100. - 100./(1.+ups/downs)
+    if prices is not None:
+        _store(prices, name, rsi[n:])
 
     return rsi
 
 def rvi(prices, N=10):
-    close_price = [x['closePrice']['mid'] for x in prices]
-    open_price = [x['openPrice']['mid'] for x in prices]
-    high_price = [x['highPrice']['mid'] for x in prices]
-    low_price = [x['lowPrice']['mid'] for x in prices]
-    close_open = list(map(operator.sub,close_price,open_price))
+    close_open = _column(prices,'closePrice') - _column(prices,'openPrice')
 
-    high_low = list(map(operator.sub,high_price,low_price))
+    high_low = _column(prices,'highPrice') - _column(prices,'lowPrice')
     
     close_open = swma(close_open)
     
@@ -491,42 +433,26 @@ def rvi(prices, N=10):
     hist = np.subtract(rvi,sig)
     
 
-    price_len = len(prices)
-    diff = price_len - len(sig)
-    
-    for i in range(diff,price_len):
-        prices[i]['rvi'] = rvi[i-diff]
-        prices[i]['rvi_signal'] = sig[i-diff]
-        prices[i]['rvi_histogram'] = hist[i-diff]
+    _store(prices, 'rvi', rvi)
+    _store(prices, 'rvi_signal', sig)
+    _store(prices, 'rvi_histogram', hist)
 
 def stochastic(prices, length=5, smoothK=3, smoothD = 3):
     """Calculate stochastic indicator for timeframe"""
 
-    def stoch(close,highs,lows):
-        high = np.max(highs)
-        low = np.min(lows)
-        close = close[-1]
-        k =((close - low)/(high - low)) * 100
-        return k
-
-    highs = rolling_window(np.asarray([x['highPrice']['mid'] for x in prices]),length)
-    lows = rolling_window(np.asarray([x['lowPrice']['mid'] for x in prices]),length)
-    closes = rolling_window(np.asarray([x['closePrice']['mid'] for x in prices]),length)
-    ks = []
-    for i in range(0,len(closes)):
-        ks.append(stoch(closes[i],highs[i],lows[i]))
+    high = np.max(rolling_window(_column(prices,'highPrice'),length),axis=1)
+    low = np.min(rolling_window(_column(prices,'lowPrice'),length),axis=1)
+    close = _column(prices,'closePrice')[length-1:]
+    ks = ((close - low)/(high - low)) * 100
 
     k = ma(smoothK,values = ks)
     d = ma(smoothD,values = k)
 
     k = k[len(k) - len(d):]
 
-    price_len = len(prices)
-    diff = price_len - len(d)
     name = "{}_{}_{}".format(length,smoothK,smoothD)
-    for i in range(diff,price_len):
-        prices[i]['stoch_k_{}'.format(name)] = k[i-diff]
-        prices[i]['stoch_d_{}'.format(name)] = d[i-diff]
+    _store(prices, 'stoch_k_{}'.format(name), k)
+    _store(prices, 'stoch_d_{}'.format(name), d)
 
     return k,d
 
@@ -540,7 +466,7 @@ def tema(window,prices = None, values = None, name = None):
     if values is None:
         if prices is None:
             raise Exception("values or prices or both must be supplied")
-        values = np.asarray([x['closePrice']['mid'] for x in prices])
+        values = _column(prices)
     else:
         values = np.asarray(values)
 
@@ -552,11 +478,7 @@ def tema(window,prices = None, values = None, name = None):
         if name is None:
             name = "tema_{}".format(window)
 
-        price_len = len(prices)
-        diff = price_len - len(a)
-        
-        for i in range(diff,price_len):
-            prices[i][name] = a[i-diff]
+        _store(prices, name, a)
     
     return a
         
@@ -578,22 +500,16 @@ def trend(values):
     return 0
 
 def vwma(window,prices):
-    closes = np.asarray([x['closePrice']['mid'] for x in prices])
-    volume = np.asarray([x['lastTradedVolume'] for x in prices])
+    closes = _column(prices)
+    volume = _column(prices,'lastTradedVolume')
 
     weights = ma(window,values = np.multiply(closes, volume))
     volumes = ma(window,values = volume)
 
     vwma = np.divide(weights,volumes)
 
-    price_len = len(prices)
-    diff = price_len - vwma.size
-
-    name = "vwma_{}".format(window)
+    _store(prices, "vwma_{}".format(window), vwma)
 
-    for i in range(diff,price_len):
-        prices[i][name] = vwma[i-diff]
-        
     return vwma
 
 
@@ -606,7 +522,7 @@ def wma(window, prices = None, values = None, name = None):
     if values is None:
         if prices is None:
             raise Exception("values or prices or both must be supplied")
-        values = np.asarray([x['closePrice']['mid'] for x in prices])
+        values = _column(prices)
     else:
         values = np.asarray(values)
     
@@ -617,11 +533,7 @@ def wma(window, prices = None, values = None, name = None):
         if name is None:
             name = "wma_{}".format(window)
 
-        price_len = len(prices)
-        diff = price_len - len(a)
-        
-        for i in range(diff,price_len):
-            prices[i][name] = a[i-diff]
+        _store(prices, name, a)
         
 
     return a
@@ -635,3 +547,22 @@ def rolling_window(a, window):
     shape = a.shape[:-1] + (a.shape[-1] - window + 1, window)
     strides = a.strides + (a.strides[-1],)
     return np.lib.stride_tricks.as_strided(a, shape=shape, strides=strides)
+
+def linear_recurrence(decay, values, initial=0.0):
+    """y[i] = decay*y[i-1] + values[i] with y[-1] = initial, for a constant decay in [0,1)
+    Each chunk is done with a cumsum scaled by powers of decay, the chunks are
+    kept short enough that those powers can't underflow."""
+    values = np.asarray(values, dtype=float)
+    out = np.empty_like(values)
+    if decay == 0:
+        out[:] = values
+        return out
+    chunk = int(min(256, max(1, 100 / -np.log10(decay))))
+    carry = initial
+    for start in range(0, values.size, chunk):
+        x = values[start:start+chunk]
+        pows = decay ** np.arange(1, x.size+1)
+        y = pows * (carry + np.cumsum(x / pows))
+        out[start:start+chunk] = y
+        carry = y[-1]
+    return out
@@ -0,0 +1,180 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from .trade import TradeState
+
+logger = logging.getLogger(__name__)
+
+# how long the writer gathers records before writing and fsyncing them in one go
+FLUSH_INTERVAL = 0.5
+# start a new journal file once it's this big, keeping the one before it
+ROTATE_SIZE = 4 * 1024 * 1024
+
+
+class TradeJournal:
+    """Write-behind store of the trades, trades/journal.jsonl and trades/<state>/*.json
+
+    Every status message and change of state or deal id is one line appended
+    to the journal (record), and now and then the whole trade is written out
+    to its file under trades/open, closed or failed (snapshot) - the layout
+    save_trade always wrote. Both just queue the work: a writer thread takes
+    whatever's queued every FLUSH_INTERVAL, appends the lines and fsyncs once,
+    and writes only the newest snapshot of each trade. So logging costs the
+    size of the message rather than the trade's whole history, and nothing on
+    the streaming thread waits on the disk.
+
+    Snapshots carry the sequence number of the last record they include, and
+    recover replays the records after it onto a trade loaded from its file.
+    """
+
+    def __init__(self, root="trades/", flush_interval=FLUSH_INTERVAL, rotate_size=ROTATE_SIZE):
+        self.root = root
+        self.flush_interval = flush_interval
+        self.rotate_size = rotate_size
+        self.path = os.path.join(root, "journal.jsonl")
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.dirs = set()
+        # file name: [records since its snapshot], from the journal on disk
+        self.pending = {}
+        self.seq = self.load()
+        self.fh = None
+        self.thread = threading.Thread(target=self._run, name="auto_ig-journal", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def load(self):
+        """index the records in the journal files by trade, returns the last sequence number"""
+        seq = 0
+        for path in (self.path + ".1", self.path):
+            if not os.path.isfile(path):
+                continue
+            with open(path, "r") as fh:
+                for line in fh:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        # a line cut short by a crash
+                        continue
+                    self.pending.setdefault(rec['file'], []).append(rec)
+                    seq = max(seq, rec['seq'])
+        return seq
+
+    def record(self, trade, kind, value, timestamp=None):
+        """journal a 'log' message, or the new 'state' or 'deal_id' of trade"""
+        with self.lock:
+            self.seq += 1
+            rec = {"seq": self.seq, "file": trade.file_name(), "kind": kind, "value": value}
+        if timestamp is not None:
+            rec['timestamp'] = timestamp
+        self.queue.put(("record", rec))
+
+    def mark(self, save_object):
+        """note in a trade's dict (Trade.to_json) that it has everything journaled so far"""
+        with self.lock:
+            save_object['journal_seq'] = self.seq
+        return save_object
+
+    def snapshot(self, file_name, state, save_object):
+        """write out a whole trade - save_object is save_trade's dict, and mustn't change after"""
+        self.mark(save_object)
+        self.queue.put(("snapshot", (file_name, state, save_object)))
+
+    def recover(self, file_name, json_data):
+        """json_data of a trade's file with the records journaled since it was written applied"""
+        since = json_data.get('journal_seq', -1)
+        json_data.setdefault('status_log', [])
+        for rec in self.pending.pop(file_name, []):
+            if rec['seq'] <= since:
+                continue
+            if rec['kind'] == "log":
+                json_data['status_log'].append({"timestamp": rec.get('timestamp'), "message": rec['value']})
+            else:
+                json_data[rec['kind']] = rec['value']
+        return json_data
+
+    def flush(self):
+        """block until everything queued so far is on disk"""
+        done = threading.Event()
+        self.queue.put(("flush", done))
+        done.wait()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(("close", None))
+            self.thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1][0] == "record" or batch[-1][0] == "snapshot":
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=wait))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception:
+                logger.info("Couldn't write the trade journal", exc_info=True)
+            for kind, item in batch:
+                if kind == "flush":
+                    item.set()
+                elif kind == "close":
+                    if self.fh is not None:
+                        self.fh.close()
+                        self.fh = None
+                    return
+
+    def _write(self, batch):
+        lines = []
+        snapshots = {}
+        for kind, item in batch:
+            if kind == "record":
+                lines.append(json.dumps(item, default=str))
+            elif kind == "snapshot":
+                snapshots[item[0]] = item
+        if lines:
+            self._append(lines)
+        for file_name, state, save_object in snapshots.values():
+            self._save(file_name, state, save_object)
+
+    def _append(self, lines):
+        if self.fh is None:
+            self._mkdir(self.root)
+            self.fh = open(self.path, "a")
+        self.fh.write("\n".join(lines) + "\n")
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+        if self.fh.tell() > self.rotate_size:
+            self.fh.close()
+            self.fh = None
+            os.replace(self.path, self.path + ".1")
+
+    def _save(self, file_name, state, save_object):
+        folder = {TradeState.CLOSED: "closed", TradeState.FAILED: "failed"}.get(state, "open")
+        if folder != "open":
+            # delete the old open file
+            try:
+                os.remove(os.path.join(self.root, "open", file_name))
+            except OSError:
+                pass
+        path = os.path.join(self.root, folder)
+        self._mkdir(path)
+        path = os.path.join(path, file_name)
+        with open(path + ".tmp", "w") as fh:
+            json.dump(save_object, fh, default=str)
+        os.replace(path + ".tmp", path)
+
+    def _mkdir(self, path):
+        if path not in self.dirs:
+            os.makedirs(path, exist_ok=True)
+            self.dirs.add(path)
@@ -13,15 +13,12 @@
 #  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
+import asyncio
 import logging
-import sys
-import logging
+import ssl
 import threading
-import time
-import traceback
 
 
-from urllib.request import urlopen as _urlopen
 from urllib.parse import (urlparse as parse_url, urljoin, urlencode)
 
 def _url_encode(params):
@@ -52,6 +49,16 @@ ERROR_CMD = "ERROR"
 SYNC_ERROR_CMD = "SYNC ERROR"
 OK_CMD = "OK"
 
+# bytes read off a connection at a time
+READ_SIZE = 65536
+# seconds the blocking methods wait on the stream thread
+CALL_TIMEOUT = 30
+# give up on a stream with nothing on it (not even a PROBE) for this long
+STREAM_TIMEOUT = 60
+# back off between attempts to get a session back, doubling up to RETRY_MAX
+RETRY_MIN = 1
+RETRY_MAX = 60
+
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 fh = logging.FileHandler('faig_debug.log')
@@ -66,99 +73,271 @@ log.addHandler(fh)
 log.addHandler(ch)
 
 
+class _Body(object):
+    """The payload of an HTTP response, read a block at a time and
+    de-chunked if it came with Transfer-Encoding: chunked.
+    """
+
+    def __init__(self, reader, headers):
+        self._reader = reader
+        self._chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        self._remaining = None
+        if not self._chunked and "content-length" in headers:
+            self._remaining = int(headers["content-length"])
+        self._chunk_left = 0
+        self.done = False
+
+    async def read(self):
+        """The next block of the body, b'' once it's all been read."""
+        if self.done:
+            return b''
+        if self._chunked:
+            if self._chunk_left == 0:
+                size = int((await self._reader.readline()).split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    # skip any trailers up to the blank line
+                    while (await self._reader.readline()).strip():
+                        pass
+                    self.done = True
+                    return b''
+                self._chunk_left = size
+            data = await self._reader.read(min(self._chunk_left, READ_SIZE))
+            if not data:
+                raise asyncio.IncompleteReadError(b'', self._chunk_left)
+            self._chunk_left -= len(data)
+            if self._chunk_left == 0:
+                await self._reader.readexactly(2)
+            return data
+        if self._remaining == 0:
+            self.done = True
+            return b''
+        size = READ_SIZE if self._remaining is None else min(self._remaining, READ_SIZE)
+        data = await self._reader.read(size)
+        if not data:
+            self.done = True
+            return b''
+        if self._remaining is not None:
+            self._remaining -= len(data)
+        return data
+
+    async def read_all(self):
+        blocks = []
+        while True:
+            data = await self.read()
+            if not data:
+                return b''.join(blocks)
+            blocks.append(data)
+
+
+class _Lines(object):
+    """Splits a response body into lines, a whole block of them per read."""
+
+    def __init__(self, body):
+        self._body = body
+        self._buffer = b''
+        self._lines = []
+        self._next = 0
+
+    async def readline(self):
+        """The next line without its line break, None at the end of the body."""
+        while self._next == len(self._lines):
+            data = await self._body.read()
+            if not data:
+                if self._buffer:
+                    line, self._buffer = self._buffer, b''
+                    return line.decode("utf-8").rstrip("\r")
+                return None
+            lines = (self._buffer + data).split(b'\n')
+            self._buffer = lines.pop()
+            self._lines = lines
+            self._next = 0
+        line = self._lines[self._next]
+        self._next += 1
+        return line.decode("utf-8").rstrip("\r")
+
+
+class _Connection(object):
+    """An HTTP/1.1 connection that POSTs form encoded requests. Requests can
+    be written before the responses to earlier ones have been read, they come
+    back in the order they were sent.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.reader = None
+        self.writer = None
+
+    async def open(self):
+        secure = self.url.scheme == "https"
+        port = self.url.port or (443 if secure else 80)
+        self.reader, self.writer = await asyncio.open_connection(
+            self.url.hostname, port, ssl=ssl.create_default_context() if secure else None)
+
+    def send(self, path, params):
+        body = _url_encode(dict([(k, v) for (k, v) in _iteritems(params) if v]))
+        head = ("POST {0} HTTP/1.1\r\n"
+                "Host: {1}\r\n"
+                "Content-Type: application/x-www-form-urlencoded\r\n"
+                "Content-Length: {2}\r\n\r\n").format(
+                    urljoin(self.url.path or "/", path), self.url.netloc, len(body))
+        self.writer.write(head.encode("latin-1") + body)
+
+    async def response(self):
+        """(status, headers, body) of the next response"""
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed before the response")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            key, value = line.split(":", 1)
+            headers[key.strip().lower()] = value.strip()
+        return status, headers, _Body(self.reader, headers)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
 class Subscription(object):
-    """Represents a Subscription to be submitted to a Lightstreamer Server."""
+    """Represents a Subscription to be submitted to a Lightstreamer Server.
 
-    def __init__(self, mode, items, fields, adapter=""):
+    Every item has one record, a list with a slot per field, that updates are
+    decoded straight into: only the fields an update carries are touched and
+    each is parsed just the once, by parsers[field] if there is one. targets
+    is an optional object per item (eg. its Market) handed to record listeners
+    with the record, so they don't have to work it out from the item name.
+    """
+
+    def __init__(self, mode, items, fields, adapter="", targets=None, parsers=None):
         self.item_names = items
-        self._items_map = {}
         self.field_names = fields
+        self.slots = dict((f, i) for i, f in enumerate(fields))
+        self.targets = list(targets) if targets is not None else [None] * len(items)
+        self._parsers = [(parsers or {}).get(f) for f in fields]
+        self._records = [[None] * len(fields) for _ in items]
         self.adapter = adapter
         self.mode = mode
         self.snapshot = "true"
         self._listeners = []
-
-    def _decode(self, value, last):
-        """Decode the field value according to
-        Lightstremar Text Protocol specifications.
-        """
-        if value == "$":
-            return u''
-        elif value == "#":
-            return None
-        elif not value:
-            return last
-        elif value[0] in "#$":
-            value = value[1:]
-
-        return value
+        self._record_listeners = []
 
     def addlistener(self, listener):
+        """listener(item_info) gets a dict per update: pos, name and the values by field name"""
         self._listeners.append(listener)
 
+    def add_record_listener(self, listener):
+        """listener(target, record) gets the item's target and its record per update"""
+        self._record_listeners.append(listener)
+
+    def record(self, item_pos):
+        return self._records[item_pos - 1]
+
     def notifyupdate(self, item_line):
         """Invoked by LSClient each time Lightstreamer Server pushes
         a new item event.
         """
         # Tokenize the item line as sent by Lightstreamer
         toks = item_line.rstrip('\r\n').split('|')
-        undecoded_item = dict(list(zip(self.field_names, toks[1:])))
-
-        # Retrieve the previous item stored into the map, if present.
-        # Otherwise create a new empty dict.
         item_pos = int(toks[0])
-        curr_item = self._items_map.get(item_pos, {})
-        # Update the map with new values, merging with the
-        # previous ones if any.
-        self._items_map[item_pos] = dict([
-            (k, self._decode(v, curr_item.get(k))) for k, v
-            in list(undecoded_item.items())
-        ])
-        # Make an item info as a new event to be passed to listeners
-        item_info = {
-            'pos': item_pos,
-            'name': self.item_names[item_pos - 1],
-            'values': self._items_map[item_pos]
-        }
-
-        # Update each registered listener with new event
-        for on_item_update in self._listeners:
-            on_item_update(item_info)
+        record = self._records[item_pos - 1]
+        parsers = self._parsers
+
+        # Decode according to the Lightstreamer Text Protocol: an empty
+        # value is unchanged, $ is empty, # is null, and a leading # or $
+        # on anything else is escaped
+        for i in range(len(toks) - 1):
+            value = toks[i + 1]
+            if not value:
+                continue
+            if value == "$":
+                value = u''
+            elif value == "#":
+                value = None
+            else:
+                if value[0] in "#$":
+                    value = value[1:]
+                if parsers[i] is not None:
+                    value = parsers[i](value)
+            record[i] = value
+
+        for on_record_update in self._record_listeners:
+            on_record_update(self.targets[item_pos - 1], record)
+
+        if self._listeners:
+            # Make an item info as a new event to be passed to listeners
+            item_info = {
+                'pos': item_pos,
+                'name': self.item_names[item_pos - 1],
+                'values': dict(zip(self.field_names, record))
+            }
+            for on_item_update in self._listeners:
+                on_item_update(item_info)
 
 
 class LSClient(object):
-    """Manages the communication with Lightstreamer Server"""
+    """Manages the communication with Lightstreamer Server
+
+    Everything runs on an asyncio loop in its own thread; the methods here
+    block the calling thread until the loop's done the work, so they can't be
+    called from a listener. The stream is read a block at a time. On LOOP it
+    rebinds to the same session, and if the session is lost (SYNC ERROR, END,
+    a dropped or silent connection) a new one is created and every
+    subscription is added to it again. Control requests go down one
+    keep-alive connection, several at once where there are several to make.
+    """
 
     def __init__(self, base_url, adapter_set="", user="", password=""):
         self._base_url = parse_url(base_url)
+        self._control_url = self._base_url
         self._adapter_set = adapter_set
         self._user = user
         self._password = password
         self._session = {}
         self._subscriptions = {}
         self._current_subscription_key = 0
-        self._stream_connection = None
-        self._stream_connection_thread = None
         self._bind_counter = 0
-
-    def _encode_params(self, params):
-        """Encode the parameter for HTTP POST submissions, but
-        only for non empty values..."""
-        return _url_encode(
-            dict([(k, v) for (k, v) in _iteritems(params) if v])
-        )
-
-    def _call(self, base_url, url, body):
-        """Open a network connection and performs HTTP Post
-        with provided body.
-        """
-        # Combines the "base_url" with the
-        # required "url" to be used for the specific request.
-        try:
-            url = urljoin(base_url.geturl(), url)
-            return _urlopen(url, data=self._encode_params(body))
-        except Exception as e:
-            log.info(e)
+        self._stream_timeout = STREAM_TIMEOUT
+        self._loop = None
+        self._thread = None
+        self._stream_task = None
+        self._stream_connection = None
+        self._control_connection = None
+        self._control_lock = None
+        self._closing = False
+
+    @property
+    def connected(self):
+        """True while there's a session, or one is being got back"""
+        return self._stream_task is not None and not self._stream_task.done()
+
+    def _run(self, coro, timeout=CALL_TIMEOUT):
+        """Run a coroutine on the stream thread and wait for the result."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("LSClient can't block its own stream thread")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def _start_loop(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._control_lock = asyncio.Lock()
+            self._loop.call_soon(ready.set)
+            self._loop.run_forever()
+            self._loop.close()
+
+        self._thread = threading.Thread(name="STREAM-CONN-THREAD", target=run)
+        self._thread.daemon = True
+        self._thread.start()
+        ready.wait()
 
     def _set_control_link_url(self, custom_address=None):
         """Set the address to use for the Control Connection
@@ -172,24 +351,45 @@ class LSClient(object):
                 scheme=self._base_url[0]
             )
 
-    def _control(self, params):
-        """Create a Control Connection to send control commands
-        that manage the content of Stream Connection.
-        """
-        params["LS_session"] = self._session["SessionId"]
-        response = self._call(self._control_url, CONTROL_URL_PATH, params)
-        return response.readline().decode("utf-8").rstrip()
-
-    def _read_from_stream(self):
-        """Read a single line of content of the Stream Connection."""
-        line = self._stream_connection.readline().decode("utf-8").rstrip()
-        return line
-
-    def connect(self):
-        """Establish a connection to Lightstreamer Server to create
-        a new session.
-        """
-        self._stream_connection = self._call(
+    async def _open_stream(self, url, path, params):
+        """POST for a stream connection and read the session info off it,
+        returns the connection and the line reader for the rest."""
+        connection = _Connection(url)
+        try:
+            await connection.open()
+            connection.send(path, params)
+            await connection.writer.drain()
+            status, headers, body = await connection.response()
+            lines = _Lines(body)
+            stream_line = await lines.readline()
+            if stream_line != OK_CMD:
+                error = [stream_line or ""]
+                while len(error) < 4:
+                    line = await lines.readline()
+                    if line is None:
+                        break
+                    error.append(line)
+                log.error("Server response error: \n{0}".format("\n".join(error)))
+                raise IOError("Lightstreamer refused the session: {0}".format(" ".join(error)))
+
+            session = {}
+            while True:
+                line = await lines.readline()
+                if not line:
+                    break
+                session_key, session_value = line.split(":", 1)
+                session[session_key] = session_value
+        except BaseException:
+            connection.close()
+            raise
+        self._session.update(session)
+        keepalive = int(self._session.get("KeepaliveMillis", 0)) / 1000.0
+        self._stream_timeout = max(STREAM_TIMEOUT, 3 * keepalive)
+        return connection, lines
+
+    async def _create_session(self):
+        self._session.clear()
+        connection, lines = await self._open_stream(
             self._base_url,
             CONNECTION_URL_PATH,
             {
@@ -199,130 +399,249 @@ class LSClient(object):
              "LS_user": self._user,
              "LS_password": self._password}
         )
-        stream_line = self._read_from_stream()
-        self._handle_stream(stream_line)
+        # Setup of the control link url, it may have moved with the new session
+        self._set_control_link_url(self._session.get("ControlAddress"))
+        self._close_control()
+        return connection, lines
 
-    def bind(self):
+    async def _bind(self):
         """Replace a completely consumed connection in listening for an active
         Session.
         """
-        self._stream_connection = self._call(
+        connection, lines = await self._open_stream(
             self._control_url,
             BIND_URL_PATH,
             {
              "LS_session": self._session["SessionId"]
              }
         )
-
         self._bind_counter += 1
-        stream_line = self._read_from_stream()
-        self._handle_stream(stream_line)
-
-    def _handle_stream(self, stream_line):
-        if stream_line == OK_CMD:
-            # Parsing session inkion
-            while 1:
-                next_stream_line = self._read_from_stream()
-                if next_stream_line:
-                    session_key, session_value = next_stream_line.split(":", 1)
-                    self._session[session_key] = session_value
-                else:
-                    break
+        return connection, lines
 
-            # Setup of the control link url
-            self._set_control_link_url(self._session.get("ControlAddress"))
+    def _close_control(self):
+        if self._control_connection is not None:
+            self._control_connection.close()
+            self._control_connection = None
 
-            # Start a new thread to handle real time updates sent
-            # by Lightstreamer Server on the stream connection.
-            self._stream_connection_thread = threading.Thread(
-                name="STREAM-CONN-THREAD-{0}".format(self._bind_counter),
-                target=self._receive
-            )
-            self._stream_connection_thread.setDaemon(True)
-            self._stream_connection_thread.start()
-        else:
-            lines = self._stream_connection.readlines()
-            lines.insert(0, stream_line)
-            log.error("Server response error: \n{0}".format("".join(lines)))
-            raise IOError()
-
-    def _join(self):
-        """Await the natural STREAM-CONN-THREAD termination."""
-        if self._stream_connection_thread:
-            log.debug("Waiting for thread to terminate")
-            self._stream_connection_thread.join()
-            self._stream_connection_thread = None
-            log.debug("Thread terminated")
+    async def _control(self, requests):
+        """Send a list of control requests down the control connection
+        without waiting for each answer, returns the first line of each response.
+        """
+        async with self._control_lock:
+            pending = list(requests)
+            results = []
+            retried = False
+            while pending:
+                try:
+                    if self._control_connection is None:
+                        self._control_connection = _Connection(self._control_url)
+                        await self._control_connection.open()
+                    connection = self._control_connection
+                    for params in pending:
+                        params = dict(params)
+                        params["LS_session"] = self._session["SessionId"]
+                        connection.send(CONTROL_URL_PATH, params)
+                    await connection.writer.drain()
+                    while pending:
+                        status, headers, body = await connection.response()
+                        text = (await body.read_all()).decode("utf-8")
+                        results.append(text.split("\n", 1)[0].rstrip("\r"))
+                        pending.pop(0)
+                        if headers.get("connection", "").lower() == "close":
+                            # the rest have to go again on a new connection
+                            self._close_control()
+                            break
+                except (OSError, asyncio.IncompleteReadError):
+                    self._close_control()
+                    if retried:
+                        raise
+                    retried = True
+            return results
+
+    def connect(self):
+        """Establish a connection to Lightstreamer Server to create
+        a new session.
+        """
+        self._start_loop()
+        self._closing = False
+        self._run(self._connect())
+
+    async def _connect(self):
+        self._stream_connection, lines = await self._create_session()
+        self._stream_task = self._loop.create_task(self._stream(lines))
+
+    async def _receive(self, lines):
+        """Handle messages off the stream until it stops, returns why."""
+        while True:
+            try:
+                message = await asyncio.wait_for(lines.readline(), self._stream_timeout)
+            except asyncio.TimeoutError:
+                log.warning("Nothing from Lightstreamer for {0}s".format(self._stream_timeout))
+                return "closed"
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                log.error("Communication error: {0}".format(e))
+                return "closed"
+
+            if message is None:
+                log.warning("No new message received")
+                return "closed"
+            elif not message or message == PROBE_CMD or message.startswith("Preamble"):
+                # Skipping PROBE and Preamble messages, keep on receiving messages.
+                continue
+            elif message.startswith(LOOP_CMD):
+                log.debug("LOOP")
+                return "loop"
+            elif message.startswith(SYNC_ERROR_CMD):
+                log.error("SYNC ERROR")
+                return "sync"
+            elif message.startswith(ERROR_CMD):
+                log.error("ERROR")
+                return "error"
+            elif message.startswith(END_CMD):
+                log.info("Connection closed by the server: {0}".format(message))
+                return "end"
+            else:
+                self._forward_update_message(message)
+
+    async def _stream(self, lines):
+        """Keep a stream going: rebind on LOOP, otherwise start a new session
+        and subscribe everything again, backing off while that fails."""
+        delay = RETRY_MIN
+        while True:
+            reason = await self._receive(lines)
+            self._stream_connection.close()
+            while True:
+                if self._closing:
+                    return
+                if reason == "error":
+                    # the server's turned us away, eg. the session tokens are stale
+                    log.error("Lightstreamer session ended with an error")
+                    self._session.clear()
+                    self._close_control()
+                    return
+                try:
+                    if reason == "loop":
+                        log.debug("Binding to this active session")
+                        self._stream_connection, lines = await self._bind()
+                    else:
+                        log.warning("Lightstreamer session lost ({0}), starting a new one".format(reason))
+                        self._stream_connection, lines = await self._create_session()
+                        await self._resubscribe()
+                    delay = RETRY_MIN
+                    break
+                except (OSError, asyncio.IncompleteReadError, KeyError) as e:
+                    log.warning("Couldn't get the session back ({0}), trying again in {1}s".format(e, delay))
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, RETRY_MAX)
+                    reason = "closed"
+
+    async def _resubscribe(self):
+        keys = sorted(self._subscriptions)
+        if keys:
+            responses = await self._control([self._add_params(k) for k in keys])
+            failed = [k for k, r in zip(keys, responses) if r != OK_CMD]
+            if failed:
+                log.warning("Couldn't resubscribe tables {0}".format(failed))
+            log.info("Resubscribed {0} tables".format(len(keys) - len(failed)))
+
+    def _add_params(self, key):
+        subscription = self._subscriptions[key]
+        return {
+            "LS_Table": key,
+            "LS_op": OP_ADD,
+            "LS_data_adapter": subscription.adapter,
+            "LS_mode": subscription.mode,
+            "LS_schema": " ".join(subscription.field_names),
+            "LS_id": " ".join(subscription.item_names),
+            "LS_snapshot": subscription.snapshot,
+        }
 
     def disconnect(self):
         """Request to close the session previously opened with
         the connect() invocation.
         """
+        if self._loop is None or not self._thread.is_alive():
+            log.warning("No connection to Lightstreamer")
+            return
+        self._closing = True
+        self._run(self._disconnect())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        log.debug("Connection closed")
+        print("DISCONNECTED FROM LIGHTSTREAMER")
+
+    async def _disconnect(self):
+        if self._stream_task is not None:
+            self._stream_task.cancel()
+            try:
+                await self._stream_task
+            except asyncio.CancelledError:
+                pass
         if self._stream_connection is not None:
-            # Close the HTTP connection
             self._stream_connection.close()
-            log.debug("Connection closed")
-            print("DISCONNECTED FROM LIGHTSTREAMER")
-        else:
-            log.warning("No connection to Lightstreamer")
+        self._close_control()
+        self._session.clear()
+        self._subscriptions.clear()
+        self._current_subscription_key = 0
 
     def destroy(self):
         """Destroy the session previously opened with
         the connect() invocation.
         """
-        if self._stream_connection is not None:
-            server_response = self._control({"LS_op": OP_DESTROY})
-            if server_response == OK_CMD:
-                # There is no need to explicitly close the connection,
-                # since it is handled by thread completion.
-                self._join()
-            else:
-                log.warning("No connection to Lightstreamer")
+        if self.connected and "SessionId" in self._session:
+            server_response = self._run(self._control([{"LS_op": OP_DESTROY}]))[0]
+            if server_response != OK_CMD:
+                log.warning("Lightstreamer didn't destroy the session: {0}".format(server_response))
+        self.disconnect()
 
     def subscribe(self, subscription):
         """"Perform a subscription request to Lightstreamer Server."""
-        # Register the Subscription with a new subscription key
-        self._current_subscription_key += 1
-        self._subscriptions[self._current_subscription_key] = subscription
-
-        # Send the control request to perform the subscription
-        server_response = self._control({
-            "LS_Table": self._current_subscription_key,
-            "LS_op": OP_ADD,
-            "LS_data_adapter": subscription.adapter,
-            "LS_mode": subscription.mode,
-            "LS_schema": " ".join(subscription.field_names),
-            "LS_id": " ".join(subscription.item_names),
-        })
-        log.debug("Server response ---> <{0}>".format(server_response))
-        return self._current_subscription_key
+        return self.subscribe_all([subscription])[0]
+
+    def subscribe_all(self, subscriptions):
+        """Subscribe several at once, the requests go together. Returns their keys."""
+        keys = []
+        for subscription in subscriptions:
+            # Register the Subscription with a new subscription key
+            self._current_subscription_key += 1
+            self._subscriptions[self._current_subscription_key] = subscription
+            keys.append(self._current_subscription_key)
+
+        responses = self._run(self._control([self._add_params(k) for k in keys]))
+        for key, server_response in zip(keys, responses):
+            log.debug("Server response ---> <{0}>".format(server_response))
+            if server_response != OK_CMD:
+                log.warning("Subscription {0} refused: {1}".format(key, server_response))
+        return keys
 
     def unsubscribe_all(self):
-        subs = self._subscriptions.copy()
-        for key in subs:
-            self.unsubscribe(key)
-
+        self.unsubscribe(*list(self._subscriptions))
 
-    def unsubscribe(self, subcription_key):
-        """Unregister the Subscription associated to the
-        specified subscription_key.
+    def unsubscribe(self, *subscription_keys):
+        """Unregister the Subscriptions associated to the
+        specified subscription keys.
         """
-        if subcription_key in self._subscriptions:
-            server_response = self._control({
-                "LS_Table": subcription_key,
-                "LS_op": OP_DELETE
-            })
-            log.debug("Server response ---> <{0}>".format(server_response))
+        keys = []
+        for key in subscription_keys:
+            if key in self._subscriptions:
+                keys.append(key)
+            else:
+                log.warning("No subscription key {0} found!".format(key))
+        if not keys:
+            return
 
+        if "SessionId" in self._session:
+            responses = self._run(self._control([{"LS_Table": k, "LS_op": OP_DELETE} for k in keys]))
+        else:
+            responses = ["no session"] * len(keys)
+        for key, server_response in zip(keys, responses):
+            log.debug("Server response ---> <{0}>".format(server_response))
+            # either way we don't want its updates any more, a new session won't have it
+            del self._subscriptions[key]
             if server_response == OK_CMD:
-                del self._subscriptions[subcription_key]
                 log.info("Unsubscribed successfully")
             else:
-                log.warning("Server error")
-                log.warning("LIGHTSTREAMER FAIL - EMERGENCY EXIT PROGRAM AND START AGAIN")
-                sys.exit(1)
-        else:
-            log.warning("No subscription key {0} found!".format(subcription_key))
+                log.warning("Server error unsubscribing {0}: {1}".format(key, server_response))
 
     def _forward_update_message(self, update_message):
         """Forwards the real time update to the relative
@@ -336,70 +655,8 @@ class LSClient(object):
                 self._subscriptions[table].notifyupdate(item)
             else:
                 log.warning("No subscription found!")
-        except Exception as e:
-            pass
-
-    def _receive(self):
-        rebind = False
-        receive = True
-        while receive:
-            log.debug("Waiting for a new message")
-            try:
-                message = self._read_from_stream()
-                log.debug("Received message ---> <{0}>".format(message))
-            except Exception:
-                log.error("Communication error")
-                print(traceback.format_exc())
-                message = None
-
-            if message is None:
-                receive = False
-                log.warning("No new message received")
-            elif message == PROBE_CMD:
-                # Skipping the PROBE message, keep on receiving messages.
-                log.debug("PROBE message")
-            elif message.startswith(ERROR_CMD):
-                # Terminate the receiving loop on ERROR message
-                receive = False
-                log.error("ERROR")
-            elif message.startswith(LOOP_CMD):
-                # Terminate the the receiving loop on LOOP message.
-                # A complete implementation should proceed with
-                # a rebind of the session.
-                log.debug("LOOP")
-                receive = False
-                rebind = True
-            elif message.startswith(SYNC_ERROR_CMD):
-                # Terminate the receiving loop on SYNC ERROR message.
-                # A complete implementation should create a new session
-                # and re-subscribe to all the old items and relative fields.
-                log.error("SYNC ERROR")
-                receive = False
-            elif message.startswith(END_CMD):
-                # Terminate the receiving loop on END message.
-                # The session has been forcibly closed on the server side.
-                # A complete implementation should handle the
-                # "cause_code" if present.
-                log.info("Connection closed by the server")
-                receive = False
-            elif message.startswith("Preamble"):
-                # Skipping Preamble message, keep on receiving messages.
-                log.debug("Preamble")
-            else:
-                self._forward_update_message(message)
-
-        if not rebind:
-            log.debug("Closing connection")
-            # Clear internal data structures for session
-            # and subscriptions management.
-            self._stream_connection.close()
-            self._stream_connection = None
-            self._session.clear()
-            self._subscriptions.clear()
-            self._current_subscription_key = 0
-        else:
-            log.debug("Binding to this active session")
-            self.bind()
+        except Exception:
+            log.info("Couldn't handle update <{0}>".format(update_message), exc_info=True)
 
 # logging.basicConfig(level=logging.INFO)
 
@@ -3,14 +3,18 @@ import os, sys
 import datetime
 import json
 import math
-import operator
-import requests
+import threading
+from functools import wraps
 import numpy as np
 from pytz import timezone
 
-from .signal import Signal
-from . import indicators as ta
-from .strategy import wma_cross
+from .bars import BarSeries, format_time
+from .aggregator import BarAggregator
+from .streaming import IndicatorEngine
+from .cache import IndicatorCache
+from .store import PriceStore
+from .ratelimit import exceeded
+from .ticks import TickBuffer, BID as TICK_BID, OFR as TICK_OFR, UTM as TICK_UTM
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -25,12 +29,38 @@ ch.setFormatter(formatter)
 logger.addHandler(fh)
 logger.addHandler(ch)
 
+# how many bars of each resolution to keep in memory, anything else gets DEFAULT_DEPTH
+HISTORY_DEPTH = {"DAY":120, "HOUR_4":120, "HOUR":120, "MINUTE_30":120, "MINUTE_5":120}
+DEFAULT_DEPTH = 120
+# resolutions built live from the MINUTE_5 chart feed
+AGGREGATE_RESOLUTIONS = ["MINUTE_30", "HOUR", "HOUR_4"]
+
+# fields of the CHART:<epic>:5MINUTE subscription, and their slots in the records set_latest_price gets
+CHART_FIELDS = ["LTV", "UTM", "DAY_HIGH", "DAY_LOW", "OFR_OPEN", "OFR_HIGH", "OFR_LOW", "OFR_CLOSE",
+                "BID_OPEN", "BID_HIGH", "BID_LOW", "BID_CLOSE", "CONS_END", "CONS_TICK_COUNT"]
+(LTV, UTM, DAY_HIGH, DAY_LOW, OFR_OPEN, OFR_HIGH, OFR_LOW, OFR_CLOSE,
+ BID_OPEN, BID_HIGH, BID_LOW, BID_CLOSE, CONS_END, CONS_TICK_COUNT) = range(len(CHART_FIELDS))
+CHART_PARSERS = dict([(f, float) for f in CHART_FIELDS], LTV=int, UTM=int, CONS_END=int, CONS_TICK_COUNT=int)
+
+
+def _locked(method):
+    """run the method holding the market's lock"""
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return locked
+
 
 class Market:
     """Main class for handling monitoring of markets and producing signals"""
     
-    def __init__(self, epic, ig_obj, market_data = None):
+    def __init__(self, epic, ig_obj, market_data = None, state = None):
+        """state is what a StateSnapshot saved of the market (see state()) to carry on from"""
         self.epic = epic
+        # held by whatever changes the bars or runs the strategies on them - the
+        # engine thread, the streaming thread and a snapshot all get at them
+        self.lock = threading.RLock()
         self.cooldown = datetime.datetime(2000,1,1,0,0,0,0)
         self.ig = ig_obj
         # raw data and signal producers
@@ -43,23 +73,66 @@ class Market:
         self.margin_bands = {}
         self.risk_premium = {}
         self.minimum_stop = 0
+        self.history_depth = HISTORY_DEPTH.copy()
+        self.build_resolutions = list(AGGREGATE_RESOLUTIONS)
+        self.aggregators = {}
+        # streaming indicator state per resolution, see streaming.py, with results
+        # memoised in the cache shared by all markets
+        cache = getattr(ig_obj, 'indicator_cache', None)
+        self.indicators = IndicatorEngine(epic, IndicatorCache() if cache is None else cache)
 
         self.market_status =""
+        self.market_data = None
+        self.store = PriceStore()
+        # latest ticks off the CHART:<epic>:TICK feed, see ticks.py
+        self.ticks = TickBuffer()
         
-        self.load_prices()
+        if state is None:
+            self.load_prices()
+        else:
+            self.restore(state)
+            if market_data is None:
+                market_data = state['market_data']
         self.update_market(market_data)
 
+    def state(self):
+        """what a snapshot needs to rebuild the market without going to IG or its price files"""
+        return {"market_data": self.market_data, "cooldown": self.cooldown, "prices": self.prices,
+                "aggregators": self.aggregators, "indicators": self.indicators.streams}
+
+    def restore(self, state):
+        self.cooldown = state['cooldown']
+        self.prices = state['prices']
+        self.aggregators = state['aggregators']
+        # the streams were pickled alongside the series they follow, so they carry on from where they were
+        self.indicators.streams = state['indicators']
+
+    def new_series(self, resolution, bars=None, depth=None):
+        """make an empty (or filled) ring buffer sized for the resolution"""
+        if depth is None:
+            depth = self.history_depth.get(resolution, DEFAULT_DEPTH)
+        return BarSeries(bars, capacity=depth)
+
+    @_locked
+    def set_history_depth(self, resolution, depth):
+        """change how many bars of a resolution are kept"""
+        self.history_depth[resolution] = depth
+        if resolution in self.prices:
+            self.prices[resolution].set_capacity(depth)
+
     def add_strategy(self, strategy):
         if strategy.name not in self.strategies:
             self.strategies[strategy.name] = strategy
 
+    @_locked
     def update_market(self, obj = None):
         try:
             if obj is None:
                 logger.info("getting " + self.epic + " market data")
                 base_url = self.ig.api_url + '/markets/' + self.epic
-                auth_r = requests.get(base_url, headers=self.ig.authenticate())
+                auth_r = self.ig.http.get(base_url)
                 obj = json.loads(auth_r.text)
+            self.market_data = obj
             
             # store the status of the market from the obj, use a change in state to trigger an update to lightstreamer in auto_ig.py
             self.market_status = obj['snapshot']['marketStatus']
@@ -87,8 +160,7 @@ class Market:
                         self.prices['DAY'][-1]['closePrice']['bid'] = self.bid
 
             else:
-                self.prices = {}
-                self.save_prices()
+                self.clear_prices()
                 
             
             
@@ -118,18 +190,27 @@ class Market:
 
             
 
-    def set_latest_price(self,values):
+    def bar_epoch(self, utm, period=60):
+        """IG UTM (ms) -> epoch seconds on the GB clock that snapshotTime uses,
+        floored to the start of the period"""
+        seconds = int(utm)//1000
+        offset = datetime.datetime.fromtimestamp(seconds,timezone('GB')).utcoffset()
+        local = seconds + int(offset.total_seconds())
+        return local - (local % period)
+
+    @_locked
+    def set_latest_price(self,record):
+        """take a CHART update, record holds the parsed fields in CHART_FIELDS order"""
         # if self.ready:
         try:
-            timestamp = datetime.datetime.fromtimestamp(int(values['UTM'])/1000,timezone('GB')).strftime("%Y:%m:%d-%H:%M:00")
-            minNum = datetime.datetime.fromtimestamp(int(values['UTM'])/1000).strftime("%M") #1 or 6? make a new MIN_5
-            minNum = float(minNum)
+            epoch = self.bar_epoch(record[UTM])
+            timestamp = format_time(epoch)
             
-            self.bid = float(values['BID_CLOSE'])
-            self.offer = float(values['OFR_CLOSE'])
-            self.high = float(values['DAY_HIGH'])
-            self.low = float(values['DAY_LOW'])
-            self.spread = float(self.offer) - float(self.bid)
+            self.bid = record[BID_CLOSE]
+            self.offer = record[OFR_CLOSE]
+            self.high = record[DAY_HIGH]
+            self.low = record[DAY_LOW]
+            self.spread = self.offer - self.bid
             if "DAY" in self.prices:
                 if len(self.prices['DAY'])>0:
                     last_day = self.prices['DAY'][-1]
@@ -141,29 +222,23 @@ class Market:
                     last_day['closePrice']['bid'] = self.bid
                     # print(last_day)
             # create an empty price object that matches the hsitorical one
-            current_price = {
-                    "snapshotTime": timestamp, 
-                    "openPrice": {"bid": float(values['BID_OPEN']), "ask": float(values['OFR_OPEN']), "mid": (float(values['BID_OPEN']) + float(values['OFR_OPEN']))/2, "lastTraded": None}, 
-                    "closePrice": {"bid": self.bid, "ask": float(values['OFR_CLOSE']), "mid": (float(values['BID_CLOSE']) + float(values['OFR_CLOSE']))/2, "lastTraded": None }, 
-                    "highPrice": {"bid": float(values['BID_HIGH']), "ask": float(values['OFR_HIGH']), "mid": (float(values['BID_HIGH']) + float(values['OFR_HIGH']))/2, "lastTraded": None}, 
-                    "lowPrice": {"bid": float(values['BID_LOW']), "ask": float(values['OFR_LOW']), "mid": (float(values['BID_LOW']) + float(values['OFR_LOW']))/2, "lastTraded": None}, 
-                    "lastTradedVolume": int(values['LTV'])}
-            self.typical_price(current_price,"mid")
-            self.price_spread(current_price)
+            ohlcv = (record[BID_OPEN], record[OFR_OPEN],
+                     record[BID_HIGH], record[OFR_HIGH],
+                     record[BID_LOW], record[OFR_LOW],
+                     self.bid, self.offer, int(record[LTV]))
+            current_price = self.make_price(timestamp, ohlcv)
             
             if "MINUTE_5" in self.prices:
                 # use the timestamp to save the value to the right minute object in the list or make a new one
-                i = next((index for (index, d) in enumerate(self.prices['MINUTE_5']) if d["snapshotTime"] == timestamp), None)
+                i = self.prices['MINUTE_5'].index_of(epoch)
                 if i==None:
                     # new 5 mins, so process signals before adding them mainly empty period
                     for s in self.strategies.values():
                         s.process_signals(self,self.prices['MINUTE_5'],'MINUTE_5')
+                    self.ig.on_bar_close(self,'MINUTE_5')
 
                     self.prices['MINUTE_5'].append(current_price)
-                    
-                    self.build_time_period("MINUTE_5","MINUTE_30",120)
-                    self.build_time_period("MINUTE_5","HOUR",120)
-                    self.build_time_period("MINUTE_5","HOUR_4",120)
+                    self.roll_time_periods(epoch, ohlcv)
 
                     # if "MINUTE_30" in self.prices:
                     #     last_30_min = int(30 * math.floor(minNum/30))
@@ -254,15 +329,13 @@ class Market:
                     
                 else:
                     self.prices['MINUTE_5'][i] = current_price
-                    
-                if len(self.prices['MINUTE_5'])>120:
-                    del self.prices['MINUTE_5'][0]
+                    self.roll_time_periods(epoch, ohlcv)
                     
 
                 
 
             else:
-                self.prices['MINUTE_5'] = []
+                self.prices['MINUTE_5'] = self.new_series('MINUTE_5')
             
             
             
@@ -277,103 +350,68 @@ class Market:
             logger.info(exc_obj)
             pass
 
-    def build_time_period(self,build_from="MINUTE_5",build_to="MINUTE_30",max_count=120):
-        """Builds the specified period from a given resolution
-        if it has to create a new period, then run the given action (strategy signals)"""
-        try:
-            if build_from in self.prices:
-                # build a timestamp format string based on target period
-                rounding_value = 1
-                if "_" in build_to:
-                    rounding_value = int(build_to.split("_")[1])
-
-                timestamp_format = "%Y:%m:%d-{:0>2d}:00:00"
-                current_time = int(datetime.datetime.now(timezone('GB')).replace(tzinfo=None).strftime("%H"))
-                if "MINUTE" in build_to:
-                    timestamp_format = "%Y:%m:%d-%H:{:0>2d}:00"
-                    current_time = int(datetime.datetime.now(timezone('GB')).replace(tzinfo=None).strftime("%M"))
-                
-                past_time = int(rounding_value * math.floor(current_time/rounding_value))
-                timestamp_start = datetime.datetime.now(timezone('GB')).replace(tzinfo=None).strftime(timestamp_format.format(past_time))
-
-                # now prepare the new period from the previous periods
-                i = next((index for (index, d) in enumerate(self.prices[build_from]) if d["snapshotTime"] == timestamp_start), None)
-                mins = self.prices[build_from][i:]
-                open_price = mins[0]['openPrice']
-                close_price = mins[-1]['closePrice']
-                vol = sum([x['lastTradedVolume'] for x in mins])
-                ask_low = min([x['lowPrice']['ask'] for x in mins])
-                ask_high = max([x['highPrice']['ask'] for x in mins])
-                bid_low = min([x['lowPrice']['bid'] for x in mins])
-                bid_high = max([x['highPrice']['bid'] for x in mins])
-                new_period= {
-                    "snapshotTime": timestamp_start, 
-                    "openPrice": {"bid": float(open_price['bid']), "ask": float(open_price['ask']), "mid": (float(open_price['bid']) + float(open_price['ask']))/2, "lastTraded": None}, 
-                    "closePrice": {"bid": float(close_price['bid']), "ask": float(close_price['ask']), "mid": (float(close_price['bid']) + float(close_price['ask']))/2, "lastTraded": None }, 
-                    "highPrice": {"bid": float(bid_high), "ask": float(ask_high), "mid": (float(bid_high) + float(ask_high))/2, "lastTraded": None}, 
-                    "lowPrice": {"bid": float(bid_low), "ask": float(ask_low), "mid": (float(bid_low) + float(ask_low))/2, "lastTraded": None}, 
-                    "lastTradedVolume": int(vol)}
-                self.typical_price(new_period,"mid")
-                self.price_spread(new_period)
-    
+    def set_tick(self, record):
+        """take a CHART:<epic>:TICK update, record holds the parsed fields in TICK_FIELDS order"""
+        if record[TICK_BID] is None or record[TICK_OFR] is None:
+            return
+        self.bid = record[TICK_BID]
+        self.offer = record[TICK_OFR]
+        self.spread = self.offer - self.bid
+        self.ticks.push(record[TICK_UTM] or 0, self.bid, self.offer)
+
+    def make_price(self, timestamp, ohlcv):
+        """price object matching the historical ones from an aggregator OHLCV tuple"""
+        ob, oa, hb, ha, lb, la, cb, ca, vol = ohlcv
+        bar = {
+            "snapshotTime": timestamp, 
+            "openPrice": {"bid": ob, "ask": oa, "mid": (ob + oa)/2, "lastTraded": None}, 
+            "closePrice": {"bid": cb, "ask": ca, "mid": (cb + ca)/2, "lastTraded": None }, 
+            "highPrice": {"bid": hb, "ask": ha, "mid": (hb + ha)/2, "lastTraded": None}, 
+            "lowPrice": {"bid": lb, "ask": la, "mid": (lb + la)/2, "lastTraded": None}, 
+            "lastTradedVolume": int(vol)}
+        self.typical_price(bar,"mid")
+        self.price_spread(bar)
+        return bar
+
+    def roll_time_periods(self, epoch, ohlcv, build_from="MINUTE_5"):
+        """Feeds the latest build_from bar into the aggregators for build_resolutions
+        when one of their periods completes the strategies run on it before the next one starts"""
+        for build_to in self.build_resolutions:
+            try:
+                aggregator = self.aggregators.get(build_to)
+                if aggregator is None:
+                    aggregator = BarAggregator(build_to, build_from)
+                    # pick up the bars of this period we got before streaming started
+                    aggregator.seed(self.prices.get(build_from), epoch)
+                    self.aggregators[build_to] = aggregator
 
-                # timestamp_start should be the beginning of the period of build_to
-                # check if it exists in prices
                 if build_to not in self.prices:
-                    self.prices[build_to] = []
-                
-                i = next((index for (index, d) in enumerate(self.prices[build_to]) if d["snapshotTime"] == timestamp_start), None)
-                
-                if i is None:
-                    # ok we need to make a new period and run the function and finalise the previous one
-                    # update the previous bar with last bars
-                    if len(self.prices[build_to])>0:
-                        last_period = self.prices[build_to][-1]
-                        last_timestamp = last_period['snapshotTime']
-                        i = next((index for (index, d) in enumerate(self.prices[build_from]) if d["snapshotTime"] == last_timestamp), None)
-                        mins = self.prices[build_from][i:]
-                        open_price = mins[0]['openPrice']
-                        close_price = mins[-1]['closePrice']
-                        vol = sum([x['lastTradedVolume'] for x in mins])
-                        ask_low = min([x['lowPrice']['ask'] for x in mins])
-                        ask_high = max([x['highPrice']['ask'] for x in mins])
-                        bid_low = min([x['lowPrice']['bid'] for x in mins])
-                        bid_high = max([x['highPrice']['bid'] for x in mins])
-                        last_period['closePrice'] = close_price
-                        last_period['openPrice'] = open_price
-                        last_period['highPrice']['bid'] = bid_high
-                        last_period['highPrice']['ask'] = ask_high
-                        last_period['highPrice']['mid'] = (bid_high+ask_high)/2
-
-                        last_period['lowPrice']['bid'] = bid_low
-                        last_period['lowPrice']['ask'] = ask_low
-                        last_period['lowPrice']['mid'] = (bid_low+ask_low)/2
-                        last_period['lastTradedVolume'] = int(vol)
+                    self.prices[build_to] = self.new_series(build_to)
 
-                        
-                        self.typical_price(last_period,"mid")
-                        self.price_spread(last_period)
+                finished, current = aggregator.update(epoch, ohlcv)
+                if finished is not None:
+                    bucket, values = finished
+                    self.prices[build_to].upsert(self.make_price(format_time(bucket), values), bucket)
 
                     # DO ACTION HERE
                     for s in self.strategies.values():
                         s.process_signals(self,self.prices[build_to],build_to)
 
-                    self.prices[build_to].append(new_period)
-                else:
-                    # we need to update an existing
-                    self.prices[build_to][i] = {**self.prices[build_to][i], **new_period}
-
-                if len(self.prices[build_to])>max_count:
-                    del self.prices[build_to][0]
-        except Exception as e:
-            exc_type, exc_obj, exc_tb = sys.exc_info()
-            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-            logger.info("{} price build fail".format(self.epic))
-            logger.info(exc_type)
-            logger.info(fname)
-            logger.info(exc_tb.tb_lineno)
-            logger.info(exc_obj)
-            pass
+                if current is None:
+                    continue
+                bucket, values = current
+                if values is None or None in values:
+                    continue
+                self.prices[build_to].upsert(self.make_price(format_time(bucket), values), bucket)
+            except Exception as e:
+                exc_type, exc_obj, exc_tb = sys.exc_info()
+                fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+                logger.info("{} price build fail".format(self.epic))
+                logger.info(exc_type)
+                logger.info(fname)
+                logger.info(exc_tb.tb_lineno)
+                logger.info(exc_obj)
+                pass
             
 
     def get_update_cost(self, resolution = None, count = 0):
@@ -427,28 +465,46 @@ class Market:
     def update_prices(self, resolution, count = 50):
         data_count = count
         if resolution in self.prices:
+            # the ring buffer drops the oldest bars as the new ones go in
             data_count = self.get_update_cost(resolution,count)
-            del self.prices[resolution][:data_count]
-        else:
-            self.prices[resolution] = []
+        return self.apply_prices(resolution, data_count, self.fetch_prices(resolution, data_count))
+
+    def fetch_prices(self, resolution, data_count):
+        """GET the last data_count bars, doesn't touch the market so it can run
+        on a worker thread - returns the response or None if nothing was needed"""
+        if data_count <= 0:
+            return None
+        base_url = self.ig.api_url + "/prices/{}/{}/{}".format(self.epic,resolution,data_count)
+        return self.ig.http.get(base_url)
+
+    @_locked
+    def apply_prices(self, resolution, data_count, auth_r):
+        """take a fetch_prices response into the series, then run the strategies and save"""
+        if resolution not in self.prices:
+            self.prices[resolution] = self.new_series(resolution)
         
         # if needed get new data for our array
         api_calls ={'remainingAllowance':0, 'totalAllowance':0, 'allowanceExpiry':0}
         if data_count > 0:
-            
-
-            base_url = self.ig.api_url + "/prices/{}/{}/{}".format(self.epic,resolution,data_count)
-            auth_r = requests.get(base_url,headers = self.ig.authenticate())
-            if auth_r.ok:
+            if auth_r is not None and auth_r.ok:
                 d = json.loads(auth_r.text)
-                self.prices[resolution].extend(d['prices'])
+                # bars we already hold get replaced, so overlapping fetches don't duplicate
+                for bar in d['prices']:
+                    self.prices[resolution].upsert(bar)
                 api_calls = d['allowance']
+                self.ig.http.limiter.update_allowance(api_calls)
+
+            elif exceeded(auth_r):
+                # over an allowance - the limiter's holding calls back, these bars are still due next time
+                logger.info("{} {} deferred: {}".format(self.epic, resolution, exceeded(auth_r)))
+                data_count = 0
 
             else:
                 logger.info("WE MIGHT BE FUCKED")
-                logger.info(auth_r.status_code)
-                logger.info(auth_r.reason)
-                logger.info(auth_r.content)
+                if auth_r is not None:
+                    logger.info(auth_r.status_code)
+                    logger.info(auth_r.reason)
+                    logger.info(auth_r.content)
 
                 # kill all trades that are in waiting and put a timeout on this market
                 self.cooldown = datetime.datetime.now(timezone('GB')).replace(tzinfo=None) + datetime.timedelta(minutes = 10)
@@ -476,62 +532,35 @@ class Market:
 
         return self.prices[resolution]
 
+    @_locked
     def backtest_all(self):
         for res in self.prices:
             self.backtest(res)
 
-    def backtest(self,resolution):
+    @_locked
+    def backtest(self,resolution,lookback=10):
+        """signals for the last lookback+1 bars - in one pass by the strategies with
+        a vectorised mode for the resolution, a prefix at a time by the rest"""
         print("backfilling signals {}".format(resolution))
         prices = self.prices[resolution]
         price_len = len(prices)
-        for i in list(range(10,-1,-1)):
-            p = price_len - i
-            ps = prices[:p]
-            if len(ps)>0:
-                print("{} {}".format(self.epic, ps[-1]['snapshotTime']))
-                for s in self.strategies.values():
+        if price_len==0:
+            return
+        for s in self.strategies.values():
+            if resolution in s.vectorised:
+                s.backfill(self,prices,resolution,lookback)
+                continue
+            for i in list(range(lookback,-1,-1)):
+                p = price_len - i
+                ps = prices[:p]
+                if len(ps)>0:
+                    print("{} {}".format(self.epic, ps[-1]['snapshotTime']))
                     s.process_signals(self,ps,resolution)
 
 
     def sanitise_prices(self,resolution):
         """Checks for None values in price data and sets to previous value"""
-        price_groups = ['openPrice','closePrice','highPrice','lowPrice']
-        now = self.prices[resolution][0]
-        for g in price_groups:
-            bid = now[g]['bid']
-            ask = now[g]['ask']
-            if bid is None:
-                bid = self.prices[resolution][1][g]['bid']
-            if ask is None:
-                ask = self.prices[resolution][1][g]['ask']
-            now[g]['bid'] = bid
-            now[g]['ask'] = ask
-
-            mid = (bid + ask)/2
-            now[g]['mid'] = mid
-    
-        self.price_spread(now)
-        self.typical_price(now,"mid")
-        prev = now
-
-        for i in range(1,len(self.prices[resolution])):
-            now = self.prices[resolution][i]
-            for g in price_groups:
-                bid = now[g]['bid']
-                ask = now[g]['ask']
-                if bid is None:
-                    bid = prev[g]['bid']
-                if ask is None:
-                    ask = prev[g]['ask']
-                now[g]['bid'] = bid
-                now[g]['ask'] = ask
-                
-                mid = (bid + ask)/2
-                now[g]['mid'] = mid
-            
-            self.price_spread(now)
-            self.typical_price(now,"mid")
-            prev = now
+        self.prices[resolution].fill_missing()
             
     def price_spread(self,bar):
         price_groups = ['openPrice','closePrice','highPrice','lowPrice']
@@ -651,24 +680,31 @@ class Market:
 
 
     def load_prices(self):
-        if os.path.exists("markets/prices/"):
-            filepath = "markets/prices/" + self.epic + ".json"
-            if os.path.isfile(filepath):
-                try:
-                    fh = open(filepath,'r')
-                    data = json.load(fh)
-                    logger.info("found old data, loading")
-                    self.prices = data['prices'].copy()
-                except Exception as e:
-                    logger.info("{} couldn't load JSON {}".format(self.epic,e))
-                    self.prices = {}
+        try:
+            stored = self.store.load(self.epic)
+            if not stored and os.path.isfile(self.store.json_path(self.epic)):
+                logger.info("{} found old JSON prices, converting".format(self.epic))
+                stored = {res: bars.fields() for res, bars in self.store.import_json(self.epic).items()}
+            self.prices = {}
+            for res, (times, values) in stored.items():
+                series = self.new_series(res)
+                series.load_fields(times, values)
+                # it's all on disk already
+                series.pop_changes()
+                self.prices[res] = series
+        except Exception as e:
+            logger.info("{} couldn't load prices {}".format(self.epic,e))
+            self.prices = {}
 
     def save_prices(self):
-        save = {
-            "prices" : self.prices.copy()
-        }
-        if not os.path.exists("markets/prices/"):
-                os.makedirs("markets/prices/")
-        fh = open("markets/prices/" + self.epic + ".json","w")
-        json.dump(save.copy(),fh)
-        fh.close()
+        """append the bars added or changed since the last save"""
+        for res, bars in self.prices.items():
+            start = bars.pop_changes()
+            if start is not None:
+                self.store.append(self.epic, res, bars, start)
+
+    @_locked
+    def clear_prices(self):
+        self.prices = {}
+        self.aggregators = {}
+        self.store.remove(self.epic)
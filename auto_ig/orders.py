@@ -0,0 +1,79 @@
+import logging
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# dealing threads
+ORDER_WORKERS = 4
+# waits between asking IG for a deal confirmation, doubling from the first to the most
+CONFIRM_FIRST = 0.25
+CONFIRM_MAX = 2.0
+# give up on a confirmation after this many seconds
+CONFIRM_TIMEOUT = 30
+
+
+class OrderDesk:
+    """Does the dealing - the REST calls that open and close positions and the
+    wait for IG to confirm them - on its own threads
+
+    Trade.open_trade/close_trade hand their work to submit and return straight
+    away, so the streaming thread they're called from never waits on an order.
+    confirm polls /confirms with a backoff rather than a fixed sleep, and
+    returns as soon as on_confirm is given the confirmation from elsewhere
+    (eg. the account's TRADE stream).
+    """
+
+    def __init__(self, ig, workers=ORDER_WORKERS):
+        self.ig = ig
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.waiting = {}
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        """run fn(*args) on a dealing thread, returns its future"""
+        return self.pool.submit(self._run, fn, *args)
+
+    def _run(self, fn, *args):
+        try:
+            return fn(*args)
+        except Exception:
+            logger.info("dealing job {} failed".format(getattr(fn, '__name__', fn)), exc_info=True)
+
+    def confirm(self, deal_ref, timeout=CONFIRM_TIMEOUT):
+        """the confirmation of deal_ref as a dict, or None if there isn't one within timeout"""
+        event = threading.Event()
+        waiter = [event, None]
+        with self.lock:
+            self.waiting[deal_ref] = waiter
+        try:
+            deadline = time.monotonic() + timeout
+            delay = CONFIRM_FIRST
+            while True:
+                if event.wait(delay):
+                    return waiter[1]
+                auth_r = self.ig.http.get(self.ig.api_url + '/confirms/' + deal_ref)
+                if auth_r.ok:
+                    d = json.loads(auth_r.text)
+                    if d.get('dealStatus') is not None:
+                        return d
+                if time.monotonic() + delay > deadline:
+                    logger.info("no confirmation for {} after {}s: {} {}".format(deal_ref, timeout, auth_r.status_code, auth_r.text))
+                    return None
+                delay = min(delay * 2, CONFIRM_MAX)
+        finally:
+            with self.lock:
+                self.waiting.pop(deal_ref, None)
+
+    def on_confirm(self, confirm):
+        """a deal confirmation from outside the REST polling, wakes whoever's waiting on it"""
+        with self.lock:
+            waiter = self.waiting.get(confirm.get('dealReference'))
+        if waiter is not None:
+            waiter[1] = confirm
+            waiter[0].set()
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
@@ -0,0 +1,215 @@
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+# IG's request limits, per minute
+TRADING_PER_MINUTE = 100    # per account: dealing and confirms
+ACCOUNT_PER_MINUTE = 30     # per account: everything else
+APP_PER_MINUTE = 60         # per api key: everything else
+
+# paths that go against the trading allowance
+TRADING_PATHS = ('/positions/otc', '/confirms', '/workingorders/otc')
+
+# how long to stop using a bucket when IG says we've gone over it
+PENALTY = 60
+# how long to hold off backfill when the historical data allowance has run out
+# and we don't know from a response when it resets
+HISTORY_PENALTY = 600
+
+
+def exceeded(response):
+    """the errorCode of a response turned away for being over an allowance, else None"""
+    if response is None or response.status_code != 403:
+        return None
+    try:
+        code = json.loads(response.text).get('errorCode', '')
+    except (ValueError, AttributeError):
+        return None
+    return code if 'exceeded' in code else None
+
+
+class TokenBucket:
+    """rate tokens a second up to capacity"""
+
+    def __init__(self, per_minute):
+        self.configure(per_minute)
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.blocked = 0
+
+    def configure(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def available(self, now):
+        self._refill(now)
+        return 0.0 if now < self.blocked else self.tokens
+
+    def wait_time(self, now, tokens=1):
+        """seconds until there are tokens in the bucket"""
+        self._refill(now)
+        wait = max(0.0, (tokens - self.tokens) / self.rate)
+        return max(wait, self.blocked - now)
+
+    def take(self, tokens=1):
+        self.tokens -= tokens
+
+    def block(self, now, seconds):
+        self.tokens = 0.0
+        self.stamp = now
+        self.blocked = max(self.blocked, now + seconds)
+
+
+class RateLimiter:
+    """Token buckets for IG's trading, per-account and per-app allowances
+
+    Every REST call takes a token before it goes: dealing and confirms from the
+    trading bucket, anything else from both the account and app buckets. Those
+    two are shared with price backfill, which only gets a token while there are
+    more than backfill_reserve left and nothing else is waiting, so it never
+    holds up a market lookup or a deal. Backfill also counts against the weekly
+    historical data allowance the /prices responses report.
+
+    When IG turns a call away for being over an allowance (see exceeded) the
+    bucket it came out of is emptied and blocked for PENALTY seconds. Limits
+    that would leave backfill waiting forever are turned away (see check).
+    """
+
+    def __init__(self, trading=TRADING_PER_MINUTE, account=ACCOUNT_PER_MINUTE, app=APP_PER_MINUTE, backfill_reserve=5):
+        self.check(trading, account, app, backfill_reserve)
+        self.condition = threading.Condition()
+        self.buckets = {'trading': TokenBucket(trading), 'account': TokenBucket(account), 'app': TokenBucket(app)}
+        self.backfill_reserve = backfill_reserve
+        self.waiting = 0
+        # historical data points left, the allowance size and (monotonic) when it resets
+        self.remaining = None
+        self.total = None
+        self.expires = 0
+
+    @staticmethod
+    def check(trading, account, app, backfill_reserve):
+        """ValueError unless every allowance is positive and backfill can get a
+        token with backfill_reserve left over, otherwise it would wait forever"""
+        if min(trading, account, app) <= 0:
+            raise ValueError("rate limits must be positive, got trading {} account {} app {}".format(trading, account, app))
+        if backfill_reserve < 0 or backfill_reserve + 1 > min(account, app):
+            raise ValueError("backfill_reserve {} leaves no room for backfill in the account ({}) and app ({}) allowances".format(
+                backfill_reserve, account, app))
+
+    def configure(self, trading=None, account=None, app=None, backfill_reserve=None):
+        """change the allowances, any left as None stay as they are - all or none of them
+        are applied, see check"""
+        with self.condition:
+            limits = dict((name, b.capacity) for name, b in self.buckets.items())
+            for name, per_minute in (('trading', trading), ('account', account), ('app', app)):
+                if per_minute is not None:
+                    limits[name] = float(per_minute)
+            reserve = self.backfill_reserve if backfill_reserve is None else int(backfill_reserve)
+            self.check(limits['trading'], limits['account'], limits['app'], reserve)
+            for name, per_minute in limits.items():
+                self.buckets[name].configure(per_minute)
+            self.backfill_reserve = reserve
+            self.condition.notify_all()
+
+    @staticmethod
+    def classify(url):
+        """'trading', 'backfill' or 'general'"""
+        path = urlsplit(url).path
+        if any(p in path for p in TRADING_PATHS):
+            return 'trading'
+        if '/prices/' in path:
+            return 'backfill'
+        return 'general'
+
+    def _buckets(self, kind):
+        if kind == 'trading':
+            return [self.buckets['trading']]
+        return [self.buckets['account'], self.buckets['app']]
+
+    def _wait(self, kind, now):
+        tokens = 1
+        if kind == 'backfill':
+            if self.waiting:
+                return None
+            tokens += self.backfill_reserve
+        return max(b.wait_time(now, tokens) for b in self._buckets(kind))
+
+    def acquire(self, kind='general'):
+        """block until a call of kind can go, and take its token"""
+        with self.condition:
+            queued = kind == 'general'
+            if queued:
+                self.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._wait(kind, now)
+                    if wait == 0:
+                        break
+                    self.condition.wait(wait)
+            finally:
+                if queued:
+                    self.waiting -= 1
+            for b in self._buckets(kind):
+                b.take()
+            self.condition.notify_all()
+
+    def backfill_capacity(self):
+        """how many backfill calls could go right now"""
+        with self.condition:
+            now = time.monotonic()
+            if self.waiting:
+                return 0
+            return max(0, int(min(b.available(now) for b in self._buckets('backfill')) - self.backfill_reserve))
+
+    def reserve_history(self, points):
+        """count points against the historical data allowance, False if they'd go over it"""
+        with self.condition:
+            now = time.monotonic()
+            if self.remaining is None or now >= self.expires:
+                return True
+            if points > self.remaining:
+                return False
+            self.remaining -= points
+            return True
+
+    def update_allowance(self, allowance):
+        """take in the 'allowance' block of a /prices response"""
+        with self.condition:
+            self.remaining = allowance.get('remainingAllowance', self.remaining)
+            self.total = allowance.get('totalAllowance', self.total)
+            if 'allowanceExpiry' in allowance:
+                self.expires = time.monotonic() + allowance['allowanceExpiry']
+
+    def observe(self, kind, response):
+        """block whichever bucket a response says we've gone over"""
+        code = exceeded(response)
+        if code is None:
+            return
+        with self.condition:
+            now = time.monotonic()
+            if 'historical-data' in code:
+                self.remaining = 0
+                if now >= self.expires:
+                    self.expires = now + HISTORY_PENALTY
+            elif 'trading' in code:
+                self.buckets['trading'].block(now, PENALTY)
+            elif 'api-key' in code:
+                self.buckets['app'].block(now, PENALTY)
+            else:
+                for b in self._buckets(kind):
+                    b.block(now, PENALTY)
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            now = time.monotonic()
+            stats = {name: round(b.available(now), 1) for name, b in self.buckets.items()}
+            stats.update({"history_remaining": self.remaining, "history_total": self.total,
+                          "history_reset": max(0, round(self.expires - now))})
+            return stats
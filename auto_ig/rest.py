@@ -0,0 +1,80 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+from .ratelimit import RateLimiter
+
+DEFAULT_POOL_SIZE = 10
+# (connect, read) seconds
+DEFAULT_TIMEOUT = (5, 30)
+
+
+class IGClient:
+    """Keep-alive HTTP client shared by every IG REST call
+
+    Requests go through one requests.Session with a pool of persistent
+    connections, so only the first call to the gateway pays for the TLS setup.
+
+    auth is called before each request for the current auth headers (it logs in
+    when there aren't any) and they're sent as defaults, anything passed in
+    headers= is added on top. A 401 means the CST/X-SECURITY-TOKEN have gone
+    stale: expire is called to drop them and the request goes once more with
+    the new ones auth hands back.
+
+    Every request waits on limiter for a token first and the response is shown
+    to it afterwards, so going over an IG allowance holds the calls back rather
+    than failing them.
+    """
+
+    def __init__(self, auth, expire=None, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, limiter=None):
+        self.auth = auth
+        self.expire = expire
+        self.limiter = RateLimiter() if limiter is None else limiter
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.session = None
+        self.configure()
+
+    def configure(self, pool_size=None, timeout=None):
+        """(re)build the session with a new pool size and/or timeout"""
+        if pool_size is not None:
+            self.pool_size = int(pool_size)
+        if timeout is not None:
+            self.timeout = tuple(timeout) if isinstance(timeout, (list, tuple)) else float(timeout)
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        old, self.session = self.session, session
+        if old is not None:
+            old.close()
+
+    def request(self, method, url, headers=None, authenticated=True, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        kind = self.limiter.classify(url)
+        for attempt in range(2):
+            sent = {}
+            if authenticated:
+                sent.update(self.auth() or {})
+            if headers:
+                sent.update(headers)
+            self.limiter.acquire(kind)
+            response = self.session.request(method, url, headers=sent, **kwargs)
+            self.limiter.observe(kind, response)
+            if response.status_code != 401 or not authenticated or self.expire is None or attempt:
+                return response
+            self.expire()
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,113 @@
+import logging
+import os
+import pickle
+import time
+
+from .trade import TradeState
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = "state/snapshot.pickle"
+# bump when what's in a snapshot changes, older ones are ignored
+SNAPSHOT_VERSION = 2
+# seconds between snapshots once the engine's running
+SNAPSHOT_INTERVAL = 300
+# a snapshot older than this only gives back the trades - markets load from the
+# price files and backfill, and the signals are dropped as stale
+FRESH_FOR = 900
+# trades worth carrying over a restart
+LIVE_STATES = (TradeState.WAITING, TradeState.PENDING, TradeState.OPEN)
+
+
+class StateSnapshot:
+    """One file with everything AutoIG needs to carry on after a restart
+
+    That's each market (its last market data, bars, bar aggregators and
+    streaming indicator state), the strategies' signals and the trades that
+    are still live. Each market is pickled on its own inside the file, so
+    loading it is one read and the markets are only unpickled as they're
+    asked for (see take_market) - on boot that's by update_markets, as the
+    market details come back from IG. A fresh snapshot means no per-epic
+    price files to read, no bars to backfill and no indicator warm up.
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH, fresh_for=FRESH_FOR):
+        self.path = path
+        self.fresh_for = fresh_for
+        self.saved = None
+        self.markets = {}
+        self.signals = {}
+        self.trades = []
+
+    def save(self, ig):
+        """write a snapshot of ig, returns how many markets went in it"""
+        markets = {}
+        for epic, m in list(ig.markets.items()):
+            try:
+                # the streaming thread waits on the lock, so the bars can't change mid pickle
+                with m.lock:
+                    markets[epic] = pickle.dumps(m.state(), pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                logger.info("{} left out of the snapshot: {}".format(epic, e))
+        state = {
+            "version": SNAPSHOT_VERSION,
+            "saved": time.time(),
+            "markets": markets,
+            "signals": {name: s.signals for name, s in ig.strategy.items()},
+            "trades": [ig.journal.mark(t.to_json()) for t in ig.trades.in_state(*LIVE_STATES)],
+        }
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        with open(self.path + ".tmp", "wb") as fh:
+            pickle.dump(state, fh, pickle.HIGHEST_PROTOCOL)
+        os.replace(self.path + ".tmp", self.path)
+        return len(markets)
+
+    def load(self):
+        """read the snapshot, False if there isn't a usable one"""
+        if not os.path.isfile(self.path):
+            return False
+        try:
+            with open(self.path, "rb") as fh:
+                state = pickle.load(fh)
+        except Exception as e:
+            logger.info("couldn't read snapshot {}: {}".format(self.path, e))
+            return False
+        if state.get("version") != SNAPSHOT_VERSION:
+            logger.info("snapshot {} is from another version, ignoring it".format(self.path))
+            return False
+        self.saved = state["saved"]
+        self.trades = state["trades"]
+        if self.fresh():
+            self.markets = state["markets"]
+            self.signals = state["signals"]
+        logger.info("snapshot loaded: {} markets, {} trades, {}s old".format(len(self.markets), len(self.trades), round(self.age())))
+        return True
+
+    def age(self):
+        return time.time() - self.saved if self.saved is not None else float('inf')
+
+    def fresh(self):
+        return self.age() < self.fresh_for
+
+    def take_market(self, epic):
+        """the saved state of a market (for Market(state=)), once - None if there isn't one"""
+        blob = self.markets.pop(epic, None)
+        if blob is None:
+            return None
+        try:
+            return pickle.loads(blob)
+        except Exception as e:
+            logger.info("{} couldn't be restored from the snapshot: {}".format(epic, e))
+            return None
+
+    def take_signals(self):
+        """{strategy name: SignalStore}, once"""
+        signals, self.signals = self.signals, {}
+        return signals
+
+    def take_trades(self):
+        """the save_trade dicts of the live trades, once"""
+        trades, self.trades = self.trades, []
+        return trades
@@ -0,0 +1,149 @@
+import os
+import json
+import numpy as np
+
+from .bars import FIELDS, BarSeries
+
+# file header: magic, format version, number of fields per record
+MAGIC = b'AIGBARS'
+FORMAT_VERSION = 1
+HEADER = np.dtype([('magic', 'S7'), ('version', 'u1'), ('fields', '<u4'), ('pad', '<u4')])
+RECORD = np.dtype([('time', '<i8'), ('values', '<f8', (len(FIELDS),))])
+
+# rewrite a file once it holds this many times the records actually in use
+COMPACT_RATIO = 4
+COMPACT_MIN = 512
+
+
+class PriceStore:
+    """Append-only binary price files, markets/prices/<epic>/<resolution>.bin
+
+    Each bar is a fixed-width record (epoch seconds + every field of the column
+    store), so saving only appends the bars added or revised since the last save.
+    A bar written twice (eg. the live bar, or a refresh from the REST api) is
+    just appended again and the newest copy wins on load. Files are memory-mapped
+    to load and get compacted down to the bars in memory once they've grown
+    COMPACT_RATIO times bigger than that.
+    """
+
+    def __init__(self, root="markets/prices/"):
+        self.root = root
+
+    def _dir(self, epic):
+        return os.path.join(self.root, epic)
+
+    def _path(self, epic, resolution):
+        return os.path.join(self._dir(epic), resolution + ".bin")
+
+    def _header(self):
+        header = np.zeros(1, dtype=HEADER)
+        header['magic'] = MAGIC
+        header['version'] = FORMAT_VERSION
+        header['fields'] = len(FIELDS)
+        return header.tobytes()
+
+    def resolutions(self, epic):
+        if not os.path.isdir(self._dir(epic)):
+            return []
+        return [f[:-4] for f in sorted(os.listdir(self._dir(epic))) if f.endswith(".bin")]
+
+    def read(self, epic, resolution, mapped=False):
+        """(times, values) of the bars in a file, oldest first, newest copy of each bar
+        mapped hands back read-only views of the file itself when it's already in
+        order with no repeats (eg. just compacted) rather than reading it into memory,
+        so the only copy is the OS's page cache. A file with repeats still gets read
+        into a private, deduplicated copy."""
+        path = self._path(epic, resolution)
+        header = np.fromfile(path, dtype=HEADER, count=1)
+        if (header.size == 0 or header['magic'][0] != MAGIC or header['version'][0] != FORMAT_VERSION
+                or header['fields'][0] != len(FIELDS)):
+            raise ValueError("{} isn't a price file this version can read".format(path))
+        count = (os.path.getsize(path) - HEADER.itemsize) // RECORD.itemsize
+        if count <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, len(FIELDS)))
+        records = np.memmap(path, dtype=RECORD, mode='r', offset=HEADER.itemsize, shape=(count,))
+        times = np.asarray(records['time'])
+        if mapped and (times.size < 2 or bool(np.all(times[1:] > times[:-1]))):
+            return times, records['values']
+        # last copy of each time wins
+        order = np.argsort(times, kind='mergesort')
+        ordered = times[order]
+        last = np.ones(ordered.size, dtype=bool)
+        last[:-1] = ordered[1:] != ordered[:-1]
+        keep = order[last]
+        values = np.array(records['values'][keep])
+        del records
+        return times[keep], values
+
+    def load(self, epic):
+        """{resolution: (times, values)} of everything stored for epic"""
+        prices = {}
+        for res in self.resolutions(epic):
+            prices[res] = self.read(epic, res)
+        return prices
+
+    def append(self, epic, resolution, series, start=0):
+        """append the bars of series from list index start on, compacting if the file's got big"""
+        path = self._path(epic, resolution)
+        if not os.path.isdir(self._dir(epic)):
+            os.makedirs(self._dir(epic))
+        times, values = series.fields(start)
+        records = np.empty(times.size, dtype=RECORD)
+        records['time'] = times
+        records['values'] = values
+        new = not os.path.isfile(path)
+        with open(path, "ab") as fh:
+            if new:
+                fh.write(self._header())
+            fh.write(records.tobytes())
+        count = (os.path.getsize(path) - HEADER.itemsize) // RECORD.itemsize
+        if count > max(COMPACT_MIN, COMPACT_RATIO * len(series)):
+            self.compact(epic, resolution, series)
+
+    def compact(self, epic, resolution, series):
+        """rewrite the file with just the bars of series"""
+        path = self._path(epic, resolution)
+        if not os.path.isdir(self._dir(epic)):
+            os.makedirs(self._dir(epic))
+        times, values = series.fields()
+        records = np.empty(times.size, dtype=RECORD)
+        records['time'] = times
+        records['values'] = values
+        with open(path + ".tmp", "wb") as fh:
+            fh.write(self._header())
+            fh.write(records.tobytes())
+        os.replace(path + ".tmp", path)
+
+    def remove(self, epic, resolution=None):
+        """delete the files of one resolution, or all of them for epic"""
+        for res in self.resolutions(epic) if resolution is None else [resolution]:
+            path = self._path(epic, res)
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def json_path(self, epic):
+        return os.path.join(self.root, epic + ".json")
+
+    def import_json(self, epic, path=None):
+        """convert a price file in the old {"prices": {res: [bars]}} layout, returns the series"""
+        path = self.json_path(epic) if path is None else path
+        with open(path, 'r') as fh:
+            data = json.load(fh)
+        prices = {}
+        for res, bars in data['prices'].items():
+            series = BarSeries(bars)
+            self.compact(epic, res, series)
+            prices[res] = series
+        return prices
+
+    def export_json(self, epic, prices=None, path=None):
+        """write the old JSON layout from the stored bars (or the given series)"""
+        if prices is None:
+            prices = {}
+            for res, (times, values) in self.load(epic).items():
+                series = BarSeries()
+                series.load_fields(times, values)
+                prices[res] = series
+        path = self.json_path(epic) if path is None else path
+        with open(path, 'w') as fh:
+            json.dump({"prices": {res: series.to_list() for res, series in prices.items()}}, fh)
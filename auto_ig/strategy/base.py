@@ -1,6 +1,7 @@
 import logging
+import bisect
 import datetime
-from pytz import timezone
+import threading
 # from ..sig import Sig
 from .. import indicators as ta
 from .. import detection as detect
@@ -24,11 +25,15 @@ class Strategy:
      we'll rename to Sigs for time being
      - process() - handle indicator updates and check our signals
      - prediction() - generate a prediction object for trade - 
+     - vectorised - optional, per resolution: the signals a resolutions function
+       would make on every bar, from one pass over the whole series (see backfill)
      """
     def __init__(self, name):
         self.name = name
-        self.signals = []
+        self.signals = SignalStore()
         self.resolutions = {}
+        # resolution: fn(market, prices, resolution, start) -> [(bar index, Sig)] for the bars from start
+        self.vectorised = {}
 
     # def backfill(self,market,resolution,lookback=15):
     #     prices = market.prices[resolution]
@@ -57,16 +62,33 @@ class Strategy:
 
     def process_signals(self,market,prices,resolution):
         """process signals for given resolution"""
-        for s in [x for x in self.signals if x.market == market.epic and x.resolution==resolution]:
+        for s in self.signals.for_series(market.epic, resolution):
             if not s.process():
                 self.signals.remove(s)
 
         if resolution in self.resolutions:
             self.resolutions[resolution](market,prices,resolution)
             
+    def backfill(self,market,prices,resolution,lookback=10):
+        """what process_signals on each of the last lookback+1 prefixes of prices would leave
+        in the signals - the indicators are worked out once and the signals come from the
+        vectorised function, so it's a pass over the series rather than one per prefix"""
+        start = max(len(prices) - lookback - 1, 0)
+        events = {}
+        for i, sig in self.vectorised[resolution](market,prices,resolution,start):
+            events.setdefault(i, []).append(sig)
+
+        for i in range(start, len(prices)):
+            for s in self.signals.for_series(market.epic, resolution):
+                if not s.process():
+                    self.signals.remove(s)
+            for sig in events.get(i, []):
+                self.add_signal(sig,market)
+
     def get_signals(self,market, resolution, signal_name):
         """returns a list of signals for the market by given name and resolution"""
-        return [x for x in self.signals if x.market==market.epic and x.name == signal_name and x.resolution==resolution]
+        sig = self.signals.get(market.epic, resolution, signal_name)
+        return [] if sig is None else [sig]
 
     def prediction(self, signal,market,resolution):
         """default stoploss and limit calculator based on atr_5"""
@@ -123,12 +145,8 @@ class Strategy:
 
     def add_signal(self,signal, market):
         """makes sure that only one of each type of signal is stored"""
-        matching_signals = [x for x in self.signals if x.name==signal.name and x.market==market.epic and x.resolution==signal.resolution]
-        for s in matching_signals:
-            self.signals.remove(s)
-        
-        print("removed {} matching {} signals".format(len(matching_signals),signal.name))
-        self.signals.append(signal)
+        replaced = self.signals.add(signal)
+        logger.debug("removed {} matching {} signals".format(0 if replaced is None else 1,signal.name))
 
     def trailing_stop(self,trade):
         return False, 0
@@ -248,7 +266,7 @@ class Strategy:
         direction = False
 
 
-        time_now = datetime.datetime.time(datetime.datetime.now(timezone('GB')).replace(tzinfo=None))
+        time_now = market.ig.now().time()
         
         allowed_epics = []
         if (datetime.time(7,00) < time_now < datetime.time(16,00)):
@@ -303,3 +321,130 @@ class Sig:
             return False
 
         return True
+
+
+class SignalStore:
+    """Strategy.signals - one Sig per (epic, resolution, name)
+
+    Signals are held in a dict by that key and also grouped by epic and by
+    (epic, resolution), so adding, replacing, expiring and looking them up
+    are a few dict operations whatever else is in the store. For the /signals
+    view they're bucketed by timestamp too, in the order they were added, with
+    the timestamps kept in order alongside: signals mostly come in time order,
+    so a new timestamp goes on the end, and an older one (eg. another market's
+    backfill) is a bisect into the distinct timestamps. A bucket that empties
+    is left in place until the empty ones outnumber the rest, then they're
+    dropped in one pass. newest() just walks the buckets backwards.
+    Strategies are shared by every market, so the engine and streaming threads
+    both get here and changes go through the store's lock. It also iterates,
+    and has append/remove, like the list it replaced.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.signals = {}
+        self.epics = {}
+        self.series = {}
+        # {timestamp: {key: sig}}, and the timestamps in order
+        self.times = {}
+        self.timeline = []
+        self._empty = 0
+
+    def __getstate__(self):
+        with self.lock:
+            return {'signals': list(self.signals.values())}
+
+    def __setstate__(self, state):
+        self.__init__()
+        signals = state['signals']
+        # a store pickled before the timestamp buckets had the dict
+        if isinstance(signals, dict):
+            signals = signals.values()
+        for sig in signals:
+            self.add(sig)
+
+    @staticmethod
+    def key(sig):
+        return (sig.market, sig.resolution, sig.name)
+
+    def add(self, sig):
+        """store sig, returns the signal with the same key it replaced (or None)"""
+        key = self.key(sig)
+        with self.lock:
+            replaced = self.signals.get(key)
+            if replaced is not None:
+                self.remove(replaced)
+            self.signals[key] = sig
+            self.epics.setdefault(sig.market, {})[key] = sig
+            self.series.setdefault((sig.market, sig.resolution), {})[key] = sig
+            bucket = self.times.get(sig.timestamp)
+            if bucket is None:
+                bucket = self.times[sig.timestamp] = {}
+                if not self.timeline or sig.timestamp > self.timeline[-1]:
+                    self.timeline.append(sig.timestamp)
+                else:
+                    bisect.insort(self.timeline, sig.timestamp)
+            elif not bucket:
+                self._empty -= 1
+            bucket[key] = sig
+        return replaced
+
+    append = add
+
+    def remove(self, sig):
+        key = self.key(sig)
+        with self.lock:
+            if self.signals.get(key) is not sig:
+                raise ValueError("{} isn't in the store".format(key))
+            del self.signals[key]
+            del self.epics[sig.market][key]
+            del self.series[(sig.market, sig.resolution)][key]
+            bucket = self.times[sig.timestamp]
+            del bucket[key]
+            if not bucket:
+                self._empty += 1
+                if self._empty > len(self.times) - self._empty:
+                    self._drop_empty()
+
+    def _drop_empty(self):
+        self.timeline = [t for t in self.timeline if self.times[t]]
+        self.times = dict((t, self.times[t]) for t in self.timeline)
+        self._empty = 0
+
+    def get(self, epic, resolution, name):
+        return self.signals.get((epic, resolution, name))
+
+    def for_epic(self, epic):
+        with self.lock:
+            return list(self.epics.get(epic, {}).values())
+
+    def for_series(self, epic, resolution):
+        with self.lock:
+            return list(self.series.get((epic, resolution), {}).values())
+
+    def newest(self):
+        """every signal, newest timestamp first, the last added first within one"""
+        with self.lock:
+            signals = []
+            for t in reversed(self.timeline):
+                signals.extend(reversed(list(self.times[t].values())))
+            return signals
+
+    def clear(self):
+        with self.lock:
+            self.signals.clear()
+            self.epics.clear()
+            self.series.clear()
+            self.times.clear()
+            self.timeline = []
+            self._empty = 0
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.signals.values()))
+
+    def __len__(self):
+        return len(self.signals)
+
+    def __contains__(self, sig):
+        return self.signals.get(self.key(sig)) is sig
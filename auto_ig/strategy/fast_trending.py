@@ -76,7 +76,7 @@ class fast_trending(Strategy):
         """default stoploss and limit calculator based on atr_14"""
 
         prices = market.prices[resolution]
-        atr, tr = ta.atr(14,prices)
+        atr, tr = market.indicators.bind(resolution,prices).atr(14)
         low_range = min(tr)
         max_range = max(tr)
  
@@ -142,16 +142,17 @@ class fast_trending(Strategy):
             if market.epic not in self.atrs:
                 self.atrs[market.epic] = {}
             
-            self.atrs[market.epic][resolution],tr = ta.atr(14,prices)
+            ind = market.indicators.bind(resolution,prices)
+            self.atrs[market.epic][resolution],tr = ind.atr(14)
             
             print("HEY YO")
-            trend = ta.ema(100,prices)
+            trend = ind.ema(100)
 
             # bb_u,bb_l,ma = ta.bollinger_bands(20,2,prices)
 
-            ma = ta.ma(20,prices)
+            ma = ind.ma(20)
 
-            ema = ta.ema(5,prices)
+            ema = ind.ema(5)
             now = prices[-1]
             if detect.crossover(ema,ma) and ma[-1] > trend[-1]:
                 sig = Sig(market,"OPEN",now['snapshotTime'],"BUY",4,resolution,comment="crossover matches trend",life=1)
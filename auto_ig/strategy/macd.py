@@ -3,8 +3,8 @@ import os,sys
 from numbers import Number
 import math
 import datetime
+import numpy as np
 from pytz import timezone
-from .. import indicators as ta
 from .. import detection as detect
 from .base import Strategy, Sig
  
@@ -32,15 +32,21 @@ class macd(Strategy):
             - if close price < ema40
     """
  
-    def __init__(self):
+    def __init__(self, atr_length=14, stop_atr=1, limit_multiple=3):
         name = "macd"
         super().__init__(name)
+        # prediction's stop is stop_atr ATRs plus twice the spread, the limit limit_multiple stops
+        self.atr_length = atr_length
+        self.stop_atr = stop_atr
+        self.limit_multiple = limit_multiple
  
  
         self.last_state = "NONE"
 
         self.resolutions['HOUR_4'] = self.h4
         self.resolutions['HOUR'] = self.h4
+        self.vectorised['HOUR_4'] = self.h4_all
+        self.vectorised['HOUR'] = self.h4_all
 
         self.atrs = {}
 
@@ -76,13 +82,13 @@ class macd(Strategy):
         """default stoploss and limit calculator based on atr_14"""
 
         prices = market.prices[resolution]
-        atr, tr = ta.atr(14,prices)
+        atr, tr = market.indicators.bind(resolution,prices).atr(self.atr_length)
         low_range = min(tr)
         max_range = max(tr)
  
         
-        stop = (atr[-1]) + (market.spread*2)
-        limit = stop*3
+        stop = (atr[-1]*self.stop_atr) + (market.spread*2)
+        limit = stop*self.limit_multiple
  
         # limit = max(limit,4)
         # limit = min(7,limit)
@@ -142,16 +148,16 @@ class macd(Strategy):
             if market.epic not in self.atrs:
                 self.atrs[market.epic] = {}
             
-            self.atrs[market.epic][resolution],tr = ta.atr(14,prices)
-            
-            print("HEY YO")
-            trend = ta.ema(100,prices)
-            ma = ta.ma(20,prices)
+            ind = market.indicators.bind(resolution,prices)
+            self.atrs[market.epic][resolution],tr = ind.atr(self.atr_length)
+
+            trend = ind.ema(100)
+            ma = ind.ma(20)
 
-            macd,histo = ta.macd(prices)
+            macd,histo = ind.macd()
             # stoch_k, stoch_d = ta.stochastic(prices,5,3,3)
-            close_ema = ta.ema(5,prices)
-            close_ma = ta.ma(8,prices)
+            close_ema = ind.ema(5)
+            close_ma = ind.ma(8)
 
             # ma_dir = close_ma[-1] - close_ma[-2]
             # ema_dir = close_ema[-1] - close_ema[-2]
@@ -217,6 +223,47 @@ class macd(Strategy):
         
 
 
+    def h4_all(self,market,prices,resolution,start=0):
+        """h4's signals for every bar from start on, as [(index, Sig)]"""
+        try:
+            if len(prices)<100:
+                logger.warning("{} {} need more data".format(market.epic,resolution))
+                return []
+            if market.epic not in self.atrs:
+                self.atrs[market.epic] = {}
+
+            ind = market.indicators.bind(resolution,prices)
+            self.atrs[market.epic][resolution],tr = ind.atr(self.atr_length)
+
+            trend = ind.ema(100)
+            ma = ind.ma(20)
+            macd,histo = ind.macd()
+
+            # h4 needs 100 bars, so nothing before the 100th
+            ready = np.arange(len(prices)) >= max(start, 99)
+            with np.errstate(invalid='ignore'):
+                buys = ready & (ma > trend) & detect.crossovers(macd,0)
+                sells = ready & (ma < trend) & detect.crossunders(macd,0)
+
+            sigs = []
+            for i in np.flatnonzero(buys | sells):
+                if buys[i]:
+                    sig = Sig(market,"OPEN",prices[i]['snapshotTime'],"BUY",4,resolution,comment="macd 0 cross over",life=0)
+                else:
+                    sig = Sig(market,"OPEN",prices[i]['snapshotTime'],"SELL",4,resolution,comment="macd 0 cross under",life=0)
+                sigs.append((int(i), sig))
+            return sigs
+
+        except Exception as e:
+            exc_type, exc_obj, exc_tb = sys.exc_info()
+            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+            logger.info("{} backfill fail".format(market.epic))
+            logger.info(exc_type)
+            logger.info(fname)
+            logger.info(exc_tb.tb_lineno)
+            logger.info(exc_obj)
+            return []
+
     def trailing_stop(self,trade):
         res = trade.prediction['signal']['resolution']
         use_trail = True if res in ['HOUR_4','HOUR'] else False
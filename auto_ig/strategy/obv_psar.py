@@ -93,7 +93,7 @@ class obv_psar(Strategy):
             roc = ta.roc(36,market.prices['MINUTE_30'])
             now_day = market.prices['DAY'][-1]
             day_psar_dir = "BUY"
-            if isinstance(now_day['psar_bear'], Number):
+            if isinstance(now_day.get('psar_bear'), Number):
                 day_psar_dir = "SELL"
 
             # want to look at the daily trends before even considering opening a position
@@ -113,7 +113,7 @@ class obv_psar(Strategy):
             min30wma_delta = min30wma[-1] - min30wma[-2]
 
             dir30 = "BUY"
-            if isinstance(now30['psar_bear'], Number):
+            if isinstance(now30.get('psar_bear'), Number):
                 dir30 = "SELL"
             roc_delta = roc[-1] - roc[-2]
             market.data['wma_delta'] = wma_delta
@@ -145,14 +145,14 @@ class obv_psar(Strategy):
             if flip30:
                 score = 2
                 com = "MIN 30 PSAR flip - CLOSE"
-                if daydir=="BUY" and obv_ma[-1] > 0 and isinstance(now['psar_bull'],Number):
+                if daydir=="BUY" and obv_ma[-1] > 0 and isinstance(now.get('psar_bull'),Number):
                     score = 4
                     com = "MIN 30 PSAR flip - OPEN"
                     sig = Sig("PSAR_30_FLIP",now30['snapshotTime'],flip30,4,comment = com,life=1)
 
                     super().add_signal(sig,market)
                     
-                if daydir=="SELL" and obv_ma[-1] < 0 and isinstance(now['psar_bear'],Number):
+                if daydir=="SELL" and obv_ma[-1] < 0 and isinstance(now.get('psar_bear'),Number):
                     score = 4
                     com = "MIN 30 PSAR flip - OPEN"
                     sig = Sig("PSAR_30_FLIP",now30['snapshotTime'],flip30,4,comment = com,life=1)
@@ -163,13 +163,13 @@ class obv_psar(Strategy):
 
             # check for obv_ma crossovers
             if detect.crossover(obv_ma,0):
-                if daydir=="BUY" and isinstance(now['psar_bull'],Number):
+                if daydir=="BUY" and isinstance(now.get('psar_bull'),Number):
                     sig = Sig("OBV_OPEN",now['snapshotTime'],"BUY",4,comment = "ZERO_CROSS",life=1)
                 
                     super().add_signal(sig,market)
 
             if detect.crossunder(obv_ma,0):
-                if daydir=="SELL" and isinstance(now['psar_bear'],Number):
+                if daydir=="SELL" and isinstance(now.get('psar_bear'),Number):
                     sig = Sig("OBV_OPEN",now['snapshotTime'],"SELL",4,comment = "ZERO_CROSS",life=1)
                 
                     super().add_signal(sig,market)
@@ -226,14 +226,14 @@ class obv_psar(Strategy):
     def is_psar_type(self,typename,*times):
         ret_val = True
         for t in times:
-            if not isinstance(t[typename],Number):
+            if not isinstance(t.get(typename),Number):
                 ret_val = False
         return ret_val
 
     def psar_flip(self,now,prev):
-        if isinstance(now['psar_bull'],Number) and not isinstance(prev['psar_bull'],Number):
+        if isinstance(now.get('psar_bull'),Number) and not isinstance(prev.get('psar_bull'),Number):
             return "BUY"
-        if isinstance(now['psar_bear'],Number) and not isinstance(prev['psar_bear'],Number):
+        if isinstance(now.get('psar_bear'),Number) and not isinstance(prev.get('psar_bear'),Number):
             return "SELL"
         
         return False
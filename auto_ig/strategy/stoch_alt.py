@@ -3,8 +3,8 @@ import os,sys
 from numbers import Number
 import math
 import datetime
+import numpy as np
 from pytz import timezone
-from .. import indicators as ta
 from .. import detection as detect
 from .base import Strategy, Sig
  
@@ -32,9 +32,13 @@ class stoch_alt(Strategy):
             - if close price < ema40
     """
  
-    def __init__(self):
+    def __init__(self, atr_length=14, stop_atr=2, limit_multiple=2):
         name = "stoch_alt"
         super().__init__(name)
+        # prediction's stop is stop_atr ATRs plus twice the spread, the limit limit_multiple stops
+        self.atr_length = atr_length
+        self.stop_atr = stop_atr
+        self.limit_multiple = limit_multiple
  
  
         self.last_state = "NONE"
@@ -42,6 +46,9 @@ class stoch_alt(Strategy):
         self.resolutions['HOUR_4'] = self.h4
         self.resolutions['HOUR'] = self.h4
         self.resolutions['MINUTE_5'] = self.fast
+        self.vectorised['HOUR_4'] = self.h4_all
+        self.vectorised['HOUR'] = self.h4_all
+        self.vectorised['MINUTE_5'] = self.fast_all
 
         self.atrs = {}
 
@@ -77,13 +84,13 @@ class stoch_alt(Strategy):
         """default stoploss and limit calculator based on atr_14"""
 
         prices = market.prices[resolution]
-        atr, tr = ta.atr(14,prices)
+        atr, tr = market.indicators.bind(resolution,prices).atr(self.atr_length)
         low_range = min(tr)
         max_range = max(tr)
  
         
-        stop = (atr[-1]*2) + (market.spread*2)
-        limit = stop*2
+        stop = (atr[-1]*self.stop_atr) + (market.spread*2)
+        limit = stop*self.limit_multiple
  
         # limit = max(limit,4)
         # limit = min(7,limit)
@@ -142,12 +149,13 @@ class stoch_alt(Strategy):
             if market.epic not in self.atrs:
                 self.atrs[market.epic] = {}
             
-            self.atrs[market.epic][resolution],tr = ta.atr(14,prices)
+            ind = market.indicators.bind(resolution,prices)
+            self.atrs[market.epic][resolution],tr = ind.atr(self.atr_length)
 
-            trend = ta.ema(100,prices)
-            ma = ta.ma(20,prices)
-            stoch_k, stoch_d = ta.stochastic(prices,5,3,3)
-            close_ema = ta.ema(5,prices)
+            trend = ind.ema(100)
+            ma = ind.ma(20)
+            stoch_k, stoch_d = ind.stochastic(5,3,3)
+            close_ema = ind.ema(5)
 
             now = prices[-1]
             
@@ -155,13 +163,13 @@ class stoch_alt(Strategy):
 
                 if close_ema[-1] > ma[-1] > trend[-1]:
                     # buy opportunity!
-                    print("BUYING {} {}".format(stoch_k[-1],stoch_d[-1]))
+                    logger.debug("BUYING {} {}".format(stoch_k[-1],stoch_d[-1]))
                     if detect.crossover(stoch_k,stoch_d) and min(stoch_k[-5:])<25:
                         sig = Sig(market,"FAST OPEN",now['snapshotTime'],"BUY",4,resolution,comment="k crossed d FAST MODE",life=0)
                         super().add_signal(sig,market)
                 
                 elif close_ema[-1] < ma[-1] < trend[-1]:
-                    print("SELLING {} {}".format(stoch_k[-1],stoch_d[-1]))
+                    logger.debug("SELLING {} {}".format(stoch_k[-1],stoch_d[-1]))
                     # sell opportunity!
                     if detect.crossunder(stoch_k,stoch_d) and max(stoch_k[-5:])>75:
                         sig = Sig(market,"FAST OPEN",now['snapshotTime'],"SELL",4,resolution,comment="d crossed k FAST MODE",life=0)
@@ -191,14 +199,14 @@ class stoch_alt(Strategy):
             if market.epic not in self.atrs:
                 self.atrs[market.epic] = {}
             
-            self.atrs[market.epic][resolution],tr = ta.atr(14,prices)
-            
-            print("HEY YO")
-            trend = ta.ema(100,prices)
-            ma = ta.ma(20,prices)
-            stoch_k, stoch_d = ta.stochastic(prices,5,3,3)
-            close_ema = ta.ema(5,prices)
-            close_ma = ta.ma(8,prices)
+            ind = market.indicators.bind(resolution,prices)
+            self.atrs[market.epic][resolution],tr = ind.atr(self.atr_length)
+
+            trend = ind.ema(100)
+            ma = ind.ma(20)
+            stoch_k, stoch_d = ind.stochastic(5,3,3)
+            close_ema = ind.ema(5)
+            close_ma = ind.ma(8)
 
             ma_dir = close_ma[-1] - close_ma[-2]
             ema_dir = close_ema[-1] - close_ema[-2]
@@ -218,13 +226,13 @@ class stoch_alt(Strategy):
 
             if ma[-1] > trend[-1]:
                 # buy opportunity!
-                print("BUYING {} {}".format(stoch_k[-1],stoch_d[-1]))
+                logger.debug("BUYING {} {}".format(stoch_k[-1],stoch_d[-1]))
                 if detect.crossover(stoch_k,stoch_d) and min(stoch_k[-5:])<25:
                     sig = Sig(market,"OPEN",now['snapshotTime'],"BUY",4,resolution,comment="k crossed d",life=0)
                     super().add_signal(sig,market)
             
             elif ma[-1] < trend[-1]:
-                print("SELLING {} {}".format(stoch_k[-1],stoch_d[-1]))
+                logger.debug("SELLING {} {}".format(stoch_k[-1],stoch_d[-1]))
                 # sell opportunity!
                 if detect.crossunder(stoch_k,stoch_d) and max(stoch_k[-5:])>75:
                     sig = Sig(market,"OPEN",now['snapshotTime'],"SELL",4,resolution,comment="d crossed k",life=0)
@@ -263,6 +271,64 @@ class stoch_alt(Strategy):
         
 
 
+    def fast_all(self,market,prices,resolution,start=0):
+        """fast's signals for every bar from start on, as [(index, Sig)]"""
+        if not self.good_spread(market):
+            return []
+        return self.stoch_all(market,prices,resolution,start,fast=True)
+
+    def h4_all(self,market,prices,resolution,start=0):
+        """h4's signals for every bar from start on, as [(index, Sig)]"""
+        return self.stoch_all(market,prices,resolution,start)
+
+    def stoch_all(self,market,prices,resolution,start=0,fast=False):
+        try:
+            if len(prices)<100:
+                logger.warning("{} {} need more data".format(market.epic,resolution))
+                return []
+            if market.epic not in self.atrs:
+                self.atrs[market.epic] = {}
+
+            ind = market.indicators.bind(resolution,prices)
+            self.atrs[market.epic][resolution],tr = ind.atr(self.atr_length)
+
+            trend = ind.ema(100)
+            ma = ind.ma(20)
+            stoch_k, stoch_d = ind.stochastic(5,3,3)
+
+            # fast and h4 need 100 bars, so nothing before the 100th
+            ready = np.arange(len(prices)) >= max(start, 99)
+            with np.errstate(invalid='ignore'):
+                up = ma > trend
+                down = ma < trend
+                if fast:
+                    close_ema = ind.ema(5)
+                    up &= close_ema > ma
+                    down &= close_ema < ma
+                buys = ready & up & detect.crossovers(stoch_k,stoch_d) & (detect.rolling_min(stoch_k,5) < 25)
+                sells = ready & down & detect.crossunders(stoch_k,stoch_d) & (detect.rolling_max(stoch_k,5) > 75)
+
+            name = "FAST OPEN" if fast else "OPEN"
+            mode = " FAST MODE" if fast else ""
+            sigs = []
+            for i in np.flatnonzero(buys | sells):
+                if buys[i]:
+                    sig = Sig(market,name,prices[i]['snapshotTime'],"BUY",4,resolution,comment="k crossed d" + mode,life=0)
+                else:
+                    sig = Sig(market,name,prices[i]['snapshotTime'],"SELL",4,resolution,comment="d crossed k" + mode,life=0)
+                sigs.append((int(i), sig))
+            return sigs
+
+        except Exception as e:
+            exc_type, exc_obj, exc_tb = sys.exc_info()
+            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+            logger.info("{} backfill fail".format(market.epic))
+            logger.info(exc_type)
+            logger.info(fname)
+            logger.info(exc_tb.tb_lineno)
+            logger.info(exc_obj)
+            return []
+
     def trailing_stop(self,trade):
         res = trade.prediction['signal']['resolution']
         use_trail = True if res in ['HOUR_4','HOUR','MINUTE_5'] else False
@@ -0,0 +1,544 @@
+import math
+from collections import deque
+import numpy as np
+
+# the inputs every indicator gets for a bar, all mid prices
+OPEN, HIGH, LOW, CLOSE, VOLUME, TYPICAL = range(6)
+INPUT_FIELDS = [('openPrice', 'mid'), ('highPrice', 'mid'), ('lowPrice', 'mid'), ('closePrice', 'mid'),
+                ('lastTradedVolume', None), ('typicalPrice', 'mid')]
+
+NAN = float('nan')
+
+
+class _Window:
+    """The last size values with running sums
+
+    Sums are kept incrementally and re-summed from scratch every size pushes
+    (or once a NaN has got in) so rounding errors can't build up.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.values = deque()
+        self.total = 0.0
+        self.weighted = 0.0
+        # squares are taken about shift to keep the variance accurate
+        self.shift = 0.0
+        self.squares = 0.0
+        self.pushes = 0
+
+    def sums(self, x):
+        """(count, total, weighted, squares, shift) the window would have with x pushed"""
+        n = len(self.values)
+        d = x - self.shift
+        if n < self.size:
+            return n + 1, self.total + x, self.weighted + (n + 1) * x, self.squares + d * d, self.shift
+        old = self.values[0]
+        o = old - self.shift
+        return n, self.total - old + x, self.weighted - self.total + n * x, self.squares - o * o + d * d, self.shift
+
+    def push(self, x, sums=None):
+        if sums is None:
+            sums = self.sums(x)
+        self.values.append(x)
+        if len(self.values) > self.size:
+            self.values.popleft()
+        self.pushes += 1
+        _, self.total, self.weighted, self.squares, _ = sums
+        if self.pushes % self.size == 0 or self.total != self.total:
+            self._resum()
+
+    def _resum(self):
+        self.shift = self.values[-1]
+        self.total = math.fsum(self.values)
+        self.weighted = math.fsum((i + 1) * v for i, v in enumerate(self.values))
+        self.squares = math.fsum((v - self.shift) ** 2 for v in self.values)
+
+    def next(self, x, commit=True):
+        """push x (or just look when commit is False), returns the window sums"""
+        sums = self.sums(x)
+        if commit:
+            self.push(x, sums)
+        return sums
+
+    def mean(self, sums):
+        n, total = sums[0], sums[1]
+        return total / n if n == self.size else NAN
+
+    def weighted_mean(self, sums):
+        n, weighted = sums[0], sums[2]
+        return weighted / (n * (n + 1) / 2.0) if n == self.size else NAN
+
+    def std(self, sums):
+        n, total, weighted, squares, shift = sums
+        if n != self.size:
+            return NAN
+        m = (total - n * shift) / n
+        return math.sqrt(max(squares / n - m * m, 0.0))
+
+
+def _ratio(upper, lower):
+    if lower == 0:
+        return math.inf if upper > 0 else NAN
+    return upper / lower
+
+
+class Indicator:
+    """Incremental indicator, fed one bar at a time
+
+    update(bar, commit) takes the inputs of the next bar (see INPUT_FIELDS) and
+    returns {column: value} for it. With commit=False nothing is changed, so the
+    bar still forming can be looked at on every tick and committed once complete.
+    A key of (column, back) sets the value of the bar back places earlier, for
+    indicators that only settle a bar once they've seen the next one.
+    """
+
+    source = CLOSE
+
+    def update(self, bar, commit=True):
+        return {self.name: self.next(bar[self.source], commit)}
+
+
+class EMA(Indicator):
+    def __init__(self, window, name=None):
+        self.alpha = 2 / (window + 1.0)
+        self.name = name or "ema_{}".format(window)
+        self.value = None
+
+    def next(self, x, commit=True):
+        value = x if self.value is None else (1 - self.alpha) * self.value + self.alpha * x
+        if commit:
+            self.value = value
+        return value
+
+
+class RMA(EMA):
+    """Wilder's moving average, an EMA with alpha 1/window"""
+
+    def __init__(self, window, name=None):
+        super().__init__(window, name or "rma_{}".format(window))
+        self.alpha = 1.0 / window
+
+
+class SMA(Indicator):
+    def __init__(self, window, name=None):
+        self.window = _Window(window)
+        self.name = name or "ma_{}".format(window)
+
+    def next(self, x, commit=True):
+        return self.window.mean(self.window.next(x, commit))
+
+
+class WMA(SMA):
+    def __init__(self, window, name=None):
+        super().__init__(window, name or "wma_{}".format(window))
+
+    def next(self, x, commit=True):
+        return self.window.weighted_mean(self.window.next(x, commit))
+
+
+class ATR(Indicator):
+    """average of the true range, tr is kept in its own column"""
+
+    def __init__(self, window, name=None):
+        self.name = name or "atr_{}".format(window)
+        self.tr_name = self.name + "_tr"
+        self.trs = SMA(window)
+        self.prev_close = None
+
+    def update(self, bar, commit=True):
+        tr = atr = NAN
+        if self.prev_close is not None:
+            high, low, prev = bar[HIGH], bar[LOW], self.prev_close
+            tr = max(high - low, abs(high - prev), abs(low - prev))
+            if high != high or low != low or prev != prev:
+                tr = NAN
+            atr = self.trs.next(tr, commit)
+        if commit:
+            self.prev_close = bar[CLOSE]
+        return {self.name: atr, self.tr_name: tr}
+
+
+class MACD(Indicator):
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.name = "macd_{}_{}_{}".format(fast, slow, signal)
+        self.signal_name = self.name + "_signal"
+        self.histogram_name = self.name + "_histogram"
+        self.fast = EMA(fast)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+
+    def update(self, bar, commit=True):
+        macd = self.fast.next(bar[CLOSE], commit) - self.slow.next(bar[CLOSE], commit)
+        signal = self.signal.next(macd, commit)
+        return {self.name: macd, self.signal_name: signal, self.histogram_name: macd - signal}
+
+
+class RSI(Indicator):
+    """Wilder RSI, as ta.rsi the first value is seeded from window + 1 changes
+    so it's only filled in once the bar after it has arrived"""
+
+    def __init__(self, window=14, name=None):
+        self.n = window
+        self.name = name or "rsi_{}".format(window)
+        self.prev = None
+        self.seed = []
+        self.up = None
+        self.down = None
+
+    def _step(self, up, down, delta):
+        n = self.n
+        up = (up * (n - 1) + max(delta, 0.)) / n
+        down = (down * (n - 1) + max(-delta, 0.)) / n
+        return up, down, 100. - 100. / (1. + _ratio(up, down))
+
+    def update(self, bar, commit=True):
+        close = bar[CLOSE]
+        out = {}
+        if self.prev is None:
+            if commit:
+                self.prev = close
+            return out
+
+        delta = close - self.prev
+        up, down = self.up, self.down
+        if up is None:
+            seed = self.seed + [delta]
+            if len(seed) == self.n + 1:
+                up = sum(d for d in seed if d >= 0) / self.n
+                down = -sum(d for d in seed if d < 0) / self.n
+                up, down, out[(self.name, 1)] = self._step(up, down, seed[-2])
+                up, down, out[self.name] = self._step(up, down, delta)
+            if commit:
+                self.seed = seed
+        else:
+            up, down, out[self.name] = self._step(up, down, delta)
+        if commit:
+            self.prev = close
+            self.up, self.down = up, down
+        return out
+
+
+class Stochastic(Indicator):
+    def __init__(self, length=5, smoothK=3, smoothD=3):
+        self.length = length
+        name = "{}_{}_{}".format(length, smoothK, smoothD)
+        self.k_name = 'stoch_k_{}'.format(name)
+        self.d_name = 'stoch_d_{}'.format(name)
+        self.highs = deque(maxlen=length)
+        self.lows = deque(maxlen=length)
+        self.k = SMA(smoothK)
+        self.d = SMA(smoothD)
+        self.k_from = length + smoothK - 2
+        self.count = 0
+
+    def update(self, bar, commit=True):
+        count = self.count
+        k = d = NAN
+        if count + 1 >= self.length:
+            skip = 1 if len(self.highs) == self.length else 0
+            high = max(max(list(self.highs)[skip:], default=bar[HIGH]), bar[HIGH])
+            low = min(min(list(self.lows)[skip:], default=bar[LOW]), bar[LOW])
+            raw = (bar[CLOSE] - low) / (high - low) * 100 if high != low else NAN
+            k = self.k.next(raw, commit)
+            if count >= self.k_from:
+                d = self.d.next(k, commit)
+        if commit:
+            self.highs.append(bar[HIGH])
+            self.lows.append(bar[LOW])
+            self.count += 1
+        return {self.k_name: k, self.d_name: d}
+
+
+class MFI(Indicator):
+    def __init__(self, length=14):
+        self.name = 'mfi_{}'.format(length)
+        self.upper = _Window(length)
+        self.lower = _Window(length)
+        self.prev = None
+
+    def update(self, bar, commit=True):
+        tp = bar[TYPICAL]
+        mfi = NAN
+        if self.prev is not None:
+            flow = bar[VOLUME] * tp
+            rising = self.prev < tp
+            upper = self.upper.next(flow if rising else 0, commit)
+            lower = self.lower.next(0 if rising else flow, commit)
+            if upper[0] == self.upper.size:
+                mfi = 100. - (100. / (1. + _ratio(upper[1], lower[1])))
+        if commit:
+            self.prev = tp
+        return {self.name: mfi}
+
+
+class OBV(Indicator):
+    """on balance volume less its wma, the wma is always over 10 bars like ta.obv"""
+
+    def __init__(self, smooth=10):
+        self.name = 'obv_{}'.format(smooth)
+        self.signal = WMA(10)
+        self.obv = 0.0
+        self.prev = None
+
+    def update(self, bar, commit=True):
+        close = bar[CLOSE]
+        histo = NAN
+        if self.prev is not None:
+            diff = close - self.prev
+            obv = self.obv
+            if diff > 0:
+                obv += bar[VOLUME]
+            elif diff < 0:
+                obv -= bar[VOLUME]
+            histo = obv - self.signal.next(obv, commit)
+            if commit:
+                self.obv = obv
+        if commit:
+            self.prev = close
+        return {self.name: histo}
+
+
+class PSAR(Indicator):
+    def __init__(self, iaf=0.02, maxaf=0.2):
+        self.name = "psar_{}_{}".format(iaf, maxaf)
+        self.bull_name = self.name + "_bull"
+        self.bear_name = self.name + "_bear"
+        self.iaf = iaf
+        self.maxaf = maxaf
+        self.count = 0
+        self.bull = True
+        self.af = iaf
+        self.hp = None
+        self.lp = None
+        self.psar = None
+        # high and low of the previous two bars, newest first
+        self.highs = ()
+        self.lows = ()
+
+    def update(self, bar, commit=True):
+        high, low = bar[HIGH], bar[LOW]
+        bull, af, hp, lp = self.bull, self.af, self.hp, self.lp
+        if self.count == 0:
+            hp, lp = high, low
+
+        if self.count < 2:
+            psar = bar[CLOSE]
+            out = {self.name: psar, self.bull_name: NAN, self.bear_name: NAN}
+        else:
+            prev = self.psar
+            if bull:
+                psar = prev + af * (hp - prev)
+            else:
+                psar = prev + af * (lp - prev)
+
+            reverse = False
+            if bull:
+                if low < psar:
+                    bull = False
+                    reverse = True
+                    psar = hp
+                    lp = low
+                    af = self.iaf
+            else:
+                if high > psar:
+                    bull = True
+                    reverse = True
+                    psar = lp
+                    hp = high
+                    af = self.iaf
+
+            if not reverse:
+                if bull:
+                    if high > hp:
+                        hp = high
+                        af = min(af + self.iaf, self.maxaf)
+                    psar = min(psar, *self.lows)
+                else:
+                    if low < lp:
+                        lp = low
+                        af = min(af + self.iaf, self.maxaf)
+                    psar = max(psar, *self.highs)
+
+            out = {self.name: psar, self.bull_name: psar if bull else NAN, self.bear_name: NAN if bull else psar}
+
+        if commit:
+            self.count += 1
+            self.bull, self.af, self.hp, self.lp = bull, af, hp, lp
+            self.psar = psar
+            self.highs = (high,) + self.highs[:1]
+            self.lows = (low,) + self.lows[:1]
+        return out
+
+
+class VWMA(Indicator):
+    def __init__(self, window):
+        self.name = "vwma_{}".format(window)
+        self.weights = _Window(window)
+        self.volumes = _Window(window)
+
+    def update(self, bar, commit=True):
+        weights = self.weights.mean(self.weights.next(bar[CLOSE] * bar[VOLUME], commit))
+        volumes = self.volumes.mean(self.volumes.next(bar[VOLUME], commit))
+        return {self.name: weights / volumes if volumes else NAN}
+
+
+class Bollinger(Indicator):
+    def __init__(self, window=20, multiplier=2, name=None):
+        name = name or "bb_{}_{}".format(window, multiplier)
+        self.upper_name = name + "_upper"
+        self.lower_name = name + "_lower"
+        self.basis_name = name + "_basis"
+        self.multiplier = multiplier
+        self.window = _Window(window)
+
+    def update(self, bar, commit=True):
+        sums = self.window.next(bar[CLOSE], commit)
+        basis = self.window.mean(sums)
+        dev = self.window.std(sums) * self.multiplier
+        return {self.upper_name: basis + dev, self.lower_name: basis - dev, self.basis_name: basis}
+
+
+class Stream:
+    """One indicator kept in step with a BarSeries
+
+    Bars are followed by their sequence number: every completed bar is fed in once
+    and committed, the newest bar is only looked at so its revisions cost the same.
+    If the series goes backwards (eg. a backtest prefix), drops bars we hadn't got
+    to, or has older bars rewritten the indicator starts again from the oldest bar.
+    """
+
+    def __init__(self, factory, params):
+        self.factory = factory
+        self.params = params
+        self.indicator = None
+        self.source = None
+        self.revision = None
+        self.committed = None
+
+    def reset(self, series):
+        self.indicator = self.factory(*self.params)
+        self.source = series._index
+        self.revision = series.revision
+        self.committed = series._first_seq - 1
+
+    def sync(self, series):
+        length = len(series)
+        if length == 0:
+            return self.indicator
+        first = series._first_seq
+        last = first + length - 1
+        if (self.indicator is None or series._index is not self.source or series.revision != self.revision
+                or self.committed < first - 1 or self.committed >= last):
+            self.reset(series)
+
+        start = self.committed + 1 - first
+        bars = np.column_stack([series.column(g, q)[start:] for g, q in INPUT_FIELDS]).tolist()
+        seq = self.committed + 1
+        for bar in bars[:-1]:
+            self._write(series, seq, self.indicator.update(bar, True))
+            seq += 1
+        self.committed = last - 1
+        self._write(series, last, self.indicator.update(bars[-1], False))
+        return self.indicator
+
+    def _write(self, series, seq, out):
+        for key, value in out.items():
+            name, back = key if isinstance(key, tuple) else (key, 0)
+            if seq - back >= series._first_seq:
+                series._extra(name)[series._slot(seq - back)] = value
+
+
+class IndicatorEngine:
+    """Streaming indicators for one market, one Stream per (resolution, indicator, params)
+
+    bind(resolution, prices) gives an object with the same calls as the
+    indicators module. Results are read-only arrays aligned with the series
+    (NaN until the indicator has warmed up); with a cache they're shared with
+    any other strategy asking for the same thing on the same bar.
+    """
+
+    def __init__(self, epic=None, cache=None):
+        self.epic = epic
+        self.cache = cache
+        self.streams = {}
+
+    def sync(self, resolution, series, factory, *params):
+        key = (resolution, factory.__name__, params)
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = Stream(factory, params)
+            self.streams[key] = stream
+        return stream.sync(series)
+
+    def bind(self, resolution, series):
+        return BoundIndicators(self, resolution, series)
+
+    def reset(self, resolution=None):
+        """forget the state of every stream, or just those of one resolution"""
+        if resolution is None:
+            self.streams.clear()
+        else:
+            for key in [k for k in self.streams if k[0] == resolution]:
+                del self.streams[key]
+
+
+class BoundIndicators:
+    """the engine's streams for one resolution's prices"""
+
+    def __init__(self, engine, resolution, series):
+        self.engine = engine
+        self.resolution = resolution
+        self.series = series
+
+    def _result(self, factory, params, columns):
+        """sync the stream then take its columns, through the cache when there is one"""
+        def compute():
+            ind = self.engine.sync(self.resolution, self.series, factory, *params)
+            values = tuple(self.series.extra(getattr(ind, c)) for c in columns)
+            return values[0] if len(values) == 1 else values
+
+        cache = self.engine.cache
+        if cache is None:
+            return compute()
+        key = cache.key(self.engine.epic, self.resolution, self.series, factory.__name__, params)
+        return cache.get(key, compute)
+
+    def ema(self, window):
+        return self._result(EMA, (window,), ('name',))
+
+    def rma(self, window):
+        return self._result(RMA, (window,), ('name',))
+
+    def ma(self, window):
+        return self._result(SMA, (window,), ('name',))
+
+    def wma(self, window):
+        return self._result(WMA, (window,), ('name',))
+
+    def atr(self, window):
+        return self._result(ATR, (window,), ('name', 'tr_name'))
+
+    def macd(self, fast=12, slow=26, signal=9):
+        return self._result(MACD, (fast, slow, signal), ('name', 'histogram_name'))
+
+    def rsi(self, window=14):
+        return self._result(RSI, (window,), ('name',))
+
+    def stochastic(self, length=5, smoothK=3, smoothD=3):
+        return self._result(Stochastic, (length, smoothK, smoothD), ('k_name', 'd_name'))
+
+    def mfi(self, length=14):
+        return self._result(MFI, (length,), ('name',))
+
+    def obv(self, smooth=10):
+        return self._result(OBV, (smooth,), ('name',))
+
+    def psar(self, iaf=0.02, maxaf=0.2):
+        return self._result(PSAR, (iaf, maxaf), ('name', 'bull_name', 'bear_name'))
+
+    def vwma(self, window):
+        return self._result(VWMA, (window,), ('name',))
+
+    def bollinger_bands(self, window=20, multiplier=2):
+        return self._result(Bollinger, (window, multiplier), ('upper_name', 'lower_name', 'basis_name'))
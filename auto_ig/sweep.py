@@ -0,0 +1,97 @@
+import datetime
+import itertools
+import logging
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .backtest import Backtest
+
+logger = logging.getLogger(__name__)
+
+SWEEP_ROOT = "sweeps/"
+# what each backtest in a sweep is scored on, a column apiece in the results
+METRICS = ["pnl", "max_drawdown", "win_rate", "trades", "wins", "losses", "premiums", "seconds"]
+
+
+def run_one(strategy, params, epics, start, end, backtest):
+    """backtest one set of constructor params for strategy (a Strategy class), returns its metrics
+    - runs in the pool's processes, see PriceStore.read for how the bars are read"""
+    s = strategy(**params)
+    results = Backtest(epics, start, end, strategies={s.name: s}, **backtest).run(quiet=True)
+    if results['win_rate'] is None:
+        results['win_rate'] = float('nan')
+    return [results[m] for m in METRICS]
+
+
+class Sweep:
+    """Backtests a strategy over a grid (or a random sample of it) of constructor params
+
+    grid is {param: [values]}: every combination gets run, or samples of them
+    picked at random when samples is given. The backtests are spread over a
+    process pool - a worker per core unless processes says otherwise. Each
+    backtest reads the price files mapped (see PriceStore.read), so what the
+    workers share is the OS's page cache; every one still copies the bars it
+    replays into its own series, and an uncompacted file is read into memory
+    per worker. The results go to a columnar .npz, a column per param and per
+    METRICS entry.
+
+    On Windows the pool starts fresh interpreters, so run it from under an
+    if __name__ == "__main__": guard.
+    """
+
+    def __init__(self, strategy, grid, epics, start=None, end=None, samples=None, processes=None, seed=None, **backtest):
+        self.strategy = strategy
+        self.grid = dict(grid)
+        self.epics = list(epics)
+        self.start = start
+        self.end = end
+        self.samples = samples
+        self.processes = processes or os.cpu_count()
+        self.seed = seed
+        # anything else for Backtest, eg. spread, slippage
+        self.backtest = backtest
+
+    def combinations(self):
+        """the params to run, as a list of dicts"""
+        names = list(self.grid)
+        combos = list(itertools.product(*(self.grid[n] for n in names)))
+        if self.samples is not None and self.samples < len(combos):
+            combos = random.Random(self.seed).sample(combos, self.samples)
+        return [dict(zip(names, c)) for c in combos]
+
+    def run(self, path=None):
+        """run every backtest, write the results to path (by default under SWEEP_ROOT), returns them as columns"""
+        combos = self.combinations()
+        started = time.monotonic()
+        logger.info("sweeping {} over {} param sets on {} processes".format(self.strategy.__name__, len(combos), self.processes))
+        with ProcessPoolExecutor(max_workers=self.processes) as pool:
+            futures = [pool.submit(run_one, self.strategy, params, self.epics, self.start, self.end, self.backtest)
+                       for params in combos]
+            rows = [f.result() for f in futures]
+
+        columns = {}
+        for name in self.grid:
+            columns[name] = np.array([params[name] for params in combos])
+        for i, metric in enumerate(METRICS):
+            columns[metric] = np.array([row[i] for row in rows], dtype=float)
+        logger.info("sweep of {} took {}s".format(self.strategy.__name__, round(time.monotonic() - started, 1)))
+
+        if path is None:
+            stamp = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M-%S")
+            path = os.path.join(SWEEP_ROOT, "{}-{}.npz".format(self.strategy.__name__, stamp))
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        np.savez(path, **columns)
+        return columns
+
+    @staticmethod
+    def best(columns, metric="pnl", count=5):
+        """the count best rows of a sweep's results by metric, as dicts"""
+        values = columns[metric]
+        order = np.argsort(-np.where(np.isnan(values), -np.inf, values))[:count]
+        return [dict((k, v[i].item()) for k, v in columns.items()) for i in order]
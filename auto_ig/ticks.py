@@ -0,0 +1,90 @@
+import numpy as np
+
+# ticks kept per epic
+TICK_DEPTH = 2048
+
+# fields of the CHART:<epic>:TICK subscription, and their slots in its records
+TICK_FIELDS = ["BID", "OFR", "UTM"]
+(BID, OFR, UTM) = range(len(TICK_FIELDS))
+TICK_PARSERS = {"BID": float, "OFR": float, "UTM": int}
+
+
+class TickBuffer:
+    """Ring of the last size ticks of one epic (UTM ms, bid, offer) and the latest of each"""
+
+    def __init__(self, size=TICK_DEPTH):
+        self.times = np.zeros(size, dtype=np.int64)
+        self.bids = np.zeros(size)
+        self.offers = np.zeros(size)
+        self.count = 0
+        self.time = None
+        self.bid = None
+        self.offer = None
+
+    def __len__(self):
+        return min(self.count, self.times.size)
+
+    def push(self, utm, bid, offer):
+        i = self.count % self.times.size
+        self.times[i] = utm
+        self.bids[i] = bid
+        self.offers[i] = offer
+        self.count += 1
+        self.time, self.bid, self.offer = utm, bid, offer
+
+    def last(self, n=None):
+        """(times, bids, offers) of the last n ticks (all of them by default), oldest first"""
+        n = len(self) if n is None else min(n, len(self))
+        index = np.arange(self.count - n, self.count) % self.times.size
+        return self.times[index], self.bids[index], self.offers[index]
+
+
+class TickDispatcher:
+    """Hands ticks to the open trades whose stops they might trip
+
+    Each watched trade is held with the band of prices its stops don't care
+    about (see Trade.stop_band) - between its trailing/artificial stop and its
+    best price so far. A tick inside the band is just recorded, one outside
+    it gets Trade.check_stops run there and then and the band worked out again.
+    So the cost of a tick is a comparison per open trade on its epic.
+    """
+
+    def __init__(self):
+        # epic: {trade: (low, high)}
+        self.watching = {}
+
+    def watch(self, trade):
+        """(re)work out the band of an open trade, stop watching it if it isn't open"""
+        band = trade.stop_band()
+        if band is None:
+            self.unwatch(trade)
+            return
+        low, high = band
+        level = float(trade.open_level)
+        if trade.prediction['direction_to_trade'] == "SELL":
+            # pip_diff = open - offer
+            prices = (level - high, level - low)
+        else:
+            # pip_diff = bid - open
+            prices = (level + low, level + high)
+        self.watching.setdefault(trade.market.epic, {})[trade] = prices
+
+    def unwatch(self, trade):
+        trades = self.watching.get(trade.market.epic)
+        if trades is not None:
+            trades.pop(trade, None)
+
+    def on_tick(self, market, record):
+        """a CHART:<epic>:TICK update for market"""
+        if market is None:
+            return
+        market.set_tick(record)
+        trades = self.watching.get(market.epic)
+        if not trades:
+            return
+        for trade, (low, high) in list(trades.items()):
+            price = market.offer if trade.prediction['direction_to_trade'] == "SELL" else market.bid
+            if low < price < high:
+                continue
+            trade.check_stops()
+            self.watch(trade)
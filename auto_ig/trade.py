@@ -1,14 +1,12 @@
 import logging
-import time as systime
 import os,sys
 import datetime
-import requests
 import json
 import copy
 import operator
+import threading
 from enum import IntEnum
 import numpy as np
-from pytz import timezone
 # from sklearn.linear_model import LinearRegression
 
 logger = logging.getLogger(__name__)
@@ -33,6 +31,12 @@ class TradeState(IntEnum):
     FAILED = 4
 
 class Trade:
+    # the TradeRegistry holding this trade, told when the deal id or state changes
+    registry = None
+    _deal_id = None
+    _state = None
+    # a close has been handed to the order desk and hasn't finished yet
+    closing = False
 
     def __init__(self,size, market, prediction, json_data = None):
         self.size_value = size
@@ -46,7 +50,7 @@ class Trade:
             self.status_log = []
             
             # this trade position will expire after 10 minutes if we've failed to open it
-            self.created_time = datetime.datetime.now(timezone('GB')).replace(tzinfo=None)
+            self.created_time = self.market.ig.now()
             mins = 60
             if "SLOW" in self.prediction['signal']['name']:
                 mins = 240
@@ -74,6 +78,7 @@ class Trade:
             
             self.log_status("Created Trade")
             self.json_obj = {}
+            self.save_trade()
 
         else:
             
@@ -82,27 +87,55 @@ class Trade:
     
         self.loop_counter = 0
 
+    @property
+    def deal_id(self):
+        return self._deal_id
+
+    @deal_id.setter
+    def deal_id(self, value):
+        old, self._deal_id = self._deal_id, value
+        if old != value:
+            if self.registry is not None:
+                self.registry.moved(self, "deal_id", old, value)
+            if old is not None:
+                self.market.ig.journal.record(self, "deal_id", value)
+
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        old, self._state = self._state, value
+        if old != value:
+            if self.registry is not None:
+                self.registry.moved(self, "state", old, value)
+            # the first one's set as the trade's made or loaded, and is in its snapshot
+            if old is not None:
+                self.market.ig.journal.record(self, "state", int(value))
+
+    def file_name(self):
+        return self.created_time.strftime("%Y-%m-%d-%H-%M-%S") + "---" + self.market.epic + ".json"
+
     def log_status(self, message):
-        """Add a message to the status list"""
-        time_now = datetime.datetime.now(timezone('GB')).replace(tzinfo=None)
-        logger.info("{}: {}: '{}'".format(self.market.epic, time_now.strftime("%Y:%m:%d-%H:%M:%S"),message))
-        self.status_log.append({"timestamp":time_now.strftime("%Y:%m:%d-%H:%M:%S"), "message":message})
-        self.save_trade()
+        """Add a message to the status list, and journal it"""
+        time_now = self.market.ig.now().strftime("%Y:%m:%d-%H:%M:%S")
+        logger.info("{}: {}: '{}'".format(self.market.epic, time_now,message))
+        self.status_log.append({"timestamp":time_now, "message":message})
+        self.market.ig.journal.record(self, "log", message, time_now)
     
 
 
     def update(self):
         try:
-            time_now = datetime.datetime.now(timezone('GB')).replace(tzinfo=None)
+            time_now = self.market.ig.now()
 
 
             if self.state == TradeState.CLOSED or self.state == TradeState.FAILED:
                 # IF FAILED OR CLOSED, SAVE AND RETURN FALSE TO REMOVE FROM LIST
                 self.log_status("Trade {}".format(TradeState(self.state).name))
-                self.save_trade()
-                base_url = self.market.ig.api_url + '/positions/'+ self.deal_id
-                auth_r = requests.get(base_url, headers=self.market.ig.authenticate())
-                if int(auth_r.status_code) == 400 or int(auth_r.status_code) == 404:
+                # the positions AutoIG knows of come from one GET /positions and the TRADE stream
+                if not self.market.ig.position_open(self.deal_id):
                     self.log_status("Trade confirmed closed in IG")
                     return False
 
@@ -122,60 +155,11 @@ class Trade:
                     self.state = TradeState.FAILED
 
             elif self.state == TradeState.OPEN:
-                timeopen = time_now - self.opened_time
-                # store the last full minute
-                
-                # calculate pip diff based on trade direction
-                if self.prediction['direction_to_trade'] == "SELL":
-                    self.pip_diff = float(self.open_level) - float(self.market.offer)
-
-                else:
-                    self.pip_diff = float(self.market.bid) - float(self.open_level)
-                
-
-
-                
-                self.profit_loss = self.size_value * self.pip_diff
-
-                # trade_logger.info("{}:{}".format(self.market.epic,self.profit_loss))
-                if self.pip_diff > self.pip_max:
-                    self.pip_max = self.pip_diff
-
-                if self.pip_diff < self.pip_min:
-                    self.pip_min = self.pip_diff
-
-                # rough trail calc - update with strategy method one day?
-                stoploss = float(self.prediction['stoploss'])
-                # self.trailing_level = self.pip_max - 8
-
-                self.trailing_stop,self.trailing_level = self.market.ig.strategy[self.prediction['strategy']].trailing_stop(self)
-
-                # if self.trailing_stop:
-                # if self.pip_diff>8 and self.trailing_stop==False:
-                #     self.trailing_stop = True
-                
-                if self.trailing_stop:
-                    if self.pip_diff < self.trailing_level:
-                        self.log_status("Trailing stop loss hit, closing at: {}".format(self.profit_loss))
-                        self.close_trade()
-
-
-                # STOP LOSS CHECKING
-                if float(self.pip_diff) < -stoploss and timeopen.seconds>120:
-                    # price diff has dropped below artifical stop loss! ABORT!
-                    self.log_status("TRADE HIT ARTIFICIAL STOPLOSS - ABORTING!")
-                    self.close_trade()
+                self.check_stops(time_now)
 
             
             self.loop_counter+=1
             if self.loop_counter>10:
-                if self.state == TradeState.OPEN:
-                    base_url = self.market.ig.api_url + '/positions/'+ self.deal_id
-                    auth_r = requests.get(base_url, headers=self.market.ig.authenticate())
-                    if int(auth_r.status_code) == 400 or int(auth_r.status_code) == 404:
-                        self.log_status("Can't find trade - closed in IG?")
-                        self.state = TradeState.CLOSED
-
                 self.loop_counter=0
                 self.save_trade()
             
@@ -188,11 +172,97 @@ class Trade:
             pass
 
 
+    def check_stops(self, time_now=None):
+        """work out the open trade's P&L at the latest price and close it if a stop's been hit"""
+        if self.state != TradeState.OPEN or self.closing:
+            return
+        if time_now is None:
+            time_now = self.market.ig.now()
+        timeopen = time_now - self.opened_time
+        # store the last full minute
+        
+        # calculate pip diff based on trade direction
+        if self.prediction['direction_to_trade'] == "SELL":
+            self.pip_diff = float(self.open_level) - float(self.market.offer)
+
+        else:
+            self.pip_diff = float(self.market.bid) - float(self.open_level)
+        
+
+
+        
+        self.profit_loss = self.size_value * self.pip_diff
+
+        # trade_logger.info("{}:{}".format(self.market.epic,self.profit_loss))
+        if self.pip_diff > self.pip_max:
+            self.pip_max = self.pip_diff
+
+        if self.pip_diff < self.pip_min:
+            self.pip_min = self.pip_diff
+
+        # rough trail calc - update with strategy method one day?
+        stoploss = float(self.prediction['stoploss'])
+        # self.trailing_level = self.pip_max - 8
+
+        self.trailing_stop,self.trailing_level = self.market.ig.strategy[self.prediction['strategy']].trailing_stop(self)
+
+        # if self.trailing_stop:
+        # if self.pip_diff>8 and self.trailing_stop==False:
+        #     self.trailing_stop = True
+        
+        if self.trailing_stop:
+            if self.pip_diff < self.trailing_level:
+                self.log_status("Trailing stop loss hit, closing at: {}".format(self.profit_loss))
+                self.close_trade()
+
+
+        # STOP LOSS CHECKING
+        if float(self.pip_diff) < -stoploss and timeopen.seconds>120:
+            # price diff has dropped below artifical stop loss! ABORT!
+            self.log_status("TRADE HIT ARTIFICIAL STOPLOSS - ABORTING!")
+            self.close_trade()
+
+    def stop_band(self):
+        """(low, high) pip_diff an open trade can move between without check_stops
+        having anything to do: above its stops and pip_min, below pip_max - None if it isn't open"""
+        if self.state != TradeState.OPEN:
+            return None
+        low = max(self.pip_min, -float(self.prediction['stoploss']))
+        if self.trailing_stop:
+            low = max(low, self.trailing_level)
+        return low, self.pip_max
+
+    def dealing(self, fn):
+        """run fn on the order desk if there is one, otherwise here and now"""
+        desk = getattr(self.market.ig, 'orders', None)
+        if desk is None:
+            fn()
+        else:
+            desk.submit(fn)
+
     def open_trade(self):
-        time_now = datetime.datetime.now(timezone('GB')).replace(tzinfo=None)
+        """mark the trade PENDING and send the order off to be opened"""
+        time_now = self.market.ig.now()
         self.state = TradeState.PENDING
         self.expiry_time = time_now + datetime.timedelta(minutes = 5)
         self.log_status("Attempting to open trade")
+        self.dealing(self.send_open)
+
+    def watch_ticks(self):
+        """have the stops checked on every tick from now on, see ticks.py"""
+        dispatcher = getattr(self.market.ig, 'tick_dispatcher', None)
+        if dispatcher is not None:
+            dispatcher.watch(self)
+
+    def confirm(self, deal_ref):
+        desk = getattr(self.market.ig, 'orders', None)
+        if desk is not None:
+            return desk.confirm(deal_ref)
+        auth_r = self.market.ig.http.get(self.market.ig.api_url + '/confirms/'+ deal_ref)
+        return json.loads(auth_r.text) if auth_r.ok else None
+
+    def send_open(self):
+        time_now = self.market.ig.now()
         limit = 150
         if float(self.prediction['limit_distance']) > 0:
             limit = float(self.prediction['limit_distance'])
@@ -210,19 +280,16 @@ class Trade:
             "forceOpen":True,
             "stopDistance":self.stop_distance
         }
-        res = requests.post(base_url, data=json.dumps(data), headers=self.market.ig.authenticate())
+        res = self.market.ig.http.post(base_url, data=json.dumps(data))
 
         if res.ok:
             
             d = json.loads(res.text)
             deal_ref = d['dealReference']
-            systime.sleep(2)
 
-            base_url = self.market.ig.api_url + '/confirms/'+ deal_ref
-            auth_r = requests.get(base_url, headers=self.market.ig.authenticate())
-            if auth_r.ok:
+            d = self.confirm(deal_ref)
+            if d is not None:
                 
-                d = json.loads(auth_r.text)
                 self.deal_id = d['dealId']
                 logger.info("DEAL ID : " + str(d['dealId']))
                 logger.info(d['dealStatus'])
@@ -231,21 +298,28 @@ class Trade:
                     
                     self.opened_time = time_now
                     self.log_status("Trade Accepted")
-                    systime.sleep(2)
-                    # read in data to get the deal cost etc
-                    base_url = self.market.ig.api_url + '/positions/'+ self.deal_id
-                    auth_r = requests.get(base_url, headers=self.market.ig.authenticate())
-
-                    if auth_r.ok:
-                        d = json.loads(auth_r.text)
-                        logger.info(d)
-                        self.open_level = d['position']['openLevel']
-
-                        # trade successfully created - save the object YAYAYAYAAYYYYY
+                    if d.get('level') is not None:
+                        # the confirmation has the level it was dealt at
+                        self.open_level = d['level']
                         self.state = TradeState.OPEN
                         self.save_trade()
+                        self.watch_ticks()
                     else:
-                        self.log_status("Shit - couldn't read in deal - need retry somehow")
+                        # read in data to get the deal cost etc
+                        base_url = self.market.ig.api_url + '/positions/'+ self.deal_id
+                        auth_r = self.market.ig.http.get(base_url)
+
+                        if auth_r.ok:
+                            d = json.loads(auth_r.text)
+                            logger.info(d)
+                            self.open_level = d['position']['openLevel']
+
+                            # trade successfully created - save the object YAYAYAYAAYYYYY
+                            self.state = TradeState.OPEN
+                            self.save_trade()
+                            self.watch_ticks()
+                        else:
+                            self.log_status("Shit - couldn't read in deal - need retry somehow")
                 else:
                     # something wrong with the attempted trade, cooldown this market
                     logger.info(self.market.epic)
@@ -281,14 +355,26 @@ class Trade:
             self.state = TradeState.FAILED
 
     def close_trade(self):
-        time_now = datetime.datetime.now(timezone('GB')).replace(tzinfo=None)
+        """send the trade off to be closed, unless that's already under way"""
+        if self.closing:
+            return
+        self.closing = True
         self.log_status("CLOSING TRADE")
-        delete_header = self.market.ig.authenticate().copy()
-        delete_header['_method'] = "DELETE"
+        self.dealing(self.send_close)
+
+    def send_close(self):
+        try:
+            self._send_close()
+        finally:
+            self.closing = False
+
+    def _send_close(self):
+        time_now = self.market.ig.now()
+        delete_header = {'_method': "DELETE"}
         base_url = self.market.ig.api_url + '/positions/otc'
         data = {"dealId":self.deal_id,"direction":self.prediction['direction_to_close'],"size":self.size_value,"orderType":"MARKET"}
 
-        auth_r = requests.post(base_url, data=json.dumps(data), headers=delete_header) 
+        auth_r = self.market.ig.http.post(base_url, data=json.dumps(data), headers=delete_header) 
 
         if auth_r.ok:
             self.closed_time = time_now
@@ -315,7 +401,7 @@ class Trade:
         # self.log_status("CLOSED BY SIGNAL: {}".format(signal))
         self.close_trade()
         # return
-        # time_now = datetime.datetime.now(timezone('GB')).replace(tzinfo=None)
+        # time_now = self.market.ig.now()
         # if self.opened_time is not None:
         #     timeopen = time_now - self.opened_time
         #     #for now, just close the trade regardless
@@ -381,8 +467,8 @@ class Trade:
             logger.info(exc_obj)
             pass
 
-    def save_trade(self):
-
+    def to_json(self):
+        """the trade as it's saved to file"""
         try:
             close_t = self.closed_time.strftime("%Y:%m:%d-%H:%M:%S")
         except Exception as e:
@@ -391,48 +477,128 @@ class Trade:
             open_t = self.opened_time.strftime("%Y:%m:%d-%H:%M:%S")
         except Exception as e:
             open_t = None
+        return {
+            "last_saved" : self.market.ig.now().strftime("%Y:%m:%d-%H:%M:%S"),
+            "size_value" : self.size_value,
+            "prediction" : self.prediction,
+            "deal_id" : self.deal_id,
+            "market" : self.market.epic,
+            "state" : self.state,
+            "created_time" : self.created_time.strftime("%Y:%m:%d-%H:%M:%S"),
+            "expiry_time" : self.expiry_time.strftime("%Y:%m:%d-%H:%M:%S"),
+            "opened_time" : open_t,
+            "closed_time" : close_t,
+            "open_level" : self.open_level,
+            "pip_diff" : round(self.pip_diff,2),
+            "pip_min" : round(self.pip_min,2),
+            "pip_max" : round(self.pip_max,2),
+            "profit_loss" : round(self.profit_loss,2),
+            "trailing_level":round(self.trailing_level,2),
+            "trailing_stop":self.trailing_stop,
+            "status_log" : list(self.status_log)
+        }
+
+    def save_trade(self):
         try:
-            save_object = {
-                "last_saved" : datetime.datetime.now(timezone('GB')).replace(tzinfo=None).strftime("%Y:%m:%d-%H:%M:%S"),
-                "size_value" : self.size_value,
-                "prediction" : self.prediction,
-                "deal_id" : self.deal_id,
-                "market" : self.market.epic,
-                "state" : self.state,
-                "created_time" : self.created_time.strftime("%Y:%m:%d-%H:%M:%S"),
-                "expiry_time" : self.expiry_time.strftime("%Y:%m:%d-%H:%M:%S"),
-                "opened_time" : open_t,
-                "closed_time" : close_t,
-                "open_level" : self.open_level,
-                "pip_diff" : round(self.pip_diff,2),
-                "pip_min" : round(self.pip_min,2),
-                "pip_max" : round(self.pip_max,2),
-                "profit_loss" : round(self.profit_loss,2),
-                "trailing_level":round(self.trailing_level,2),
-                "trailing_stop":self.trailing_stop,
-                "status_log" : self.status_log
-            }
-            filename = self.created_time.strftime("%Y-%m-%d-%H-%M-%S") + "---" + self.market.epic + ".json"
-            filepath = "trades/open/" 
-            
-            if self.state == TradeState.CLOSED or self.state == TradeState.FAILED:
-                # delete the old open file
-                try:
-                    os.remove(filepath + filename)
-                except OSError:
-                    pass
-                filepath = "trades/closed/"
-                if self.state == TradeState.FAILED:
-                    filepath = "trades/failed/"
-
-            if not os.path.exists(filepath):
-                os.makedirs(filepath)
-
-            fh = open(filepath + filename,"w")
-            json.dump(save_object,fh)
-            fh.close()
+            save_object = self.to_json()
+            # written out to trades/<open|closed|failed>/ by the journal's writer thread
+            self.market.ig.journal.snapshot(self.file_name(), self.state, save_object)
 
             self.json_obj = save_object
         except Exception as e:
             logger.info("Couldn't save trade for some reason")
             logger.info(e)
+
+
+class TradeRegistry:
+    """AutoIG.trades - every trade, indexed by epic, deal id, state and file name
+
+    Trades tell the registry when their deal id or state changes (see the
+    Trade properties) so the indexes stay current without rescanning. Only
+    one trade is held per deal id: adding another with a deal id already in
+    here returns the one that's already held instead. It also iterates, and
+    has append/remove, like the list it replaced. The order desk's threads
+    move trades while the streaming thread reads them, so anything that
+    changes or copies the indexes holds the registry's lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.trades = {}
+        self.epics = {}
+        self.deals = {}
+        self.states = {}
+        self.files = {}
+
+    def add(self, trade):
+        """hold trade, returns it - or the trade already held with its deal id"""
+        with self.lock:
+            if trade in self.trades:
+                return trade
+            held = self.by_deal(trade.deal_id)
+            if held is not None:
+                return held
+            self.trades[trade] = None
+            self.epics.setdefault(trade.market.epic, {})[trade] = None
+            if trade.deal_id not in (None, "PENDING"):
+                self.deals[trade.deal_id] = trade
+            self.states.setdefault(trade.state, {})[trade] = None
+            self.files[trade.file_name()] = trade
+            trade.registry = self
+            return trade
+
+    append = add
+
+    def remove(self, trade):
+        with self.lock:
+            del self.trades[trade]
+            del self.epics[trade.market.epic][trade]
+            if self.deals.get(trade.deal_id) is trade:
+                del self.deals[trade.deal_id]
+            self.states[trade.state].pop(trade, None)
+            if self.files.get(trade.file_name()) is trade:
+                del self.files[trade.file_name()]
+            trade.registry = None
+
+    def moved(self, trade, attr, old, new):
+        """a held trade's deal id or state has changed"""
+        with self.lock:
+            if attr == "deal_id":
+                if self.deals.get(old) is trade:
+                    del self.deals[old]
+                if new not in (None, "PENDING"):
+                    self.deals[new] = trade
+            elif attr == "state":
+                self.states.get(old, {}).pop(trade, None)
+                self.states.setdefault(new, {})[trade] = None
+
+    def for_epic(self, epic):
+        with self.lock:
+            return list(self.epics.get(epic, {}))
+
+    def by_deal(self, deal_id):
+        if deal_id in (None, "PENDING"):
+            return None
+        return self.deals.get(deal_id)
+
+    def by_file(self, name):
+        return self.files.get(name)
+
+    def in_state(self, *states):
+        with self.lock:
+            return [t for s in states for t in self.states.get(s, {})]
+
+    def with_deals(self):
+        """the trades IG has given a deal id"""
+        with self.lock:
+            return list(self.deals.values())
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.trades))
+
+    def __len__(self):
+        return len(self.trades)
+
+    def __contains__(self, trade):
+        return trade in self.trades
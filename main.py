@@ -74,12 +74,16 @@ def activate_checker():
         globals()["login_success"] = auto_ig.login()
         if not globals()["login_success"]:
             flash("API Keys not set or wrong","danger")
+        else:
+            auto_ig.start_engine(globals()['EPIC_IDS'], settings.get('engine_refresh', 60), settings.get('engine_reconcile', 900))
 
 
 @app.route("/process")
 def process():
-    success, response = auto_ig.process(globals()['EPIC_IDS'])
-    return "status: {}, response: {}".format(success,response)
+    """the engine does the processing now, this just shows what it's up to"""
+    if auto_ig.engine is None:
+        return "status: False, response: engine not started"
+    return json.dumps(auto_ig.engine.status(), indent=2)
 
 @app.route('/')
 def index():
@@ -158,7 +162,7 @@ def logout():
 
 @app.route('/prices/<epic>/<res>')
 def get_prices(epic,res):
-    trade = [x for x in auto_ig.trades if x.market.epic == epic]
+    trade = auto_ig.trades.for_epic(epic)
     open_level = ''
     if len(trade)>0:
         open_level = trade[0].open_level
@@ -213,7 +217,7 @@ def do_backtest(epic, start_date, end_date):
 
     results = auto_ig.backtest(epic,start_date,end_date)
 
-    return "hello" + results
+    return json.dumps(results, indent=2, default=str)
 
 @app.route('/prices/<epic>/<res>/table')
 def get_prices_table(epic,res):
@@ -248,8 +252,7 @@ def get_prices_table(epic,res):
 @app.route('/clear-prices')
 def clear_prices():
     for m in auto_ig.markets.values():
-        m.prices = {}
-        m.save_prices()
+        m.clear_prices()
     
     return "Price data cleared"
 
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from auto_ig.bars import format_time
+
+
+def make_bars(count, seed=7, start=1500000000, step=300):
+    """random walk of price dicts in the layout IG sends them"""
+    rng = np.random.RandomState(seed)
+    close = 100 + np.cumsum(rng.normal(0, 0.5, count))
+    open_ = np.concatenate([[100.], close[:-1]])
+    high = np.maximum(open_, close) + rng.uniform(0, 0.4, count)
+    low = np.minimum(open_, close) - rng.uniform(0, 0.4, count)
+    volume = rng.randint(1, 500, count)
+    bars = []
+    for i in range(count):
+        bar = {'snapshotTime': format_time(start + i * step),
+               'lastTradedVolume': int(volume[i])}
+        for group, mid in (('openPrice', open_[i]), ('closePrice', close[i]),
+                           ('highPrice', high[i]), ('lowPrice', low[i])):
+            mid = round(float(mid), 2)
+            bar[group] = {'bid': mid - 0.5, 'ask': mid + 0.5, 'mid': mid,
+                          'spread': 1.0, 'lastTraded': None}
+        typical = round((bar['highPrice']['mid'] + bar['lowPrice']['mid'] + bar['closePrice']['mid']) / 3, 2)
+        bar['typicalPrice'] = {'bid': typical - 0.5, 'ask': typical + 0.5, 'mid': typical}
+        bars.append(bar)
+    return bars
+
+
+@pytest.fixture
+def bars():
+    return make_bars(600)
@@ -0,0 +1,174 @@
+"""A small Lightstreamer server for testing LSClient against
+
+It speaks just enough of the text protocol: create_session and bind_session
+answer OK and the session info, then keep the stream open, sending whatever
+lines are pushed to it. Every line goes out chunked and split across two
+chunks, so the client has to put them back together. Control requests are
+read off keep-alive connections and answered in order; with control_batch
+set, answers are held back until that many requests have come in together.
+"""
+import asyncio
+import threading
+from urllib.parse import parse_qsl
+
+KEEPALIVE_MILLIS = 5000
+# how long a control connection waits for the rest of a batch
+BATCH_WAIT = 0.5
+
+
+class FakeLightstreamer:
+
+    def __init__(self):
+        self.sessions = []
+        self.binds = []
+        self.requests = []
+        # {session: {table: add params}} of what's subscribed
+        self.tables = {}
+        # sizes of the groups of control requests answered together
+        self.batches = []
+        self.control_batch = 1
+        # tables whose delete gets refused
+        self.refuse_delete = set()
+        self.port = None
+        self._loop = None
+        self._lines = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self.port)
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._lines = asyncio.Queue()
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, "127.0.0.1", 0))
+            self.port = self._server.sockets[0].getsockname()[1]
+            self._loop.call_soon(ready.set)
+            self._loop.run_forever()
+            # finish off the streams still waiting on lines
+            handlers = asyncio.all_tasks(self._loop)
+            for task in handlers:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*handlers, return_exceptions=True))
+            self._server.close()
+            self._loop.run_until_complete(self._server.wait_closed())
+            self._loop.close()
+
+        self._thread = threading.Thread(name="FAKE-LIGHTSTREAMER", target=run)
+        self._thread.daemon = True
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def send(self, line):
+        """push a line down the current stream, LOOP, SYNC ERROR or END finish it"""
+        self._loop.call_soon_threadsafe(self._lines.put_nowait, line)
+
+    async def _read_request(self, reader):
+        """(path, params) of the next request, None once the client's closed"""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        path = request_line.split()[1].decode("latin-1")
+        length = 0
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            key, value = line.split(":", 1)
+            if key.strip().lower() == "content-length":
+                length = int(value)
+        body = await reader.readexactly(length)
+        return path, dict(parse_qsl(body.decode("utf-8")))
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await self._read_request(reader)
+            if request is None:
+                return
+            path, params = request
+            if path.endswith("create_session.txt"):
+                session = "S{}".format(len(self.sessions) + 1)
+                self.sessions.append(session)
+                self.tables[session] = {}
+                await self._stream(writer, session)
+            elif path.endswith("bind_session.txt"):
+                self.binds.append(params["LS_session"])
+                await self._stream(writer, params["LS_session"])
+            else:
+                await self._control(reader, writer, request)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _stream(self, writer, session):
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: text/plain\r\n"
+                     b"Transfer-Encoding: chunked\r\n\r\n")
+        for line in ["OK", "SessionId:" + session, "KeepaliveMillis:{}".format(KEEPALIVE_MILLIS), ""]:
+            self._chunk(writer, line)
+        await writer.drain()
+        while True:
+            line = await self._lines.get()
+            self._chunk(writer, line)
+            if line.startswith(("LOOP", "SYNC ERROR", "END")):
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+                return
+            await writer.drain()
+
+    def _chunk(self, writer, line):
+        data = (line + "\r\n").encode("utf-8")
+        half = len(data) // 2
+        for part in (data[:half], data[half:]):
+            if part:
+                writer.write("{:x}\r\n".format(len(part)).encode("latin-1") + part + b"\r\n")
+
+    async def _control(self, reader, writer, request):
+        while request is not None:
+            batch = [request]
+            while len(batch) < self.control_batch:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), BATCH_WAIT)
+                except asyncio.TimeoutError:
+                    break
+                if request is None:
+                    break
+                batch.append(request)
+            self.batches.append(len(batch))
+            for path, params in batch:
+                body = self._answer(params).encode("utf-8")
+                writer.write(b"HTTP/1.1 200 OK\r\n"
+                             b"Content-Type: text/plain\r\n"
+                             b"Content-Length: " + str(len(body)).encode("latin-1") + b"\r\n\r\n" + body)
+            await writer.drain()
+            request = await self._read_request(reader)
+
+    def _answer(self, params):
+        self.requests.append(params)
+        session = params.get("LS_session")
+        if session not in self.tables:
+            return "SYNC ERROR\r\n"
+        tables = self.tables[session]
+        op = params.get("LS_op")
+        if op == "add":
+            tables[int(params["LS_Table"])] = params
+        elif op == "delete":
+            table = int(params["LS_Table"])
+            if table in self.refuse_delete or table not in tables:
+                return "ERROR\r\n19\r\nSpecified table not found\r\n"
+            del tables[table]
+        elif op == "destroy":
+            self.send("END")
+        return "OK\r\n"
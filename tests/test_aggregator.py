@@ -0,0 +1,26 @@
+from auto_ig.aggregator import BarAggregator
+
+
+def ohlcv(price, volume=1):
+    return (price, price + 1, price + 2, price + 3, price - 2, price - 1, price + 0.5, price + 1.5, volume)
+
+
+def test_bars_fold_into_the_bucket():
+    agg = BarAggregator("MINUTE_30")
+    agg.update(1800, ohlcv(10))
+    agg.update(2100, ohlcv(12, 2))
+    finished, current = agg.update(3600, ohlcv(20))
+    bucket, values = finished
+    assert bucket == 1800
+    assert values == (10, 11, 14, 15, 8, 9, 12.5, 13.5, 3)
+    assert current == (3600, ohlcv(20))
+
+
+def test_stale_update_returns_no_current():
+    agg = BarAggregator("MINUTE_30")
+    agg.update(3600, ohlcv(10))
+    assert agg.update(1800, ohlcv(5)) == (None, None)
+    # seeded with nothing held, there's no OHLCV to hand back either
+    empty = BarAggregator("MINUTE_30")
+    empty.seed(None, 3900)
+    assert empty.update(1800, ohlcv(5)) == (None, None)
@@ -0,0 +1,54 @@
+"""Strategy.backfill's one vectorised pass against process_signals on every prefix"""
+import pytest
+
+from auto_ig.bars import BarSeries
+from auto_ig.streaming import IndicatorEngine
+from auto_ig.strategy.base import SignalStore
+from auto_ig.strategy.macd import macd
+from auto_ig.strategy.stoch_alt import stoch_alt
+
+
+class FakeMarket:
+    def __init__(self):
+        self.epic = "CS.D.GBPUSD.TODAY.IP"
+        self.spread = 0.5
+        self.indicators = IndicatorEngine(self.epic)
+
+
+class RecordingStore(SignalStore):
+    """a SignalStore that keeps every signal ever added"""
+
+    def __init__(self):
+        super().__init__()
+        self.added = []
+
+    def add(self, sig):
+        self.added.append((sig.timestamp, sig.name, sig.position, sig.comment, sig.resolution))
+        return super().add(sig)
+
+
+def run(strategy, bars, resolution, backfill, lookback):
+    strategy.signals = RecordingStore()
+    market = FakeMarket()
+    prices = BarSeries(bars)
+    if backfill:
+        strategy.backfill(market, prices, resolution, lookback)
+    else:
+        for end in range(len(prices) - lookback, len(prices) + 1):
+            strategy.process_signals(market, prices[:end], resolution)
+    left = sorted((s.timestamp, s.name, s.position, s.life) for s in strategy.signals)
+    return strategy.signals.added, left
+
+
+@pytest.mark.parametrize("make, resolution", [
+    (macd, "HOUR_4"),
+    (stoch_alt, "HOUR_4"),
+    (stoch_alt, "MINUTE_5"),
+])
+def test_backfill_matches_the_prefix_loop(bars, make, resolution):
+    lookback = 400
+    added, left = run(make(), bars, resolution, True, lookback)
+    expected_added, expected_left = run(make(), bars, resolution, False, lookback)
+    assert expected_added
+    assert added == expected_added
+    assert left == expected_left
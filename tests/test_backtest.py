@@ -0,0 +1,178 @@
+import datetime
+import json
+
+import numpy as np
+import pytest
+
+from auto_ig.backtest import Backtest, SimBroker
+from auto_ig.bars import FIELDS, FIELD_INDEX, BarSeries
+from auto_ig.store import PriceStore
+from auto_ig.strategy.base import SignalStore
+
+EPIC = "CS.D.TEST.TODAY.IP"
+# on the hour, so an HOUR bar closes with the twelfth MINUTE_5 bar
+START = 1500001200
+
+
+def row(open_, high, low, close, spread=1.0):
+    """a stored bar's values from its bid OHLC, the ask spread above"""
+    values = np.full(len(FIELDS), np.nan)
+    for group, bid in zip(('openPrice', 'highPrice', 'lowPrice', 'closePrice'), (open_, high, low, close)):
+        values[FIELD_INDEX[(group, 'bid')]] = bid
+        values[FIELD_INDEX[(group, 'ask')]] = bid + spread
+    return values
+
+
+class FakeMarket:
+    def __init__(self, bid=100.0, offer=101.0):
+        self.epic = EPIC
+        self.bid = bid
+        self.offer = offer
+
+
+class FakeIG:
+    def __init__(self):
+        self.markets = {EPIC: FakeMarket()}
+        self.updates = []
+
+    def now(self):
+        return None
+
+    def position_update(self, opu):
+        self.updates.append(opu)
+
+
+def order(direction, stop, limit, size=1, guaranteed=False):
+    return {"epic": EPIC, "direction": direction, "size": size, "stopDistance": stop,
+            "limitDistance": limit, "guaranteedStop": guaranteed}
+
+
+def broker(**kwargs):
+    return SimBroker(FakeIG(), **kwargs)
+
+
+def fill(sim, bar):
+    sim.on_bar(sim.ig.markets[EPIC], sim.quotes(bar))
+    return sim.deals[-1] if sim.deals else None
+
+
+def test_a_bar_through_both_hits_the_stop_first():
+    sim = broker()
+    sim.open_order(order("BUY", 2, 4, size=2))
+    deal = fill(sim, row(100, 106, 98, 100))
+    assert (deal['reason'], deal['open_level'], deal['close_level']) == ("stop", 101, 99)
+    assert deal['pnl'] == -4
+    assert sim.ig.updates == [{"dealId": deal['deal_id'], "status": "DELETED", "level": 99}]
+    assert sim.positions == {}
+
+
+def test_sell_stop_first_on_the_ask_with_slippage():
+    sim = broker(slippage=0.25)
+    sim.open_order(order("SELL", 2, 4))
+    # asks: open 101, high 102, low 95 - through the stop at 101.75 and the limit at 95.75
+    deal = fill(sim, row(100, 101, 94, 95))
+    assert (deal['reason'], deal['open_level'], deal['close_level']) == ("stop", 99.75, 102)
+    assert deal['pnl'] == -2.25
+
+
+def test_gaps_fill_at_the_open():
+    sim = broker()
+    sim.open_order(order("BUY", 2, 4))
+    deal = fill(sim, row(97, 98, 96, 97))
+    assert (deal['reason'], deal['close_level'], deal['pnl']) == ("stop", 97, -4)
+
+    sim.open_order(order("BUY", 2, 4))
+    deal = fill(sim, row(107, 108, 106, 107))
+    assert (deal['reason'], deal['close_level'], deal['pnl']) == ("limit", 107, 6)
+
+
+def test_guaranteed_stop_fills_at_its_level_and_pays_the_premium():
+    sim = broker(guaranteed_premium=0.5)
+    sim.open_order(order("BUY", 2, 4, size=2, guaranteed=True))
+    deal = fill(sim, row(97, 98, 96, 97))
+    assert (deal['reason'], deal['close_level']) == ("stop", 99)
+    assert deal['premium'] == 1.0
+    assert deal['pnl'] == -5.0
+
+
+def test_a_bar_inside_the_stop_and_limit_fills_nothing():
+    sim = broker()
+    sim.open_order(order("BUY", 2, 4))
+    assert fill(sim, row(100, 104, 99.5, 101)) is None
+    assert len(sim.positions) == 1
+
+
+def test_closing_isnt_reported_like_the_stream_would():
+    sim = broker(slippage=0.5)
+    ref = json.loads(sim.open_order(order("BUY", 2, 4)).text)['dealReference']
+    deal_id = sim.confirms[ref]['dealId']
+    sim.close_order({"dealId": deal_id})
+    deal = sim.deals[-1]
+    assert (deal['reason'], deal['open_level'], deal['close_level'], deal['pnl']) == ("closed", 101.5, 99.5, -2)
+    assert sim.ig.updates == []
+    assert sim.close_order({"dealId": deal_id}).status_code == 404
+
+
+def test_fixed_spread_replaces_the_bars_own():
+    sim = broker(spread=0.5)
+    assert sim.quotes(row(100, 102, 99, 101, spread=3)) == [(101.25, 101.75), (103.25, 103.75),
+                                                              (100.25, 100.75), (102.25, 102.75)]
+
+
+def write(root, resolution, bars, step):
+    series = BarSeries()
+    series.load_fields(np.arange(len(bars), dtype=np.int64) * step + START, np.array(bars))
+    PriceStore(str(root)).compact(EPIC, resolution, series)
+
+
+class Opener:
+    """opens a position straight with the broker once the series is a given length"""
+
+    name = "opener"
+
+    def __init__(self, orders):
+        self.orders = orders
+        self.signals = SignalStore()
+
+    def process_signals(self, market, prices, resolution):
+        if len(prices) in self.orders:
+            market.ig.http.open_order(self.orders[len(prices)])
+
+
+def test_events_merge_in_close_order_finest_first(tmp_path):
+    write(tmp_path, "MINUTE_5", [row(100, 101, 99, 100)] * 14, 300)
+    write(tmp_path, "HOUR", [row(100, 101, 99, 100)] * 2, 3600)
+    bt = Backtest([EPIC], strategies={}, history=str(tmp_path), warmup=0)
+    assert bt.load() == 16
+    events = [(close, bt.series[n][1], i) for close, n, i in bt.events()]
+    assert [e[0] for e in events] == sorted(e[0] for e in events)
+    hour = START + 3600
+    assert [e[1:] for e in events if e[0] == hour] == [("MINUTE_5", 11), ("HOUR", 0)]
+    assert bt.base[EPIC] == "MINUTE_5"
+
+
+def test_replay_fills_on_the_next_bar_and_finish_closes_the_rest(tmp_path):
+    write(tmp_path, "MINUTE_5", [row(100, 100, 100, 100), row(100, 101, 98.5, 100),
+                                 row(100, 101, 99, 99), row(99, 100, 96, 96)], 300)
+    opener = Opener({1: order("BUY", 2, 10), 2: order("SELL", 3, 5)})
+    results = Backtest([EPIC], strategies={opener.name: opener}, history=str(tmp_path), warmup=0).run()
+    deals = results['deals']
+    assert [(d['direction'], d['reason'], d['open_level'], d['close_level'], d['pnl']) for d in deals] == [
+        ("BUY", "stop", 101, 99, -2), ("SELL", "end", 100, 97, 3)]
+    assert results['trades'] == 2
+    assert results['wins'] == 1
+    assert results['pnl'] == 1.0
+    assert results['max_drawdown'] == 2.0
+
+
+def test_start_and_end_pick_the_bars_with_the_rest_as_warmup(tmp_path):
+    write(tmp_path, "MINUTE_5", [row(100 + i, 101 + i, 99 + i, 100 + i) for i in range(10)], 300)
+    start = datetime.datetime.utcfromtimestamp(START + 1500)
+    end = datetime.datetime.utcfromtimestamp(START + 2400)
+    bt = Backtest([EPIC], start=start, end=end, strategies={}, history=str(tmp_path), warmup=3)
+    results = bt.run()
+    assert results['bars'] == 4
+    assert results['trades'] == 0
+    # three bars of warmup before the start, then the four up to the end
+    assert bt.ig.markets[EPIC].prices["MINUTE_5"].times().tolist() == [START + 300 * i for i in range(2, 9)]
+    assert bt.ig.markets[EPIC].bid == pytest.approx(108)
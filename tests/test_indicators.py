@@ -0,0 +1,179 @@
+"""Parity of the vectorised indicators against the loops they replaced"""
+from numbers import Number
+
+import numpy as np
+
+from auto_ig import indicators as ta
+from auto_ig.bars import BarSeries
+from auto_ig.strategy.obv_psar import obv_psar
+
+
+def closes(bars):
+    return np.array([b['closePrice']['mid'] for b in bars])
+
+
+def loop_rsi(values, n=14):
+    deltas = np.diff(values)
+    seed = deltas[:n+1]
+    up = seed[seed >= 0].sum()/n
+    down = -seed[seed < 0].sum()/n
+    rsi = np.zeros_like(values)
+    for i in range(n, len(values)):
+        delta = deltas[i-1]
+        upval = delta if delta > 0 else 0.
+        downval = 0. if delta > 0 else -delta
+        up = (up*(n-1) + upval)/n
+        down = (down*(n-1) + downval)/n
+        rsi[i] = 100. - 100./(1.+up/down)
+    return rsi
+
+
+def loop_ewma(values, alpha):
+    out = [values[0]]
+    for v in values[1:]:
+        out.append(alpha*v + (1-alpha)*out[-1])
+    return np.array(out)
+
+
+def loop_psar(bars, iaf=0.02, maxaf=0.2):
+    high = [b['highPrice']['mid'] for b in bars]
+    low = [b['lowPrice']['mid'] for b in bars]
+    psar = [b['closePrice']['mid'] for b in bars]
+    bulls = [np.nan] * len(bars)
+    bears = [np.nan] * len(bars)
+    bull = True
+    af = iaf
+    hp = high[0]
+    lp = low[0]
+    for i in range(2, len(bars)):
+        if bull:
+            psar[i] = psar[i-1] + af * (hp - psar[i-1])
+        else:
+            psar[i] = psar[i-1] + af * (lp - psar[i-1])
+        reverse = False
+        if bull and low[i] < psar[i]:
+            bull, reverse, psar[i], lp, af = False, True, hp, low[i], iaf
+        elif not bull and high[i] > psar[i]:
+            bull, reverse, psar[i], hp, af = True, True, lp, high[i], iaf
+        if not reverse:
+            if bull:
+                if high[i] > hp:
+                    hp = high[i]
+                    af = min(af + iaf, maxaf)
+                psar[i] = min(psar[i], low[i-1], low[i-2])
+            else:
+                if low[i] < lp:
+                    lp = low[i]
+                    af = min(af + iaf, maxaf)
+                psar[i] = max(psar[i], high[i-1], high[i-2])
+        if bull:
+            bulls[i] = psar[i]
+        else:
+            bears[i] = psar[i]
+    return np.array(bulls[2:]), np.array(bears[2:])
+
+
+def test_linear_recurrence_matches_loop():
+    values = np.random.RandomState(3).normal(size=2000)
+    for decay in (0.0, 0.5, 13/14., 0.999):
+        expected = []
+        y = 1.5
+        for v in values:
+            y = decay*y + v
+            expected.append(y)
+        np.testing.assert_allclose(ta.linear_recurrence(decay, values, 1.5), expected, rtol=1e-9, atol=1e-9)
+
+
+def test_ema_and_rma_match_loop(bars):
+    values = closes(bars)
+    np.testing.assert_allclose(ta.ema(20, values=values), loop_ewma(values, 2/21.), rtol=1e-10)
+    np.testing.assert_allclose(ta.rma(14, values=values), loop_ewma(values, 1/14.), rtol=1e-10)
+
+
+def test_rsi_matches_loop(bars):
+    values = closes(bars)
+    np.testing.assert_allclose(ta.rsi(14, values=values), loop_rsi(values), rtol=1e-9, atol=1e-9)
+
+
+def test_roc_matches_loop(bars):
+    values = closes(bars)
+    expected = [(values[i] - values[i-12])/values[i-12] for i in range(12, len(values))]
+    np.testing.assert_allclose(ta.roc(12, values=values), expected, rtol=1e-12)
+
+
+def test_obv_matches_loop(bars):
+    vals = []
+    for i in range(1, len(bars)):
+        diff = bars[i]['closePrice']['mid'] - bars[i-1]['closePrice']['mid']
+        volume = bars[i]['lastTradedVolume']
+        vals.append(volume if diff > 0 else -volume if diff < 0 else 0)
+    obv = np.cumsum(vals)
+    signal = ta.wma(10, values=obv)
+    expected = obv[len(obv) - len(signal):] - signal
+    np.testing.assert_allclose(ta.obv(BarSeries(bars)), expected, rtol=1e-12)
+
+
+def test_stochastic_matches_loop(bars):
+    ks = []
+    for i in range(4, len(bars)):
+        window = bars[i-4:i+1]
+        high = max(b['highPrice']['mid'] for b in window)
+        low = min(b['lowPrice']['mid'] for b in window)
+        ks.append((bars[i]['closePrice']['mid'] - low)/(high - low) * 100)
+    k = ta.ma(3, values=ks)
+    d = ta.ma(3, values=k)
+    got_k, got_d = ta.stochastic(BarSeries(bars), 5, 3, 3)
+    np.testing.assert_allclose(got_k, k[len(k) - len(d):], rtol=1e-12)
+    np.testing.assert_allclose(got_d, d, rtol=1e-12)
+
+
+def test_adx_matches_loop(bars):
+    series = BarSeries(bars)
+    at, tr = ta.atr(14, series)
+    upper = []
+    lower = []
+    for i in range(1, len(bars)):
+        up = bars[i]['highPrice']['mid'] - bars[i-1]['highPrice']['mid']
+        down = bars[i-1]['lowPrice']['mid'] - bars[i]['lowPrice']['mid']
+        upper.append(up if (up > down and up > 0) else 0)
+        lower.append(down if (down > up and down > 0) else 0)
+    upper = np.array(upper[len(upper) - len(at):])
+    lower = np.array(lower[len(lower) - len(at):])
+    plus = loop_ewma(100*upper/at, 1/14.)
+    minus = loop_ewma(100*lower/at, 1/14.)
+    summed = [1 if s == 0 else s for s in plus + minus]
+    expected = 100 * loop_ewma(np.abs(plus - minus)/summed, 1/14.)
+
+    adx, got_plus, got_minus = ta.adx(14, series)
+    np.testing.assert_allclose(got_plus, plus, rtol=1e-9)
+    np.testing.assert_allclose(got_minus, minus, rtol=1e-9)
+    np.testing.assert_allclose(adx, expected, rtol=1e-9)
+
+
+def test_psar_matches_loop(bars):
+    series = BarSeries(bars)
+    ta.psar(series)
+    bulls, bears = loop_psar(bars)
+    np.testing.assert_allclose(series.extra('psar_bull')[2:], bulls, rtol=1e-12)
+    np.testing.assert_allclose(series.extra('psar_bear')[2:], bears, rtol=1e-12)
+
+
+def test_psar_sides_read_like_the_price_dicts(bars):
+    series = BarSeries(bars)
+    as_list = [dict(b) for b in bars]
+    ta.psar(series)
+    ta.psar(as_list)
+    strategy = obv_psar()
+    for i in range(2, len(bars)):
+        for side in ('psar_bull', 'psar_bear'):
+            assert isinstance(series[i].get(side), Number) == isinstance(as_list[i][side], Number)
+        assert strategy.psar_flip(series[i], series[i - 1]) == strategy.psar_flip(as_list[i], as_list[i - 1])
+        assert strategy.is_psar_type('psar_bull', series[i]) == strategy.is_psar_type('psar_bull', as_list[i])
+
+
+def test_list_input_gets_the_same_values(bars):
+    as_list = [dict(b) for b in bars]
+    series = BarSeries(bars)
+    ta.rsi(14, prices=as_list)
+    ta.rsi(14, prices=series)
+    np.testing.assert_allclose([b['rsi_14'] for b in as_list[14:]], series.extra('rsi_14')[14:], rtol=1e-12)
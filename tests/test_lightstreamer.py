@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+from auto_ig.lightstreamer import LSClient, Subscription
+from fake_lightstreamer import FakeLightstreamer
+
+
+def wait_until(check, timeout=5):
+    """poll check until it's true, fails the test if it isn't by timeout"""
+    stop = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() > stop:
+            pytest.fail("timed out waiting on the client")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def server():
+    server = FakeLightstreamer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(server):
+    client = LSClient(server.url, "DEMO")
+    client.connect()
+    yield client
+    client.disconnect()
+
+
+def subscription(*items):
+    sub = Subscription("MERGE", list(items), ["BID", "OFFER"], parsers={"BID": float, "OFFER": float})
+    sub.updates = []
+    sub.addlistener(lambda info: sub.updates.append((info['name'], dict(info['values']))))
+    return sub
+
+
+def test_updates_decode_across_chunks(server, client):
+    sub = subscription("MARKET:A", "MARKET:B")
+    key = client.subscribe(sub)
+    server.send("{},2|1.5|1.75".format(key))
+    server.send("{},2||#".format(key))
+    wait_until(lambda: len(sub.updates) == 2)
+    assert sub.updates[0] == ("MARKET:B", {"BID": 1.5, "OFFER": 1.75})
+    assert sub.updates[1] == ("MARKET:B", {"BID": 1.5, "OFFER": None})
+
+
+def test_loop_rebinds_to_the_same_session(server, client):
+    sub = subscription("MARKET:A")
+    key = client.subscribe(sub)
+    server.send("LOOP")
+    wait_until(lambda: server.binds == ["S1"])
+    server.send("{},1|2|3".format(key))
+    wait_until(lambda: len(sub.updates) == 1)
+    assert server.sessions == ["S1"]
+    assert client.connected
+    assert sub.updates[0] == ("MARKET:A", {"BID": 2.0, "OFFER": 3.0})
+
+
+def test_sync_error_resubscribes_everything_on_a_new_session(server, client):
+    subs = [subscription("MARKET:A"), subscription("MARKET:B", "MARKET:C"), subscription("MARKET:D")]
+    keys = client.subscribe_all(subs)
+    server.send("SYNC ERROR")
+    wait_until(lambda: len(server.tables.get("S2", {})) == len(keys))
+    assert server.sessions == ["S1", "S2"]
+    assert server.binds == []
+    for key, sub in zip(keys, subs):
+        assert server.tables["S2"][key]["LS_id"] == " ".join(sub.item_names)
+    server.send("{},2|4|5".format(keys[1]))
+    wait_until(lambda: len(subs[1].updates) == 1)
+    assert subs[1].updates[0] == ("MARKET:C", {"BID": 4.0, "OFFER": 5.0})
+
+
+def test_control_requests_are_pipelined(server, client):
+    server.control_batch = 3
+    keys = client.subscribe_all([subscription("MARKET:A"), subscription("MARKET:B"), subscription("MARKET:C")])
+    assert server.batches == [3]
+    assert sorted(server.tables["S1"]) == keys
+
+
+def test_failed_unsubscribe_keeps_the_stream(server, client):
+    first, second = subscription("MARKET:A"), subscription("MARKET:B")
+    keys = client.subscribe_all([first, second])
+    server.refuse_delete.add(keys[0])
+    client.unsubscribe(keys[0])
+    assert server.requests[-1]["LS_op"] == "delete"
+    assert keys[0] not in client._subscriptions
+    assert client.connected
+    server.send("{},1|6|7".format(keys[0]))
+    server.send("{},1|8|9".format(keys[1]))
+    wait_until(lambda: len(second.updates) == 1)
+    assert first.updates == []
+    assert second.updates[0] == ("MARKET:B", {"BID": 8.0, "OFFER": 9.0})
@@ -0,0 +1,27 @@
+import pytest
+
+from auto_ig.ratelimit import RateLimiter
+
+
+def test_a_reserve_that_leaves_backfill_nothing_is_refused():
+    with pytest.raises(ValueError):
+        RateLimiter(account=5, backfill_reserve=5)
+    limiter = RateLimiter()
+    for limits in ({"account": 5}, {"app": 3}, {"backfill_reserve": 30}, {"backfill_reserve": -1}, {"trading": 0}):
+        with pytest.raises(ValueError):
+            limiter.configure(**limits)
+    # and none of it was applied
+    assert limiter.backfill_reserve == 5
+    assert limiter.buckets['account'].capacity == 30
+    assert limiter.buckets['app'].capacity == 60
+    assert limiter.buckets['trading'].capacity == 100
+
+
+def test_backfill_gets_a_token_with_the_reserve_just_below_capacity():
+    limiter = RateLimiter()
+    limiter.configure(account=6, app=6, backfill_reserve=5)
+    assert limiter.backfill_capacity() == 1
+    limiter.acquire('backfill')
+    assert limiter.backfill_capacity() == 0
+    limiter.acquire('general')
+    assert limiter.stats()['account'] == pytest.approx(4, abs=0.1)
@@ -0,0 +1,69 @@
+import pickle
+import random
+
+from auto_ig.strategy.base import Sig, SignalStore
+
+
+class FakeMarket:
+    def __init__(self, epic):
+        self.epic = epic
+
+
+def sig(epic, name, timestamp, resolution="MINUTE_30"):
+    return Sig(FakeMarket(epic), name, timestamp, "BUY", 4, resolution)
+
+
+def test_one_signal_per_key():
+    store = SignalStore()
+    first = sig("A", "cross", "2020:01:01-10:00:00")
+    second = sig("A", "cross", "2020:01:01-10:30:00")
+    other = sig("B", "cross", "2020:01:01-10:00:00")
+    assert store.add(first) is None
+    store.add(other)
+    assert store.add(second) is first
+    assert first not in store
+    assert store.get("A", "MINUTE_30", "cross") is second
+    assert store.for_epic("A") == [second]
+    assert store.for_series("B", "MINUTE_30") == [other]
+    store.remove(second)
+    assert store.for_epic("A") == []
+    assert len(store) == 1
+
+
+def test_newest_first_with_ties_in_the_order_added():
+    store = SignalStore()
+    a = sig("A", "one", "2020:01:01-10:00:00")
+    b = sig("B", "one", "2020:01:01-11:00:00")
+    c = sig("C", "one", "2020:01:01-10:00:00")
+    for s in (a, b, c):
+        store.add(s)
+    assert store.newest() == [b, c, a]
+
+
+def test_pickles_without_its_lock():
+    store = SignalStore()
+    store.add(sig("A", "one", "2020:01:01-10:00:00"))
+    copy = pickle.loads(pickle.dumps(store))
+    assert [s.name for s in copy] == ["one"]
+    copy.add(sig("A", "two", "2020:01:01-11:00:00"))
+    assert [s.name for s in copy.newest()] == ["two", "one"]
+
+
+def test_newest_keeps_up_with_adds_replaces_and_removes():
+    store = SignalStore()
+    rng = random.Random(3)
+    added = {}
+    for step in range(2000):
+        epic = rng.choice("ABCDEFGH")
+        name = rng.choice(["one", "two", "three"])
+        live = store.get(epic, "MINUTE_30", name)
+        if live is not None and rng.random() < 0.4:
+            store.remove(live)
+            continue
+        s = sig(epic, name, "2020:01:01-{:02d}:{:02d}:00".format(rng.randrange(24), rng.choice([0, 30])))
+        store.add(s)
+        added[id(s)] = step
+    expected = sorted(store, key=lambda s: (s.timestamp, added[id(s)]), reverse=True)
+    assert store.newest() == expected
+    # the emptied timestamps don't pile up
+    assert len(store.timeline) <= 2 * len(set(s.timestamp for s in store))
@@ -0,0 +1,150 @@
+import os
+
+import numpy as np
+import pytest
+
+from auto_ig import store as price_store
+from auto_ig.backtest import market_details
+from auto_ig.bars import BarSeries
+from auto_ig.market import Market
+from auto_ig.store import HEADER, RECORD, PriceStore
+
+EPIC = "CS.D.TEST.TODAY.IP"
+
+
+def records(store, resolution="MINUTE_5"):
+    """how many records the file holds, repeats and all"""
+    return (os.path.getsize(store._path(EPIC, resolution)) - HEADER.itemsize) // RECORD.itemsize
+
+
+def assert_holds(store, series, resolution="MINUTE_5", mapped=False):
+    times, values = store.read(EPIC, resolution, mapped=mapped)
+    expected_times, expected_values = series.fields()
+    np.testing.assert_array_equal(times, expected_times)
+    np.testing.assert_array_equal(values, expected_values)
+
+
+def save(store, series, resolution="MINUTE_5"):
+    """what Market.save_prices does"""
+    start = series.pop_changes()
+    if start is not None:
+        store.append(EPIC, resolution, series, start)
+
+
+def test_appends_only_the_new_bars(tmp_path, bars):
+    store = PriceStore(str(tmp_path))
+    series = BarSeries(bars[:50])
+    save(store, series)
+    assert records(store) == 50
+    for bar in bars[50:60]:
+        series.append(bar)
+    save(store, series)
+    assert records(store) == 60
+    assert_holds(store, series)
+    assert store.resolutions(EPIC) == ["MINUTE_5"]
+
+
+def test_newest_copy_of_a_bar_wins(tmp_path, bars):
+    store = PriceStore(str(tmp_path))
+    series = BarSeries(bars[:50])
+    save(store, series)
+    # the live bar revised twice, then an older bar refetched with new prices
+    for bid in (1.0, 2.0):
+        series.upsert(dict(bars[49], closePrice=dict(bars[49]['closePrice'], bid=bid)))
+        save(store, series)
+    series.upsert(dict(bars[40], highPrice=dict(bars[40]['highPrice'], ask=500.0)))
+    save(store, series)
+    assert records(store) == 50 + 1 + 1 + 10
+    assert_holds(store, series)
+    times, values = store.read(EPIC, "MINUTE_5")
+    assert np.all(np.diff(times) > 0)
+
+
+def test_compacts_once_the_file_outgrows_the_series(tmp_path, bars, monkeypatch):
+    monkeypatch.setattr(price_store, "COMPACT_MIN", 8)
+    store = PriceStore(str(tmp_path))
+    series = BarSeries(bars[:5])
+    save(store, series)
+    counts = []
+    for i in range(20):
+        series.upsert(dict(bars[4], closePrice=dict(bars[4]['closePrice'], bid=float(i))))
+        save(store, series)
+        counts.append(records(store))
+    # rewritten down to the 5 bars as soon as it held more than COMPACT_RATIO times them
+    assert counts == list(range(6, 21)) + [5, 6, 7, 8, 9]
+    assert_holds(store, series)
+
+
+def test_mapped_reads_views_of_a_compacted_file(tmp_path, bars):
+    store = PriceStore(str(tmp_path))
+    series = BarSeries(bars[:50])
+    store.compact(EPIC, "MINUTE_5", series)
+    times, values = store.read(EPIC, "MINUTE_5", mapped=True)
+    assert isinstance(values, np.memmap)
+    assert not values.flags.writeable
+    assert_holds(store, series, mapped=True)
+
+    # with repeats it's read into a private, deduplicated copy
+    series.upsert(dict(bars[49], closePrice=dict(bars[49]['closePrice'], bid=1.0)))
+    store.append(EPIC, "MINUTE_5", series, 49)
+    times, values = store.read(EPIC, "MINUTE_5", mapped=True)
+    assert not isinstance(values, np.memmap)
+    assert values.flags.writeable
+    assert_holds(store, series, mapped=True)
+
+
+def test_rejects_a_file_from_another_format(tmp_path, bars):
+    store = PriceStore(str(tmp_path))
+    store.compact(EPIC, "MINUTE_5", BarSeries(bars[:5]))
+    with open(store._path(EPIC, "MINUTE_5"), "r+b") as fh:
+        fh.write(b"NOTBARS")
+    with pytest.raises(ValueError):
+        store.read(EPIC, "MINUTE_5")
+
+
+def test_json_round_trip(tmp_path, bars):
+    store = PriceStore(str(tmp_path))
+    prices = {"MINUTE_5": BarSeries(bars[:40]), "HOUR": BarSeries(bars[40:60])}
+    path = str(tmp_path / "old.json")
+    store.export_json(EPIC, prices, path)
+    imported = store.import_json(EPIC, path)
+    assert sorted(imported) == ["HOUR", "MINUTE_5"]
+    for res, series in prices.items():
+        assert imported[res].to_list() == series.to_list()
+        assert_holds(store, series, res)
+
+    # and back out from what's stored
+    store.export_json(EPIC, path=str(tmp_path / "again.json"))
+    again = store.import_json(EPIC, str(tmp_path / "again.json"))
+    for res, series in prices.items():
+        assert again[res].to_list() == series.to_list()
+
+
+def test_remove(tmp_path, bars):
+    store = PriceStore(str(tmp_path))
+    for res in ("MINUTE_5", "HOUR"):
+        store.compact(EPIC, res, BarSeries(bars[:5]))
+    store.remove(EPIC, "HOUR")
+    assert store.resolutions(EPIC) == ["MINUTE_5"]
+    store.remove(EPIC)
+    assert store.resolutions(EPIC) == []
+    assert store.load(EPIC) == {}
+
+
+def test_a_market_that_stops_trading_drops_its_files(tmp_path, bars, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    market = Market(EPIC, None, market_details(EPIC))
+    market.store = PriceStore(str(tmp_path / "prices"))
+    market.prices["MINUTE_5"] = BarSeries(bars[:20])
+    market.aggregators["HOUR"] = object()
+    market.save_prices()
+    assert market.store.resolutions(EPIC) == ["MINUTE_5"]
+
+    closed = market_details(EPIC)
+    closed["snapshot"]["marketStatus"] = "CLOSED"
+    market.update_market(closed)
+    assert market.prices == {}
+    assert market.aggregators == {}
+    assert market.store.resolutions(EPIC) == []
+    market.load_prices()
+    assert market.prices == {}
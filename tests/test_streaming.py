@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from auto_ig import indicators as ta
+from auto_ig.bars import BarSeries
+from auto_ig.streaming import IndicatorEngine
+
+
+def run(bars, *calls):
+    """feed bars in one at a time, making every call on each, returns the last results"""
+    series = BarSeries()
+    ind = IndicatorEngine().bind('MINUTE_5', series)
+    results = None
+    for bar in bars:
+        series.append(bar)
+        results = [getattr(ind, name)(*params) for name, params in calls]
+    return results
+
+
+def assert_same(got, expected):
+    for g, e in zip(got, expected):
+        np.testing.assert_allclose(g, e, rtol=1e-9, equal_nan=True)
+
+
+def batch_psar(prices):
+    psar = ta.psar(prices)
+    return np.array(psar['psar'], dtype=float), prices.extra('psar_bull'), prices.extra('psar_bear')
+
+
+# the stream call and the batch function it has to match
+BATCH = [
+    ('ema', (10,), lambda p: ta.ema(10, prices=p)),
+    ('rma', (14,), lambda p: ta.rma(14, prices=p)),
+    ('ma', (20,), lambda p: ta.ma(20, prices=p)),
+    ('wma', (9,), lambda p: ta.wma(9, prices=p)),
+    ('atr', (14,), lambda p: ta.atr(14, p)),
+    ('macd', (12, 26, 9), lambda p: ta.macd(p, 12, 26, 9)),
+    ('rsi', (14,), lambda p: ta.rsi(14, prices=p)),
+    ('stochastic', (5, 3, 3), lambda p: ta.stochastic(p, 5, 3, 3)),
+    ('mfi', (14,), lambda p: ta.mfi(p, 14)),
+    ('obv', (10,), lambda p: ta.obv(p, 10)),
+    ('vwma', (20,), lambda p: ta.vwma(20, p)),
+    ('bollinger_bands', (20, 2), lambda p: ta.bollinger_bands(20, 2, prices=p)),
+    ('psar', (0.02, 0.2), batch_psar),
+]
+
+
+@pytest.mark.parametrize('name, params, batch', BATCH, ids=[b[0] for b in BATCH])
+def test_streams_match_the_batch_functions(bars, name, params, batch):
+    got, = run(bars, (name, params))
+    expected = batch(BarSeries(bars))
+    if not isinstance(got, tuple):
+        got, expected = (got,), (expected,)
+    assert len(got) == len(expected)
+    # the batch functions leave out (or zero) the warmup, so compare the settled tail
+    assert_same([g[-300:] for g in got], [np.asarray(e)[-300:] for e in expected])
+
+
+def test_parameter_sets_on_one_series_dont_share_columns(bars):
+    calls = [('macd', (12, 26, 9)), ('macd', (5, 35, 5)),
+             ('bollinger_bands', (20, 2)), ('bollinger_bands', (20, 2.5)),
+             ('psar', (0.02, 0.2)), ('psar', (0.03, 0.2)),
+             ('atr', (5,)), ('atr', (14,))]
+    together = run(bars[:200], *calls)
+    for call, got in zip(calls, together):
+        alone, = run(bars[:200], call)
+        assert_same(got, alone)
+
+
+def test_unchanged_refetch_keeps_the_stream_going(bars):
+    series = BarSeries(bars[:100])
+    engine = IndicatorEngine()
+    engine.bind('MINUTE_5', series).ema(10)
+    stream, = engine.streams.values()
+    indicator = stream.indicator
+    revision = series.revision
+
+    # a REST refresh overlapping bars we already hold
+    for bar in bars[90:101]:
+        series.upsert(bar)
+    engine.bind('MINUTE_5', series).ema(10)
+    assert series.revision == revision
+    assert stream.indicator is indicator
+
+    changed = dict(bars[95], closePrice=dict(bars[95]['closePrice'], bid=1.0))
+    series.upsert(changed)
+    assert series.revision != revision
@@ -0,0 +1,54 @@
+import math
+
+import numpy as np
+
+from auto_ig.bars import BarSeries
+from auto_ig.store import PriceStore
+from auto_ig.strategy.stoch_alt import stoch_alt
+from auto_ig.sweep import METRICS, Sweep
+
+EPIC = "CS.D.TEST.TODAY.IP"
+
+
+def test_grid_run_writes_a_column_per_param_and_metric(tmp_path, bars):
+    PriceStore(str(tmp_path / "history")).compact(EPIC, "MINUTE_5", BarSeries(bars))
+    path = str(tmp_path / "sweeps" / "stoch_alt.npz")
+    sweep = Sweep(stoch_alt, {"atr_length": [7, 14], "stop_atr": [1, 2]}, [EPIC], processes=1,
+                  history=str(tmp_path / "history"))
+    columns = sweep.run(path)
+
+    assert sorted(columns) == sorted(["atr_length", "stop_atr"] + METRICS)
+    assert [(p["atr_length"], p["stop_atr"]) for p in sweep.combinations()] == [(7, 1), (7, 2), (14, 1), (14, 2)]
+    assert columns["atr_length"].tolist() == [7, 7, 14, 14]
+    assert columns["stop_atr"].tolist() == [1, 2, 1, 2]
+    for metric in METRICS:
+        assert columns[metric].shape == (4,)
+    assert np.array_equal(columns["trades"], columns["wins"] + columns["losses"])
+    # nothing trades on these bars, and no trades has no win rate, it's stored as NaN
+    assert not columns["trades"].any()
+    assert np.isnan(columns["win_rate"]).all()
+
+    saved = np.load(path)
+    assert sorted(saved.files) == sorted(columns)
+    for name in columns:
+        np.testing.assert_array_equal(saved[name], columns[name])
+
+
+def test_samples_are_a_seeded_subset_of_the_grid():
+    grid = {"atr_length": [7, 10, 14], "stop_atr": [1, 2, 3]}
+    picked = Sweep(stoch_alt, grid, [EPIC], samples=4, seed=1).combinations()
+    assert len(picked) == 4
+    assert picked == Sweep(stoch_alt, grid, [EPIC], samples=4, seed=1).combinations()
+    assert all(p in Sweep(stoch_alt, grid, [EPIC]).combinations() for p in picked)
+
+
+def test_best_orders_by_the_metric_with_nan_last():
+    columns = {"atr_length": np.array([7, 10, 14, 21]),
+               "pnl": np.array([5.0, -2.0, 12.5, 0.0]),
+               "win_rate": np.array([0.5, np.nan, 0.25, 0.75])}
+    assert [r["atr_length"] for r in Sweep.best(columns)] == [14, 7, 21, 10]
+    by_win_rate = Sweep.best(columns, metric="win_rate", count=4)
+    assert [r["atr_length"] for r in by_win_rate] == [21, 7, 14, 10]
+    assert math.isnan(by_win_rate[-1]["win_rate"])
+    assert [r["atr_length"] for r in Sweep.best(columns, count=2)] == [14, 7]
+    assert isinstance(by_win_rate[0]["atr_length"], int)